@@ -0,0 +1,311 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+import openai
+from openai import AsyncOpenAI
+
+# HTTP status codes worth retrying on the same model
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+class ProviderUnavailableError(Exception):
+    """Raised when no model could answer within the retry budget and deadline."""
+
+class CircuitBreaker:
+    """Stops sending requests to a failing target for a cooldown period.
+    
+    Closed: requests flow normally. After `failure_threshold` consecutive
+    failures the breaker opens and rejects requests until `reset_timeout`
+    seconds have passed. It then lets a single trial request through
+    (half-open); success closes it again, failure re-opens it.
+    """
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.trips = 0
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+    
+    def allow_request(self) -> bool:
+        """Check whether a request may be sent."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+    
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+    
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_in_flight or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self.trial_in_flight:
+                self.trips += 1
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+    
+    def release_trial(self):
+        """Give back a half-open trial without an outcome, so another request can take it."""
+        self.trial_in_flight = False
+
+def parse_retry_after(error: Exception) -> Optional[float]:
+    """Read the server's requested delay (in seconds) from an API error, if any."""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    
+    headers = response.headers
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    
+    retry_after = headers.get('retry-after')
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def parse_fallback_models(value: str, default_base_url: Optional[str]) -> List[Tuple[str, Optional[str]]]:
+    """Parse AI_FALLBACK_MODELS: comma-separated `model` or `model@base_url` entries."""
+    models = []
+    for entry in (value or '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        model, _, base_url = entry.partition('@')
+        models.append((model.strip(), base_url.strip() or default_base_url))
+    return models
+
+class ResilientChatClient:
+    """Chat completion client with retries, deadlines, circuit breakers and fallback models.
+    
+    Each request tries the requested model (or the primary one), then the
+    primary model, then every fallback model in order.
+    Transient errors (429, 5xx, timeouts, connection errors) are retried with
+    jittered exponential backoff, honouring Retry-After. Endpoint breakers
+    (one per base URL) trip on connection failures; model breakers trip on
+    timeouts and errors returned for a model, so a degraded model is skipped
+    while the endpoint keeps serving the fallbacks.
+    """
+    
+    def __init__(self, api_key: str, base_url: Optional[str] = None, model: Optional[str] = None,
+                 fallback_models: List[Tuple[str, Optional[str]]] = None, max_retries: int = 3,
+                 request_timeout: float = 30.0, total_timeout: float = 90.0,
+                 base_delay: float = 0.5, max_delay: float = 20.0,
+                 breaker_threshold: int = 5, breaker_cooldown: float = 30.0):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.fallback_models = fallback_models or []
+        self.max_retries = max_retries
+        self.request_timeout = request_timeout
+        self.total_timeout = total_timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        
+        self.clients: Dict[Optional[str], AsyncOpenAI] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.stats = {
+            'requests': 0,
+            'attempts': 0,
+            'retries': 0,
+            'fallbacks': 0,
+            'failures': 0
+        }
+    
+    def get_client(self, base_url: Optional[str]) -> AsyncOpenAI:
+        """Get (or create) the OpenAI client for an endpoint. Retries are handled here, not by the SDK."""
+        if base_url not in self.clients:
+            if base_url:
+                self.clients[base_url] = AsyncOpenAI(api_key=self.api_key, base_url=base_url, max_retries=0)
+            else:
+                self.clients[base_url] = AsyncOpenAI(api_key=self.api_key, max_retries=0)
+        return self.clients[base_url]
+    
+    def get_breaker(self, key: str) -> CircuitBreaker:
+        if key not in self.breakers:
+            self.breakers[key] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+        return self.breakers[key]
+    
+    def endpoint_breaker(self, base_url: Optional[str]) -> CircuitBreaker:
+        return self.get_breaker(base_url or 'default')
+    
+    def model_breaker(self, base_url: Optional[str], model: str) -> CircuitBreaker:
+        return self.get_breaker(f"{base_url or 'default'}|{model}")
+    
+    def backoff_delay(self, attempt: int, error: Exception) -> float:
+        """Delay before the next attempt: Retry-After if given, else full-jitter exponential backoff."""
+        retry_after = parse_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+    
+    async def create(self, messages: List[Dict], model: Optional[str] = None, **kwargs):
+        """Create a chat completion, falling back to other models if needed.
+        
+        `kwargs` are passed to `chat.completions.create` unchanged. Raises
+        ProviderUnavailableError when every candidate failed or the total
+        deadline passed; non-transient errors such as 400 or 401 are raised
+        immediately.
+        """
+        self.stats['requests'] += 1
+        deadline = time.monotonic() + self.total_timeout
+        
+        candidates = [(model or self.model, self.base_url)]
+        if model and self.model and model != self.model:
+            # A per-request model (routing, guild setting) falls back to the default first
+            candidates.append((self.model, self.base_url))
+        candidates += [c for c in self.fallback_models if c not in candidates]
+        
+        last_error = None
+        for index, (candidate_model, base_url) in enumerate(candidates):
+            if time.monotonic() >= deadline:
+                break
+            
+            endpoint_breaker = self.endpoint_breaker(base_url)
+            model_breaker = self.model_breaker(base_url, candidate_model)
+            
+            # allow_request() only sets trial_in_flight when it hands this
+            # request the half-open trial, so these are the trials we own
+            if not endpoint_breaker.allow_request():
+                continue
+            trials = {endpoint_breaker} if endpoint_breaker.trial_in_flight else set()
+            if not model_breaker.allow_request():
+                for breaker in trials:
+                    breaker.release_trial()
+                continue
+            if model_breaker.trial_in_flight:
+                trials.add(model_breaker)
+            
+            if index > 0:
+                self.stats['fallbacks'] += 1
+                print(f"AI client: falling back to model {candidate_model}")
+            
+            try:
+                return await self.create_with_retries(
+                    candidate_model, base_url, messages, deadline,
+                    endpoint_breaker, model_breaker, trials, **kwargs
+                )
+            except ProviderUnavailableError as e:
+                last_error = e.__cause__ or e
+            finally:
+                # Trials without an outcome (non-retryable errors, cancellation,
+                # or a failure blamed on the other breaker) are handed back
+                for breaker in trials:
+                    breaker.release_trial()
+        
+        self.stats['failures'] += 1
+        raise ProviderUnavailableError(
+            f"No AI model available (tried {', '.join(m for m, _ in candidates)})"
+        ) from last_error
+    
+    async def create_with_retries(self, model: str, base_url: Optional[str], messages: List[Dict],
+                                  deadline: float, endpoint_breaker: CircuitBreaker,
+                                  model_breaker: CircuitBreaker, trials: Set[CircuitBreaker], **kwargs):
+        """Call one model, retrying transient errors until the retry budget or deadline runs out.
+        
+        `trials` holds the breakers whose half-open trial this request owns;
+        a breaker is removed once an outcome is recorded on it.
+        """
+        client = self.get_client(base_url)
+        
+        def success(breaker: CircuitBreaker):
+            breaker.record_success()
+            trials.discard(breaker)
+        
+        def failure(breaker: CircuitBreaker):
+            breaker.record_failure()
+            trials.discard(breaker)
+        
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ProviderUnavailableError(f"Deadline exceeded for model {model}")
+            
+            self.stats['attempts'] += 1
+            try:
+                response = await asyncio.wait_for(
+                    client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        timeout=min(self.request_timeout, remaining),
+                        **kwargs
+                    ),
+                    timeout=min(self.request_timeout, remaining)
+                )
+                success(endpoint_breaker)
+                success(model_breaker)
+                return response
+            
+            except (asyncio.TimeoutError, openai.APITimeoutError) as e:
+                # The model is too slow; other models on the endpoint may be fine
+                failure(model_breaker)
+                error = e
+            
+            except openai.APIConnectionError as e:
+                # The endpoint itself is unreachable
+                failure(endpoint_breaker)
+                error = e
+            
+            except openai.NotFoundError as e:
+                # Unknown model: no point retrying it, try the next one
+                failure(model_breaker)
+                success(endpoint_breaker)
+                raise ProviderUnavailableError(f"Model {model} not found") from e
+            
+            except openai.APIStatusError as e:
+                if e.status_code not in RETRYABLE_STATUS_CODES:
+                    # The endpoint answered; the request itself is at fault
+                    success(endpoint_breaker)
+                    raise
+                failure(model_breaker)
+                success(endpoint_breaker)
+                error = e
+            
+            if attempt >= self.max_retries or model_breaker.state != "closed" or endpoint_breaker.state != "closed":
+                break
+            
+            delay = self.backoff_delay(attempt, error)
+            if time.monotonic() + delay >= deadline:
+                break
+            
+            self.stats['retries'] += 1
+            print(f"AI client: {type(error).__name__} from {model}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        
+        raise ProviderUnavailableError(f"Model {model} unavailable") from error
+    
+    def get_stats(self) -> Dict:
+        """Get request counters and the state of every circuit breaker."""
+        return {
+            **self.stats,
+            'breakers': {key: breaker.state for key, breaker in self.breakers.items()}
+        }
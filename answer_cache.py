@@ -0,0 +1,182 @@
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Hashable, NamedTuple, Optional, Set
+
+# Too short to be a real question ("hi", "thanks")
+MIN_QUESTION_LENGTH = 10
+
+# Stands in for the asker's name in stored answers
+NAME_PLACEHOLDER = '\x00name\x00'
+
+MENTION_PATTERN = re.compile(r'<[@#][!&]?\d+>')
+PUNCTUATION_PATTERN = re.compile(r'[^\w\s]')
+
+def normalize_question(text: str) -> str:
+    """Reduce a question to its cache key: lower case, no mentions, punctuation or extra whitespace."""
+    text = MENTION_PATTERN.sub(' ', text.casefold())
+    return ' '.join(PUNCTUATION_PATTERN.sub(' ', text).split())
+
+def shingles(question: str) -> FrozenSet[str]:
+    """Character trigrams of a normalized question, for near-duplicate matching."""
+    padded = f" {question} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+class CachedAnswer(NamedTuple):
+    """A stored reply and what it cost to produce."""
+    answer: str
+    created: float
+    shingles: FrozenSet[str]
+    prompt_tokens: int
+    completion_tokens: int
+    latency_ms: float
+
+class GuildAnswers:
+    """One guild's cached answers, their similarity index and hit statistics."""
+    
+    __slots__ = ('version', 'entries', 'index', 'stats')
+    
+    def __init__(self, version: Hashable):
+        self.version = version
+        self.entries: "OrderedDict[str, CachedAnswer]" = OrderedDict()
+        # Trigram -> questions containing it
+        self.index: Dict[str, Set[str]] = {}
+        self.stats = {
+            'hits': 0,
+            'near_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'saved_tokens': 0,
+            'saved_ms': 0.0
+        }
+    
+    def remove(self, question: str):
+        entry = self.entries.pop(question)
+        for shingle in entry.shingles:
+            questions = self.index[shingle]
+            questions.discard(question)
+            if not questions:
+                del self.index[shingle]
+    
+    def clear(self):
+        self.entries.clear()
+        self.index.clear()
+
+class AnswerCache:
+    """Per-guild cache of answers to repeated questions.
+    
+    Questions are keyed by their normalized text. With a similarity
+    threshold above 0, a question with no exact match is compared with the
+    cached ones through an inverted index of character trigrams, and the
+    most similar answer is used if its Jaccard similarity reaches the
+    threshold. Entries expire after `ttl` seconds and each guild keeps at
+    most `max_entries`, evicting the least recently used.
+    
+    Every call passes the guild's current version (settings version and
+    system prompt); when it changes, the guild's entries are dropped.
+    """
+    
+    def __init__(self, ttl: float = 3600, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.guilds: Dict[str, GuildAnswers] = {}
+    
+    def get_guild(self, guild_id: str, version: Hashable) -> GuildAnswers:
+        guild = self.guilds.get(guild_id)
+        if guild is None:
+            guild = self.guilds[guild_id] = GuildAnswers(version)
+        elif guild.version != version:
+            if guild.entries:
+                guild.stats['invalidations'] += 1
+            guild.clear()
+            guild.version = version
+        return guild
+    
+    def get(self, guild_id: str, question: str, version: Hashable, similarity: float = 0.0,
+            now: float = None) -> Optional[CachedAnswer]:
+        """Look up a normalized question; returns the cached answer or None."""
+        now = time.monotonic() if now is None else now
+        guild = self.get_guild(guild_id, version)
+        
+        entry = guild.entries.get(question)
+        if entry is not None and now - entry.created < self.ttl:
+            guild.entries.move_to_end(question)
+            self.record_hit(guild, entry, 'hits')
+            return entry
+        if entry is not None:
+            guild.remove(question)
+        
+        if similarity > 0:
+            match = self.find_similar(guild, question, similarity, now)
+            if match is not None:
+                guild.entries.move_to_end(match)
+                entry = guild.entries[match]
+                self.record_hit(guild, entry, 'near_hits')
+                return entry
+        
+        guild.stats['misses'] += 1
+        return None
+    
+    def find_similar(self, guild: GuildAnswers, question: str, threshold: float, now: float) -> Optional[str]:
+        """The cached question most similar to `question`, if it reaches `threshold`."""
+        query = shingles(question)
+        overlaps: Dict[str, int] = {}
+        for shingle in query:
+            for candidate in guild.index.get(shingle, ()):
+                overlaps[candidate] = overlaps.get(candidate, 0) + 1
+        
+        best, best_score = None, threshold
+        for candidate, overlap in overlaps.items():
+            entry = guild.entries[candidate]
+            score = overlap / (len(query) + len(entry.shingles) - overlap)
+            if score >= best_score and now - entry.created < self.ttl:
+                best, best_score = candidate, score
+        return best
+    
+    def record_hit(self, guild: GuildAnswers, entry: CachedAnswer, kind: str):
+        guild.stats[kind] += 1
+        guild.stats['saved_tokens'] += entry.prompt_tokens + entry.completion_tokens
+        guild.stats['saved_ms'] += entry.latency_ms
+    
+    def put(self, guild_id: str, question: str, version: Hashable, answer: str,
+            prompt_tokens: int, completion_tokens: int, latency_ms: float, now: float = None):
+        """Store the answer to a normalized question."""
+        now = time.monotonic() if now is None else now
+        guild = self.get_guild(guild_id, version)
+        
+        if question in guild.entries:
+            guild.remove(question)
+        
+        entry = CachedAnswer(answer, now, shingles(question), prompt_tokens, completion_tokens, latency_ms)
+        guild.entries[question] = entry
+        for shingle in entry.shingles:
+            guild.index.setdefault(shingle, set()).add(question)
+        guild.stats['stores'] += 1
+        
+        while len(guild.entries) > self.max_entries:
+            guild.remove(next(iter(guild.entries)))
+            guild.stats['evictions'] += 1
+    
+    def clear(self):
+        """Drop every guild's answers, keeping their statistics."""
+        for guild in self.guilds.values():
+            if guild.entries:
+                guild.stats['invalidations'] += 1
+            guild.clear()
+    
+    def get_stats(self, guild_id: str) -> Optional[Dict]:
+        """Hit rate and savings of a guild, or None if it never used the cache."""
+        guild = self.guilds.get(guild_id)
+        if guild is None:
+            return None
+        
+        stats = guild.stats
+        hits = stats['hits'] + stats['near_hits']
+        lookups = hits + stats['misses']
+        return {
+            **stats,
+            'entries': len(guild.entries),
+            'hit_rate': round(hits / lookups * 100, 2) if lookups else 0.0
+        }
@@ -0,0 +1,278 @@
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+SNAPSHOT_PREFIX = 'nebula-'
+
+# Length of the timestamp after the prefix (YYYYmmdd-HHMMSS); a label follows it
+TIMESTAMP_LENGTH = 15
+
+def latency_summary(samples: List[float]) -> Dict:
+    """Median, 99th percentile and maximum of latency samples in ms."""
+    if not samples:
+        return {'samples': 0, 'p50_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+    ordered = sorted(samples)
+    return {
+        'samples': len(ordered),
+        'p50_ms': ordered[len(ordered) // 2],
+        'p99_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+        'max_ms': ordered[-1]
+    }
+
+class WriteProbe:
+    """Times a one-row write transaction on a database at a fixed interval.
+    
+    The probe commits to its own `backup_write_probe` table, so it pays
+    the same lock and WAL costs as the bot's writes without touching their
+    data. measure() takes a baseline; start() and stop() sample from a
+    background thread while a backup runs; drop() removes the table again.
+    Only benchmarks and `!backup_now --probe` use it.
+    """
+    
+    def __init__(self, db_path: str, interval: float = 0.05):
+        self.db_path = db_path
+        self.interval = interval
+        self.samples: List[float] = []
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+    
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('CREATE TABLE IF NOT EXISTS backup_write_probe (id INTEGER PRIMARY KEY, written REAL)')
+        conn.commit()
+        return conn
+    
+    def write(self, conn: sqlite3.Connection) -> float:
+        """One timed write transaction, in ms."""
+        started = time.perf_counter()
+        conn.execute('INSERT OR REPLACE INTO backup_write_probe (id, written) VALUES (1, ?)', (time.time(),))
+        conn.commit()
+        return (time.perf_counter() - started) * 1000
+    
+    def measure(self, count: int = 20) -> Dict:
+        """Latency of `count` writes taken back to back."""
+        conn = self.connect()
+        try:
+            return latency_summary([self.write(conn) for _ in range(count)])
+        finally:
+            conn.close()
+    
+    def run(self):
+        conn = self.connect()
+        try:
+            # At least one sample, however quickly the copy finishes
+            while True:
+                self.samples.append(self.write(conn))
+                if self.stop_event.wait(self.interval):
+                    break
+        finally:
+            conn.close()
+    
+    def start(self):
+        self.samples = []
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name='backup-write-probe', daemon=True)
+        self.thread.start()
+    
+    def stop(self) -> Dict:
+        """Stop sampling and summarize the writes taken since start()."""
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        return latency_summary(self.samples)
+    
+    def drop(self):
+        """Remove the probe's table from the database."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute('DROP TABLE IF EXISTS backup_write_probe')
+            conn.commit()
+        finally:
+            conn.close()
+
+def backup_database(source_path: str, dest_path: str, pages_per_step: int = 1024,
+                    step_sleep: float = 0.005) -> Dict:
+    """Copy a live SQLite database with the online backup API.
+    
+    The copy runs in steps of `pages_per_step` pages with a short pause in
+    between, so it does not saturate the disk. The source connection holds
+    one read transaction for the whole copy: in WAL mode writers carry on
+    while the backup reads a consistent snapshot, and their commits do not
+    restart the copy. Blocking; run it in a worker thread.
+    """
+    source = sqlite3.connect(source_path, timeout=30)
+    dest = sqlite3.connect(dest_path)
+    steps = 0
+    
+    def progress(status, remaining, total):
+        nonlocal steps
+        steps += 1
+        if remaining and step_sleep:
+            time.sleep(step_sleep)
+    
+    started = time.perf_counter()
+    try:
+        source.execute('BEGIN')
+        source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        source.backup(dest, pages=pages_per_step, progress=progress)
+        source.rollback()
+        
+        # A backup that cannot be opened is worse than none
+        check = dest.execute('PRAGMA quick_check').fetchone()[0]
+        if check != 'ok':
+            raise sqlite3.DatabaseError(f"Backup of {source_path} failed integrity check: {check}")
+        pages = dest.execute('PRAGMA page_count').fetchone()[0]
+    finally:
+        dest.close()
+        source.close()
+    
+    return {
+        'pages': pages,
+        'steps': steps,
+        'seconds': time.perf_counter() - started,
+        'bytes': os.path.getsize(dest_path)
+    }
+
+def compress_file(path: str) -> str:
+    """Gzip a file in place and return the new path."""
+    compressed_path = f"{path}.gz"
+    with open(path, 'rb') as source, gzip.open(compressed_path, 'wb', compresslevel=6) as dest:
+        shutil.copyfileobj(source, dest, 1024 * 1024)
+    os.remove(path)
+    return compressed_path
+
+def create_snapshot(database_paths: List[str], directory: str, pages_per_step: int = 1024,
+                    step_sleep: float = 0.005, compress: bool = True, label: str = '',
+                    probe_path: str = None) -> Dict:
+    """Back up each database into a new timestamped snapshot directory.
+    
+    With `probe_path`, write latency on that database is sampled before
+    and during the copy and returned as `idle_write_latency` and
+    `write_latency`. The probe writes to a table of its own, which is
+    dropped afterwards.
+    """
+    name = SNAPSHOT_PREFIX + datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    if label:
+        name += f"-{label}"
+    snapshot_dir = os.path.join(directory, name)
+    os.makedirs(snapshot_dir)
+    
+    result = {'name': name, 'seconds': 0.0, 'pages': 0, 'bytes': 0, 'stored_bytes': 0}
+    probe = WriteProbe(probe_path) if probe_path else None
+    if probe:
+        result['idle_write_latency'] = probe.measure()
+        probe.start()
+    try:
+        for database_path in database_paths:
+            if not os.path.exists(database_path):
+                continue
+            dest_path = os.path.join(snapshot_dir, os.path.basename(database_path))
+            stats = backup_database(database_path, dest_path, pages_per_step, step_sleep)
+            if compress:
+                dest_path = compress_file(dest_path)
+            
+            result['seconds'] += stats['seconds']
+            result['pages'] += stats['pages']
+            result['bytes'] += stats['bytes']
+            result['stored_bytes'] += os.path.getsize(dest_path)
+    except Exception:
+        # Never leave a partial snapshot behind for restore to pick up
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        raise
+    finally:
+        if probe:
+            result['write_latency'] = probe.stop()
+            probe.drop()
+    
+    return result
+
+def snapshot_label(name: str) -> str:
+    """The label of a snapshot name ('' for scheduled snapshots)."""
+    return name[len(SNAPSHOT_PREFIX) + TIMESTAMP_LENGTH:].lstrip('-')
+
+def list_snapshots(directory: str) -> List[Dict]:
+    """List snapshots in a directory, newest first."""
+    if not os.path.isdir(directory):
+        return []
+    
+    snapshots = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if not name.startswith(SNAPSHOT_PREFIX) or not os.path.isdir(path):
+            continue
+        files = os.listdir(path)
+        snapshots.append({
+            'name': name,
+            'label': snapshot_label(name),
+            'files': sorted(files),
+            'bytes': sum(os.path.getsize(os.path.join(path, f)) for f in files)
+        })
+    
+    # Names sort by their timestamp
+    snapshots.sort(key=lambda snapshot: snapshot['name'], reverse=True)
+    return snapshots
+
+def prune_snapshots(directory: str, keep: int) -> List[str]:
+    """Delete all but the newest `keep` snapshots of each label. Returns the deleted names.
+    
+    Labels are counted separately, so a burst of pre-restore snapshots
+    never pushes out the scheduled ones.
+    """
+    removed = []
+    kept: Dict[str, int] = {}
+    for snapshot in list_snapshots(directory):
+        label = snapshot['label']
+        if kept.get(label, 0) < keep:
+            kept[label] = kept.get(label, 0) + 1
+            continue
+        shutil.rmtree(os.path.join(directory, snapshot['name']))
+        removed.append(snapshot['name'])
+    return removed
+
+def restore_database(backup_path: str, dest_path: str):
+    """Overwrite a live database with a backup, decompressing it first if needed.
+    
+    The backup API copies into the open database, so connections of the
+    running bot see the restored data on their next query.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if backup_path.endswith('.gz'):
+            plain_path = os.path.join(temp_dir, 'restore.db')
+            with gzip.open(backup_path, 'rb') as source, open(plain_path, 'wb') as dest:
+                shutil.copyfileobj(source, dest, 1024 * 1024)
+            backup_path = plain_path
+        
+        source = sqlite3.connect(backup_path)
+        dest = sqlite3.connect(dest_path, timeout=30)
+        try:
+            source.backup(dest)
+        finally:
+            dest.close()
+            source.close()
+
+def restore_snapshot(directory: str, name: str, database_paths: List[str]) -> List[str]:
+    """Restore every database found in a snapshot. Returns the restored paths."""
+    snapshot_dir = os.path.join(directory, name)
+    if not name.startswith(SNAPSHOT_PREFIX) or os.path.basename(name) != name or not os.path.isdir(snapshot_dir):
+        raise ValueError(f"Unknown snapshot: {name}")
+    
+    restored = []
+    for database_path in database_paths:
+        basename = os.path.basename(database_path)
+        for candidate in (basename, f"{basename}.gz"):
+            backup_path = os.path.join(snapshot_dir, candidate)
+            if os.path.exists(backup_path):
+                restore_database(backup_path, database_path)
+                restored.append(database_path)
+                break
+    
+    if not restored:
+        raise ValueError(f"Snapshot {name} contains no databases")
+    return restored
@@ -0,0 +1,91 @@
+"""Measure what an online backup costs concurrent writes.
+
+Usage: python benchmarks/backup_latency.py [megabytes]
+
+Fills a temporary database with conversation history up to the given
+size (default 100 MiB), then runs a writer thread that commits one
+message at a time while create_snapshot() copies the database. Reports
+the commit latency before and during the copy, the commit rate, and the
+figures the write probe of create_snapshot() saw.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backup import create_snapshot, latency_summary
+from database import DatabaseManager
+
+ROW_TEXT = 'lorem ipsum dolor sit amet ' * 40
+
+def fill(db: DatabaseManager, megabytes: int):
+    conn = db.get_connection()
+    rows = [('1', str(i % 50), str(i % 500), 'user', 'user', ROW_TEXT, 300) for i in range(5000)]
+    while os.path.getsize(db.db_path) < megabytes * 1024 * 1024:
+        conn.executemany('''
+            INSERT INTO conversation_history
+            (guild_id, channel_id, user_id, display_name, role, content, token_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+    conn.close()
+
+class Writer(threading.Thread):
+    """Commits one message every `interval` seconds and times each commit."""
+
+    def __init__(self, db: DatabaseManager, interval: float = 0.005):
+        super().__init__(daemon=True)
+        self.db = db
+        self.interval = interval
+        self.samples = []
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            started = time.perf_counter()
+            self.db.add_message('1', '1', '1', 'user', 'user', 'benchmark message', 3)
+            self.samples.append((time.perf_counter() - started) * 1000)
+            self.stop_event.wait(self.interval)
+
+    def take(self):
+        samples, self.samples = self.samples, []
+        return samples
+
+def describe(name: str, summary: dict, seconds: float = None):
+    rate = f", {summary['samples'] / seconds:,.0f} commits/s" if seconds else ''
+    print(f"{name:<22} p50 {summary['p50_ms']:6.2f} ms  p99 {summary['p99_ms']:6.2f} ms  "
+          f"max {summary['max_ms']:7.2f} ms  ({summary['samples']:,} writes{rate})")
+
+def main():
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db = DatabaseManager(os.path.join(temp_dir, 'nebula.db'), os.path.join(temp_dir, 'nebula_archive.db'))
+        fill(db, megabytes)
+        print(f"Database: {os.path.getsize(db.db_path) / 1024 / 1024:,.0f} MiB")
+
+        writer = Writer(db)
+        writer.start()
+        time.sleep(2)
+        describe('writer, idle', latency_summary(writer.take()), 2)
+
+        started = time.perf_counter()
+        result = create_snapshot(
+            [db.db_path, db.archive_path], os.path.join(temp_dir, 'backups'),
+            compress=False, probe_path=db.db_path
+        )
+        elapsed = time.perf_counter() - started
+        describe('writer, during backup', latency_summary(writer.take()), elapsed)
+
+        writer.stop_event.set()
+        writer.join()
+
+        print(f"Backup: {result['pages']:,} pages in {result['seconds']:.2f}s")
+        describe('probe, idle', result['idle_write_latency'])
+        describe('probe, during backup', result['write_latency'])
+
+if __name__ == '__main__':
+    main()
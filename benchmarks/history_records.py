@@ -0,0 +1,91 @@
+"""Compare HistoryMessage records with the per-row dicts they replaced.
+
+Usage: python benchmarks/history_records.py [window ...]
+
+For each window size, fetches the newest messages of a 600-row channel
+as HistoryMessage records (get_conversation_history) and as the old
+dicts with five string keys, and reports the fetch time and the memory
+retained by the rows and by the OpenAI message list built from them.
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+
+ROUNDS = 200
+
+def fetch_dicts(db: DatabaseManager, guild_id: str, channel_id: str, limit: int):
+    """The previous row format: one dict per message."""
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT display_name, role, content, timestamp, token_count
+        FROM conversation_history
+        WHERE guild_id = ? AND channel_id = ?
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    ''', (guild_id, channel_id, limit))
+    messages = [
+        {'display_name': row[0], 'role': row[1], 'content': row[2], 'timestamp': row[3], 'token_count': row[4]}
+        for row in cursor.fetchall()
+    ]
+    conn.close()
+    messages.reverse()
+    return messages
+
+def dict_to_api_message(msg):
+    if msg['role'] == 'user':
+        return {"role": "user", "content": f"[{msg['display_name']}]: {msg['content']}"}
+    return {"role": msg['role'], "content": msg['content']}
+
+def retained(build, copies: int = 20):
+    """Bytes still allocated by one object returned by `build()`.
+    
+    `build` runs once first so one-off allocations (statement caches,
+    interned strings) are not counted, then the average of `copies` kept
+    results is reported.
+    """
+    build()
+    tracemalloc.start()
+    results = [build() for _ in range(copies)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del results
+    return size / copies
+
+def timed(fetch):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fetch()
+    return (time.perf_counter() - start) / ROUNDS * 1000
+
+def main():
+    windows = [int(arg) for arg in sys.argv[1:]] or [50, 500]
+    
+    with tempfile.TemporaryDirectory() as directory:
+        db = DatabaseManager(os.path.join(directory, 'bench.db'))
+        for i in range(600):
+            role = 'user' if i % 2 == 0 else 'assistant'
+            db.add_message('1', '2', str(i % 7), f"Member {i % 7}", role,
+                           f"Message number {i}: " + "some typical chat text " * (3 + i % 10), 40)
+        
+        for window in windows:
+            records = lambda: db.get_conversation_history('1', '2', window)
+            dicts = lambda: fetch_dicts(db, '1', '2', window)
+            
+            print(f"{window}-message window")
+            print(f"  fetch:    records {timed(records):6.2f} ms   dicts {timed(dicts):6.2f} ms")
+            print(f"  rows:     records {retained(records) / 1024:6.1f} KiB  dicts {retained(dicts) / 1024:6.1f} KiB")
+            
+            record_rows, dict_rows = records(), dicts()
+            record_api = retained(lambda: [msg.to_api_message() for msg in record_rows])
+            dict_api = retained(lambda: [dict_to_api_message(msg) for msg in dict_rows])
+            print(f"  API list: records {record_api / 1024:6.1f} KiB  dicts {dict_api / 1024:6.1f} KiB")
+
+if __name__ == '__main__':
+    main()
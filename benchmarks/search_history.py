@@ -0,0 +1,66 @@
+"""Time !search_history queries against a generated conversation_history table.
+
+Usage: python benchmarks/search_history.py [rows] [--archive]
+
+Rows are spread over 20 guilds, 50 channels and 5,000 users; each query
+is run five times with no filter, a user, a channel and a date filter.
+With --archive every row is moved to archive segments first, so the
+searches run against the archive index.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    rows = int(args[0]) if args else 200_000
+    archive = '--archive' in sys.argv
+    random.seed(1)
+    words = [f"w{i}" for i in range(20000)] + ["verify", "rules", "role", "ticket"]
+    
+    with tempfile.TemporaryDirectory() as directory:
+        db = DatabaseManager(os.path.join(directory, 'bench.db'))
+        
+        start = time.perf_counter()
+        conn = db.get_connection()
+        conn.executemany(
+            """
+            INSERT INTO conversation_history
+            (guild_id, channel_id, user_id, display_name, role, content, timestamp, token_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                (
+                    str(random.randint(1, 20)), str(random.randint(1, 50)), str(random.randint(1, 5000)),
+                    "user", "user", " ".join(random.choice(words) for _ in range(15)),
+                    f"2026-{random.randint(1, 9):02d}-{random.randint(1, 28):02d} 12:00:00", 10
+                )
+                for _ in range(rows)
+            )
+        )
+        conn.commit()
+        conn.close()
+        print(f"Inserted and indexed {rows:,} rows in {time.perf_counter() - start:.1f}s")
+        
+        if archive:
+            start = time.perf_counter()
+            archived = db.archive_messages(before='2027-01-01')
+            print(f"Archived {archived:,} rows in {time.perf_counter() - start:.1f}s")
+        
+        filters = [{}, {'user_id': '42'}, {'channel_id': '7'}, {'since': '2026-09-20'}]
+        for query in ["verify", "verify rules", "w123", "zzz"]:
+            for kwargs in filters:
+                start = time.perf_counter()
+                for _ in range(5):
+                    results = db.search_history("3", query, limit=10, **kwargs)
+                elapsed = (time.perf_counter() - start) / 5 * 1000
+                print(f"{query!r:16} {str(kwargs):26} {len(results):3} results {elapsed:7.1f} ms")
+
+if __name__ == '__main__':
+    main()
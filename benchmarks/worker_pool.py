@@ -0,0 +1,176 @@
+"""Compare single-process and worker-pool message handling.
+
+Usage: python benchmarks/worker_pool.py [workers] [messages] [rate] [channels] [model_delay]
+
+Starts a fake OpenAI-compatible endpoint that answers after `model_delay`
+seconds (default 0.2), then feeds `messages` mentions (default 600) at
+`rate` per second (default 40) spread over `channels` channels (default
+20) through AIHandler.process_message() with fake Discord objects. With
+`workers` 0 (the default) everything runs in this process; otherwise
+AI_WORKERS worker processes are started. Reports replies per second,
+messages turned away, reply latency and the event loop lag of the
+gateway. Run it with `taskset -c 0` to reproduce the single-core figures
+in DOCUMENTATION.md.
+"""
+import asyncio
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+REPLY = "Sure! " + "here is some detail. " * 40
+
+def serve_model(port: int, delay: float):
+    """A chat completions endpoint that waits `delay` seconds and returns a fixed reply."""
+    from aiohttp import web
+
+    async def chat(request):
+        body = await request.json()
+        await asyncio.sleep(delay)
+        prompt_chars = sum(len(m['content']) for m in body['messages'] if isinstance(m.get('content'), str))
+        return web.json_response({
+            'id': 'benchmark', 'object': 'chat.completion', 'created': int(time.time()),
+            'model': body.get('model') or 'fake',
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': REPLY}}],
+            'usage': {'prompt_tokens': prompt_chars // 4, 'completion_tokens': 200, 'total_tokens': prompt_chars // 4 + 200}
+        })
+
+    app = web.Application()
+    app.router.add_post('/v1/chat/completions', chat)
+    web.run_app(app, host='127.0.0.1', port=port, print=None, access_log=None)
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content)
+        return SimpleNamespace(id=len(self.sent))
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str):
+        self.id = user_id
+        self.display_name = name
+        self.guild_permissions = SimpleNamespace(administrator=False)
+
+class FakeMessage:
+    def __init__(self, message_id: int, content: str, channel: FakeChannel, author: FakeUser):
+        self.id = message_id
+        self.content = content
+        self.channel = channel
+        self.author = author
+        self.guild = SimpleNamespace(id=1)
+        self.attachments = []
+        self.reference = None
+        self.mentions = []
+
+class FakeBot:
+    def __init__(self):
+        self.user = FakeUser(1000, 'Nebula')
+        self.cogs = {}
+        self.cached_messages = []
+
+    def get_cog(self, name: str):
+        return self.cogs.get(name)
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+async def drive(workers: int, messages: int, rate: float, channel_count: int):
+    from cogs.ai_handler import AIHandler
+    from cogs.memory_manager import MemoryManager
+    from cogs.worker_manager import WorkerManager
+
+    bot = FakeBot()
+    bot.cogs['MemoryManager'] = MemoryManager(bot)
+    handler = bot.cogs['AIHandler'] = AIHandler(bot)
+    worker_manager = bot.cogs['WorkerManager'] = WorkerManager(bot)
+    await worker_manager.cog_load()
+    if worker_manager.pool:
+        # Every worker has sent a heartbeat once it is ready
+        while not all(worker_manager.pool.worker_stats):
+            await asyncio.sleep(0.1)
+
+    # Event loop lag: how late a 10 ms sleep wakes up
+    lags = []
+    running = True
+
+    async def probe():
+        while running:
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append((time.perf_counter() - started - 0.01) * 1000)
+
+    probe_task = asyncio.create_task(probe())
+    channels = [FakeChannel(5000 + i) for i in range(channel_count)]
+    author = FakeUser(2, 'Alice')
+    latencies = []
+
+    async def send(i: int):
+        started = time.perf_counter()
+        content = f"<@1000> question number {i} about something " + "words " * 40
+        await handler.process_message(FakeMessage(i, content, channels[i % channel_count], author))
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    tasks = []
+    for i in range(messages):
+        tasks.append(asyncio.create_task(send(i)))
+        await asyncio.sleep(1 / rate)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    running = False
+    await probe_task
+
+    sent = [content for channel in channels for content in channel.sent if content]
+    replies = sum(1 for content in sent if content.startswith('Sure'))
+    mode = f"{workers} workers" if worker_manager.pool else "single process"
+    print(f"{mode}, {rate:g}/s offered: {replies / elapsed:.1f} replies/s, "
+          f"{len(sent) - replies} of {messages} turned away or failed")
+    print(f"  reply latency p50 {percentile(latencies, 0.5):.0f} ms, p99 {percentile(latencies, 0.99):.0f} ms")
+    print(f"  gateway loop lag p99 {percentile(lags, 0.99):.1f} ms, max {max(lags):.1f} ms")
+
+    if worker_manager.pool:
+        await worker_manager.cog_unload()
+
+def main():
+    args = sys.argv[1:]
+    workers = int(args[0]) if len(args) > 0 else 0
+    messages = int(args[1]) if len(args) > 1 else 600
+    rate = float(args[2]) if len(args) > 2 else 40
+    channel_count = int(args[3]) if len(args) > 3 else 20
+    delay = float(args[4]) if len(args) > 4 else 0.2
+
+    port = free_port()
+    server = multiprocessing.Process(target=serve_model, args=(port, delay), daemon=True)
+    server.start()
+    time.sleep(1)
+
+    # The bot keeps its databases in the working directory
+    work_dir = tempfile.mkdtemp()
+    os.chdir(work_dir)
+    os.environ.update(
+        OPENAI_API_KEY='benchmark', OPENAI_BASE_URL=f'http://127.0.0.1:{port}/v1',
+        AI_MODEL='fake', AI_WORKERS=str(workers)
+    )
+    try:
+        asyncio.run(drive(workers, messages, rate, channel_count))
+    finally:
+        server.terminate()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -27,10 +27,17 @@ async def on_ready():
 async def load_cogs():
     """Load all cog modules."""
     cogs_list = [
+        'cogs.settings_manager',
+        'cogs.delivery_manager',
+        'cogs.worker_manager',
         'cogs.memory_manager',
+        'cogs.quota_manager',
         'cogs.ai_handler',
         'cogs.admin_tools',
+        'cogs.raid_manager',
         'cogs.search_tool',
+        'cogs.archive_manager',
+        'cogs.backup_manager',
     ]
     
     for cog in cogs_list:
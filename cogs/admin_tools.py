@@ -1,14 +1,96 @@
 import discord
 from discord.ext import commands
-from database import DatabaseManager
+from storage import get_storage
+from export import EXPORT_FORMATS, ADMIN_LOG_FIELDS, HISTORY_FIELDS, export_rows
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import asyncio
 import re
+import tempfile
+
+class HistorySearchFlags(commands.FlagConverter):
+    """Filters for the search_history command."""
+    query: str
+    user: Optional[discord.Member] = None
+    channel: Optional[discord.TextChannel] = None
+    days: Optional[int] = None
+    after: Optional[str] = None
+    before: Optional[str] = None
+    limit: int = 10
+
+class ExportFlags(commands.FlagConverter):
+    """Options for the export command."""
+    format: str = 'jsonl'
+    days: Optional[int] = None
+    channel: Optional[discord.TextChannel] = None
+
+class AdminLogView(discord.ui.View):
+    """Older/Newer buttons for paging through admin logs by id."""
+    
+    def __init__(self, cog, ctx, logs: List[Dict], page_size: int, total: int):
+        super().__init__(timeout=180)
+        self.cog = cog
+        self.ctx = ctx
+        self.logs = logs
+        self.page_size = page_size
+        self.total = total
+        self.page = 1
+        self.message = None
+        self.update_buttons(has_older=len(logs) == page_size)
+    
+    def update_buttons(self, has_older: bool):
+        self.newer.disabled = self.page == 1
+        self.older.disabled = not has_older
+    
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.ctx.author.id:
+            await interaction.response.send_message("Only the admin who ran the command can page through these logs.", ephemeral=True)
+            return False
+        return True
+    
+    async def show(self, interaction: discord.Interaction, logs: List[Dict], has_older: bool):
+        self.logs = logs
+        self.update_buttons(has_older)
+        embed = self.cog.build_admin_logs_embed(logs, self.page, self.total, self.page_size)
+        await interaction.response.edit_message(embed=embed, view=self)
+    
+    @discord.ui.button(label="◀ Newer", style=discord.ButtonStyle.secondary)
+    async def newer(self, interaction: discord.Interaction, button: discord.ui.Button):
+        logs = await asyncio.to_thread(
+            self.cog.db.get_admin_logs, str(self.ctx.guild.id), self.page_size, after_id=self.logs[0]['id']
+        )
+        if len(logs) < self.page_size:
+            # Back at the newest entries
+            logs = await asyncio.to_thread(self.cog.db.get_admin_logs, str(self.ctx.guild.id), self.page_size)
+            self.page = 1
+        else:
+            self.page -= 1
+        await self.show(interaction, logs, has_older=True)
+    
+    @discord.ui.button(label="Older ▶", style=discord.ButtonStyle.secondary)
+    async def older(self, interaction: discord.Interaction, button: discord.ui.Button):
+        logs = await asyncio.to_thread(
+            self.cog.db.get_admin_logs, str(self.ctx.guild.id), self.page_size + 1, before_id=self.logs[-1]['id']
+        )
+        has_older = len(logs) > self.page_size
+        self.page += 1
+        await self.show(interaction, logs[:self.page_size], has_older)
+    
+    async def on_timeout(self):
+        for item in self.children:
+            item.disabled = True
+        if self.message:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
 
 class AdminTools(commands.Cog):
     """Admin tools for moderation and server management."""
     
     def __init__(self, bot):
         self.bot = bot
-        self.db = DatabaseManager()
+        self.db = get_storage()
     
     def extract_user_id(self, user_mention: str) -> int:
         """Extract user ID from mention or ID string."""
@@ -23,6 +105,32 @@ class AdminTools(commands.Cog):
         except ValueError:
             return None
     
+    def extract_channel_id(self, channel_mention: str) -> int:
+        """Extract channel ID from mention or ID string."""
+        # Try to extract from mention format <#123>
+        match = re.search(r'<#(\d+)>', channel_mention)
+        if match:
+            return int(match.group(1))
+        
+        # Try to parse as direct ID
+        try:
+            return int(channel_mention)
+        except ValueError:
+            return None
+    
+    def format_history_results(self, query: str, results: list) -> str:
+        """Format history search results as a chat message."""
+        if not results:
+            return f"🔎 No messages found matching: **{query}**"
+        
+        response = f"🔎 **History search for:** {query}\n\n"
+        for i, result in enumerate(results, 1):
+            archived = " 📦" if result.get('archived') else ""
+            response += f"**{i}. {result['display_name']}** in <#{result['channel_id']}> ({result['timestamp']}){archived}\n"
+            response += f"{result['snippet']}\n\n"
+        
+        return response
+    
     async def kick_user_tool(self, message: discord.Message, user_mention: str, reason: str) -> str:
         """Tool function to kick a user."""
         # Verify admin permissions
@@ -49,7 +157,8 @@ class AdminTools(commands.Cog):
             await member.kick(reason=reason)
             
             # Log the action
-            self.db.log_admin_action(
+            await asyncio.to_thread(
+                self.db.log_admin_action,
                 str(message.guild.id),
                 str(message.author.id),
                 message.author.display_name,
@@ -92,7 +201,8 @@ class AdminTools(commands.Cog):
             await member.ban(reason=reason, delete_message_days=0)
             
             # Log the action
-            self.db.log_admin_action(
+            await asyncio.to_thread(
+                self.db.log_admin_action,
                 str(message.guild.id),
                 str(message.author.id),
                 message.author.display_name,
@@ -143,7 +253,8 @@ class AdminTools(commands.Cog):
             if category:
                 details += f" in category: {category.name}"
             
-            self.db.log_admin_action(
+            await asyncio.to_thread(
+                self.db.log_admin_action,
                 str(message.guild.id),
                 str(message.author.id),
                 message.author.display_name,
@@ -173,7 +284,7 @@ class AdminTools(commands.Cog):
         
         try:
             # Get user activity from database
-            activity = self.db.get_user_activity(str(user_id), str(message.guild.id))
+            activity = await asyncio.to_thread(self.db.get_user_activity, str(user_id), str(message.guild.id))
             
             if not activity:
                 return f"❌ No activity data found for user ID: {user_id}"
@@ -185,9 +296,13 @@ class AdminTools(commands.Cog):
             response += f"🕐 **Last Seen:** {activity['last_seen']}\n"
             response += f"💬 **Total Messages:** {activity['total_messages']}\n"
             response += f"📈 **Messages (Last 7 Days):** {activity['messages_last_7_days']}\n"
+            response += f"📈 **Messages (Last 30 Days):** {activity['messages_last_30_days']}\n"
+            response += f"📈 **Messages (Last 90 Days):** {activity['messages_last_90_days']}\n"
+            response += f"🗓️ **Active Days (Last 30 Days):** {activity['active_days_last_30_days']}\n"
             
             # Log the action
-            self.db.log_admin_action(
+            await asyncio.to_thread(
+                self.db.log_admin_action,
                 str(message.guild.id),
                 str(message.author.id),
                 message.author.display_name,
@@ -202,38 +317,274 @@ class AdminTools(commands.Cog):
         except Exception as e:
             return f"❌ Error checking user activity: {str(e)}"
     
-    @commands.command(name='admin_logs')
+    async def search_history_tool(self, message: discord.Message, query: str, user_mention: str = None,
+                                  channel_mention: str = None, days: int = None) -> str:
+        """Tool function to search conversation history."""
+        # Verify admin permissions
+        if not message.author.guild_permissions.administrator:
+            return "❌ You don't have permission to search conversation history."
+        
+        if not query:
+            return "❌ Please provide something to search for."
+        
+        user_id = None
+        if user_mention:
+            user_id = self.extract_user_id(user_mention)
+            if not user_id:
+                return f"❌ Could not identify user from: {user_mention}"
+        
+        channel_id = None
+        if channel_mention:
+            channel_id = self.extract_channel_id(channel_mention)
+            if not channel_id:
+                return f"❌ Could not identify channel from: {channel_mention}"
+        
+        since = None
+        if days:
+            since = (datetime.utcnow() - timedelta(days=int(days))).strftime('%Y-%m-%d %H:%M:%S')
+        
+        try:
+            results = await asyncio.to_thread(
+                self.db.search_history,
+                str(message.guild.id),
+                query,
+                user_id=str(user_id) if user_id else None,
+                channel_id=str(channel_id) if channel_id else None,
+                since=since,
+                limit=10
+            )
+            
+            # Log the action
+            await asyncio.to_thread(
+                self.db.log_admin_action,
+                str(message.guild.id),
+                str(message.author.id),
+                message.author.display_name,
+                "search_history",
+                str(user_id) if user_id else None,
+                None,
+                f"Searched history for: {query}"
+            )
+            
+            return self.format_history_results(query, results)
+        
+        except Exception as e:
+            return f"❌ Error searching history: {str(e)}"
+    
+    @commands.command(name='search_history')
     @commands.has_permissions(administrator=True)
-    async def admin_logs(self, ctx, limit: int = 10):
-        """View recent admin action logs."""
-        if limit > 50:
-            limit = 50
+    async def search_history(self, ctx, *, flags: HistorySearchFlags):
+        """Search conversation history. Usage: !search_history query: <words> [user: @user] [channel: #channel] [days: N] [after: YYYY-MM-DD] [before: YYYY-MM-DD]"""
+        limit = max(1, min(flags.limit, 25))
         
-        logs = self.db.get_admin_logs(str(ctx.guild.id), limit)
+        since = flags.after
+        until = flags.before
+        try:
+            if since:
+                datetime.strptime(since, '%Y-%m-%d')
+            if until:
+                datetime.strptime(until, '%Y-%m-%d')
+        except ValueError:
+            await ctx.send("❌ Dates must use the format YYYY-MM-DD.")
+            return
         
-        if not logs:
-            await ctx.send("No admin logs found.")
+        if flags.days:
+            since = (datetime.utcnow() - timedelta(days=flags.days)).strftime('%Y-%m-%d %H:%M:%S')
+        
+        results = await asyncio.to_thread(
+            self.db.search_history,
+            str(ctx.guild.id),
+            flags.query,
+            user_id=str(flags.user.id) if flags.user else None,
+            channel_id=str(flags.channel.id) if flags.channel else None,
+            since=since,
+            until=until,
+            limit=limit
+        )
+        
+        if not results:
+            await ctx.send(f"🔎 No messages found matching: **{flags.query}**")
             return
         
+        embed = discord.Embed(
+            title=f"🔎 History Search: {flags.query}",
+            color=discord.Color.blue()
+        )
+        
+        for i, result in enumerate(results, 1):
+            embed.add_field(
+                name=f"{i}. {result['display_name']} ({result['timestamp']}){' 📦' if result.get('archived') else ''}",
+                value=f"<#{result['channel_id']}>\n{result['snippet'][:900]}",
+                inline=False
+            )
+        
+        await ctx.send(embed=embed)
+    
+    def build_admin_logs_embed(self, logs: List[Dict], page: int, total: int, page_size: int) -> discord.Embed:
+        """Build the embed for one page of admin logs."""
+        pages = max(1, (total + page_size - 1) // page_size)
         embed = discord.Embed(
             title="📋 Admin Action Logs",
             color=discord.Color.gold()
         )
+        embed.set_footer(text=f"Page {page}/{pages} · {total:,} entries · !export logs for the full trail")
         
-        for i, log in enumerate(logs[:10], 1):
+        for log in logs:
             value = f"**Action:** {log['action_type']}\n"
             if log['target_name']:
                 value += f"**Target:** {log['target_name']}\n"
             if log['details']:
-                value += f"**Details:** {log['details']}\n"
+                value += f"**Details:** {log['details'][:500]}\n"
             value += f"**Time:** {log['timestamp']}"
             
             embed.add_field(
-                name=f"{i}. {log['admin_name']}",
+                name=f"#{log['id']} {log['admin_name']}",
                 value=value,
                 inline=False
             )
         
+        return embed
+    
+    @commands.command(name='admin_logs')
+    @commands.has_permissions(administrator=True)
+    async def admin_logs(self, ctx, page_size: int = 10):
+        """View admin action logs, with buttons to page through all of them."""
+        page_size = max(1, min(page_size, 10))
+        guild_id = str(ctx.guild.id)
+        
+        logs = await asyncio.to_thread(self.db.get_admin_logs, guild_id, page_size)
+        
+        if not logs:
+            await ctx.send("No admin logs found.")
+            return
+        
+        total = await asyncio.to_thread(self.db.count_admin_logs, guild_id)
+        embed = self.build_admin_logs_embed(logs, 1, total, page_size)
+        
+        if total <= page_size:
+            await ctx.send(embed=embed)
+            return
+        
+        view = AdminLogView(self, ctx, logs, page_size, total)
+        view.message = await ctx.send(embed=embed, view=view)
+    
+    @commands.command(name='export')
+    @commands.has_permissions(administrator=True)
+    async def export(self, ctx, kind: str, *, flags: ExportFlags):
+        """Export admin logs or conversation history as a compressed file. Usage: !export <logs|history> [format: jsonl|csv] [days: N] [channel: #channel]"""
+        kind = kind.lower()
+        fmt = flags.format.lower()
+        if kind not in ('logs', 'history'):
+            await ctx.send("❌ Choose what to export: `logs` or `history`.")
+            return
+        if fmt not in EXPORT_FORMATS:
+            await ctx.send(f"❌ Format must be one of: {', '.join(EXPORT_FORMATS)}")
+            return
+        
+        guild_id = str(ctx.guild.id)
+        since = None
+        if flags.days:
+            since = (datetime.utcnow() - timedelta(days=flags.days)).strftime('%Y-%m-%d %H:%M:%S')
+        
+        if kind == 'logs':
+            rows = self.db.iter_admin_logs(guild_id, since=since)
+            fields = ADMIN_LOG_FIELDS
+        else:
+            rows = self.db.iter_history_export(
+                guild_id, channel_id=str(flags.channel.id) if flags.channel else None, since=since
+            )
+            fields = HISTORY_FIELDS
+        
+        basename = f"{kind}-{guild_id}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}"
+        
+        async with ctx.typing():
+            with tempfile.TemporaryDirectory() as directory:
+                # Reading and compressing run in a worker thread; only one
+                # batch of rows is held in memory at a time
+                result = await asyncio.to_thread(
+                    export_rows, rows, directory, basename, fields, fmt, ctx.guild.filesize_limit
+                )
+                
+                summary = (
+                    f"📦 Exported {result['rows']:,} {'log entries' if kind == 'logs' else 'messages'} "
+                    f"({result['bytes'] / 1024:,.1f} KiB compressed"
+                )
+                if len(result['paths']) > 1:
+                    summary += f", {len(result['paths'])} files"
+                summary += ")"
+                
+                for index, path in enumerate(result['paths']):
+                    await ctx.send(summary if index == 0 else None, file=discord.File(path))
+        
+        details = f"{kind} as {fmt}, {result['rows']} rows"
+        if flags.days:
+            details += f", last {flags.days} days"
+        if flags.channel:
+            details += f", #{flags.channel.name}"
+        await asyncio.to_thread(
+            self.db.log_admin_action,
+            guild_id,
+            str(ctx.author.id),
+            ctx.author.display_name,
+            "export",
+            details=details
+        )
+    
+    @commands.command(name='top_users')
+    @commands.has_permissions(administrator=True)
+    async def top_users(self, ctx, days: int = 7, limit: int = 10):
+        """Show the most active members. Usage: !top_users [days] [limit]"""
+        days = max(1, min(days, 90))
+        limit = max(1, min(limit, 25))
+        
+        users = await asyncio.to_thread(self.db.get_top_users, str(ctx.guild.id), days, limit)
+        
+        if not users:
+            await ctx.send(f"No activity in the last {days} days.")
+            return
+        
+        embed = discord.Embed(
+            title=f"🏆 Most Active Members (Last {days} Days)",
+            color=discord.Color.blue()
+        )
+        
+        lines = []
+        for i, user in enumerate(users, 1):
+            lines.append(
+                f"**{i}.** {user['display_name']}: {user['messages']:,} messages "
+                f"on {user['active_days']} day{'s' if user['active_days'] != 1 else ''}"
+            )
+        embed.description = "\n".join(lines)
+        
+        await ctx.send(embed=embed)
+    
+    @commands.command(name='channel_activity')
+    @commands.has_permissions(administrator=True)
+    async def channel_activity(self, ctx, days: int = 7, limit: int = 10):
+        """Show the busiest channels. Usage: !channel_activity [days] [limit]"""
+        days = max(1, min(days, 90))
+        limit = max(1, min(limit, 25))
+        
+        channels = await asyncio.to_thread(self.db.get_channel_activity, str(ctx.guild.id), days, limit)
+        
+        if not channels:
+            await ctx.send(f"No activity in the last {days} days.")
+            return
+        
+        total = sum(channel['messages'] for channel in channels)
+        embed = discord.Embed(
+            title=f"📊 Channel Activity (Last {days} Days)",
+            color=discord.Color.blue()
+        )
+        
+        lines = []
+        for i, channel in enumerate(channels, 1):
+            lines.append(
+                f"**{i}.** <#{channel['channel_id']}>: {channel['messages']:,} messages "
+                f"({channel['messages'] / total * 100:.0f}%), {channel['messages'] / days:,.1f}/day"
+            )
+        embed.description = "\n".join(lines)
+        
         await ctx.send(embed=embed)
 
 async def setup(bot):
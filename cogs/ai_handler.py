@@ -1,15 +1,46 @@
 import discord
 from discord.ext import commands
-from openai import AsyncOpenAI
+from ai_client import ResilientChatClient, ProviderUnavailableError, parse_fallback_models
+from storage import get_storage, HistoryMessage
+from model_router import ModelRouter, RouteDecision
+from worker_pool import WorkerPoolBusy
+from prompt_builder import PromptAssembler
+from images import ImageProcessor, ProcessedImage
+from answer_cache import AnswerCache, CachedAnswer, normalize_question, MIN_QUESTION_LENGTH, NAME_PLACEHOLDER
+from delivery import deliver
+from settings import DEFAULT_SETTINGS, get_guild_settings, get_guild_settings_version, filter_tools
+import asyncio
 import os
 import json
-from typing import List, Dict
+import time
+from typing import Hashable, List, Dict, Optional
+
+# Seconds between checks of system.txt for changes
+SYSTEM_PROMPT_CHECK_INTERVAL = 10
+
+def image_attachments(message: discord.Message) -> List[discord.Attachment]:
+    """The image attachments of a message."""
+    return [att for att in message.attachments if att.content_type and att.content_type.startswith('image/')]
+
+def visible_to_everyone(channel) -> bool:
+    """True if @everyone may view the channel; private threads never count."""
+    if getattr(channel, 'type', None) == discord.ChannelType.private_thread:
+        return False
+    return channel.permissions_for(channel.guild.default_role).view_channel
 
 class AIHandler(commands.Cog):
-    """Handles AI-powered message responses using OpenAI."""
+    """Handles AI-powered message responses using OpenAI.
+    
+    The answer cache is shared by every channel of a guild, so only
+    answers given in channels that @everyone can view are stored in it.
+    Replies in private channels and private threads are never cached, and
+    cannot surface elsewhere; they may still be answered from the cache,
+    which only ever holds answers anyone in the guild could already read.
+    """
     
     def __init__(self, bot):
         self.bot = bot
+        self.db = get_storage()
         self.openai_client = None
         self.setup_openai()
         self.load_system_prompt()
@@ -17,30 +48,97 @@ class AIHandler(commands.Cog):
         # Get memory manager and admin tools (loaded lazily)
         self.memory_manager = None
         self.admin_tools = None
+        
+        # Stable prompt layout for provider prefix caching
+        self.prompt_assembler = PromptAssembler(
+            max_messages=int(os.getenv('CONTEXT_MESSAGES', '50')),
+            block_size=int(os.getenv('CONTEXT_BLOCK_SIZE', '25'))
+        )
+        self.tool_sets = {}
+        
+        # Fast/strong model routing; off unless AI_FAST_MODEL is set
+        self.router = ModelRouter(
+            fast_model=os.getenv('AI_FAST_MODEL') or None,
+            strong_model=os.getenv('AI_MODEL') or None,
+            fast_max_tokens=int(os.getenv('AI_FAST_MAX_TOKENS', '600')),
+            max_fast_chars=int(os.getenv('AI_ROUTER_MAX_CHARS', '280')),
+            max_fast_history_tokens=int(os.getenv('AI_ROUTER_MAX_HISTORY_TOKENS', '4000'))
+        )
+        
+        # Image attachments, downscaled for vision input
+        self.image_processor = ImageProcessor(
+            max_bytes=int(float(os.getenv('IMAGE_MAX_MB', '8')) * 1024 * 1024),
+            max_side=int(os.getenv('IMAGE_MAX_SIDE', '768')),
+            quality=int(os.getenv('IMAGE_QUALITY', '80')),
+            detail=os.getenv('IMAGE_DETAIL', 'high'),
+            cache_bytes=int(float(os.getenv('IMAGE_CACHE_MB', '16')) * 1024 * 1024)
+        )
+        
+        # Answers to repeated questions, for guilds that enable answer_cache
+        self.answer_cache = AnswerCache(
+            ttl=float(os.getenv('ANSWER_CACHE_TTL', '3600')),
+            max_entries=int(os.getenv('ANSWER_CACHE_SIZE', '256'))
+        )
+        
+        # Per-stage processing times in ms
+        self.stage_totals = {}
+        self.last_timings = {}
+        self.stage_count = 0
     
     def setup_openai(self):
-        """Configure OpenAI client using new AsyncOpenAI structure."""
+        """Configure the resilient OpenAI client (retries, timeouts, circuit breakers, fallbacks)."""
         api_key = os.getenv('OPENAI_API_KEY')
-        base_url = os.getenv('OPENAI_BASE_URL')
+        base_url = os.getenv('OPENAI_BASE_URL') or None
         
         
         if not api_key:
             print("WARNING: OPENAI_API_KEY not found!")
             return
         
-        # Create AsyncOpenAI client with new structure (v1.0.0+)
+        fallback_models = parse_fallback_models(os.getenv('AI_FALLBACK_MODELS', ''), base_url)
+        
+        self.openai_client = ResilientChatClient(
+            api_key=api_key,
+            base_url=base_url,
+            model=os.getenv('AI_MODEL'),
+            fallback_models=fallback_models,
+            max_retries=int(os.getenv('AI_MAX_RETRIES', '3')),
+            request_timeout=float(os.getenv('AI_REQUEST_TIMEOUT', '30')),
+            total_timeout=float(os.getenv('AI_TOTAL_TIMEOUT', '90')),
+            breaker_threshold=int(os.getenv('AI_BREAKER_THRESHOLD', '5')),
+            breaker_cooldown=float(os.getenv('AI_BREAKER_COOLDOWN', '30'))
+        )
+        
         if base_url:
-            self.openai_client = AsyncOpenAI(
-                api_key=api_key,
-                base_url=base_url
-            )
             print(f"Using custom OpenAI base URL: {base_url}")
         else:
-            self.openai_client = AsyncOpenAI(api_key=api_key)
             print("Using default OpenAI endpoint")
+        if fallback_models:
+            print(f"Fallback models: {', '.join(model for model, _ in fallback_models)}")
+        if os.getenv('AI_FAST_MODEL'):
+            print(f"Fast model for simple messages: {os.getenv('AI_FAST_MODEL')}")
+    
+    def get_system_prompt_stamp(self):
+        """Modification time and size of system.txt, or None if it does not exist."""
+        try:
+            stat = os.stat('system.txt')
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    def refresh_system_prompt(self):
+        """Reload system.txt if it changed; checked at most every SYSTEM_PROMPT_CHECK_INTERVAL seconds."""
+        now = time.monotonic()
+        if now - self.system_prompt_checked < SYSTEM_PROMPT_CHECK_INTERVAL:
+            return
+        self.system_prompt_checked = now
+        if self.get_system_prompt_stamp() != self.system_prompt_stamp:
+            self.load_system_prompt()
     
     def load_system_prompt(self):
         """Load system prompt from system.txt file."""
+        self.system_prompt_stamp = self.get_system_prompt_stamp()
+        self.system_prompt_checked = time.monotonic()
         try:
             with open('system.txt', 'r', encoding='utf-8') as f:
                 self.system_prompt = f.read().strip()
@@ -57,6 +155,16 @@ When administrators need to perform actions like kicking, banning, creating chan
 Always be respectful, helpful, and maintain a positive tone. You have access to the conversation history, so you can reference previous discussions."""
             print("WARNING: system.txt not found, using default system prompt")
     
+    def get_tools(self, is_admin: bool, enabled: Optional[List[str]] = None) -> List[Dict]:
+        """Get the tool list for a permission level and a guild's enabled tools.
+        
+        Each combination is built once so it is byte-identical on every request.
+        """
+        key = (is_admin, tuple(enabled) if enabled is not None else None)
+        if key not in self.tool_sets:
+            self.tool_sets[key] = filter_tools(self.get_available_tools(is_admin), enabled)
+        return self.tool_sets[key]
+    
     def get_available_tools(self, is_admin: bool) -> List[Dict]:
         """Get available tools based on user permissions."""
         tools = []
@@ -155,7 +263,7 @@ Always be respectful, helpful, and maintain a positive tone. You have access to
                     "type": "function",
                     "function": {
                         "name": "user_activity_check",
-                        "description": "Check activity history of a specific user",
+                        "description": "Check activity history of a specific user (profile and messages in the last 7, 30 and 90 days)",
                         "parameters": {
                             "type": "object",
                             "properties": {
@@ -167,16 +275,231 @@ Always be respectful, helpful, and maintain a positive tone. You have access to
                             "required": ["user_mention"]
                         }
                     }
+                },
+                {
+                    "type": "function",
+                    "function": {
+                        "name": "search_history",
+                        "description": "Search past conversation history in this server, e.g. to find what a user said about a topic",
+                        "parameters": {
+                            "type": "object",
+                            "properties": {
+                                "query": {
+                                    "type": "string",
+                                    "description": "Words to search for in past messages"
+                                },
+                                "user_mention": {
+                                    "type": "string",
+                                    "description": "Only return messages from this user (mention or user ID, optional)"
+                                },
+                                "channel_mention": {
+                                    "type": "string",
+                                    "description": "Only return messages from this channel (mention or channel ID, optional)"
+                                },
+                                "days": {
+                                    "type": "integer",
+                                    "description": "Only return messages from the last N days (optional)"
+                                }
+                            },
+                            "required": ["query"]
+                        }
+                    }
                 }
             ])
         
         return tools
     
+    async def timed(self, timings: Dict, stage: str, coro):
+        """Await `coro` and record its duration under `stage`."""
+        start = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            timings[stage] = (time.perf_counter() - start) * 1000
+    
+    def record_timings(self, timings: Dict):
+        """Add one message's stage timings (ms) to the running totals."""
+        self.stage_count += 1
+        for stage, elapsed in timings.items():
+            self.stage_totals[stage] = self.stage_totals.get(stage, 0.0) + elapsed
+            self.last_timings[stage] = elapsed
+    
+    async def resolve_reply(self, message: discord.Message):
+        """Get the message being replied to, preferring data Discord already sent us."""
+        reference = message.reference
+        if not reference or not reference.message_id:
+            return None
+        
+        # Discord usually includes the referenced message in the gateway event
+        if isinstance(reference.resolved, discord.Message):
+            return reference.resolved
+        
+        # Then the client's message cache
+        cached = discord.utils.get(self.bot.cached_messages, id=reference.message_id)
+        if cached:
+            return cached
+        
+        # Fall back to a REST call
+        try:
+            return await message.channel.fetch_message(reference.message_id)
+        except discord.HTTPException:
+            return None
+    
+    async def load_history(self, guild_id: str, channel_id: str, max_messages: int) -> List[HistoryMessage]:
+        """Load the recent history records of a channel."""
+        if not self.memory_manager:
+            return []
+        return await self.memory_manager.load_history_window(guild_id, channel_id, max_messages)
+    
+    async def load_images(self, message: discord.Message, reply: asyncio.Future, max_images: int) -> List[ProcessedImage]:
+        """Process the images of a message and of the message it replies to, up to `max_images`.
+        
+        The message's own images start downloading at once; the replied-to
+        message's images are added when `reply` resolves, and usually come
+        from the cache because they were processed when that message was
+        sent.
+        """
+        attachments = image_attachments(message)[:max_images]
+        own = asyncio.ensure_future(self.image_processor.process(attachments))
+        context_message = await reply
+        
+        images = await own
+        extra = image_attachments(context_message)[:max_images - len(attachments)] if context_message else []
+        if extra:
+            images = await self.image_processor.process(extra) + images
+        return images
+    
+    def cacheable_question(self, message: discord.Message, settings: Dict) -> Optional[str]:
+        """The normalized question of a turn that may use the answer cache, else None.
+        
+        Administrators get the moderation tools, and replies and images
+        change the prompt beyond the question text, so those turns are never
+        answered from (or stored in) the cache.
+        """
+        if not settings['answer_cache'] or message.author.guild_permissions.administrator:
+            return None
+        if message.reference or image_attachments(message):
+            return None
+        
+        question = normalize_question(message.content)
+        return question if len(question) >= MIN_QUESTION_LENGTH else None
+    
+    def answer_cache_version(self, guild_id: str) -> Hashable:
+        """Cached answers are only valid for the settings and system prompt they were produced with."""
+        self.refresh_system_prompt()
+        return (get_guild_settings_version(self.bot, guild_id), hash(self.system_prompt))
+    
+    async def send_cached_answer(self, message: discord.Message, cached: CachedAnswer, settings: Dict):
+        """Deliver a cached answer and record both turns in the channel history."""
+        guild_id = str(message.guild.id)
+        channel_id = str(message.channel.id)
+        display_name = message.author.display_name
+        answer = cached.answer.replace(NAME_PLACEHOLDER, display_name)
+        
+        if not self.memory_manager:
+            await deliver(self.bot, message.channel, answer)
+            return
+        
+        user_content = message.content.replace(f'<@{self.bot.user.id}>', '').strip()
+        await asyncio.gather(
+            deliver(self.bot, message.channel, answer),
+            self.memory_manager.store_record(
+                guild_id, channel_id, str(message.author.id), display_name, "user", user_content,
+                settings['max_memory_tokens']
+            )
+        )
+        await self.memory_manager.store_record(
+            guild_id, channel_id, str(message.author.id), display_name, "assistant", answer,
+            settings['max_memory_tokens'], cached.completion_tokens or None
+        )
+        
+        # Workers cache their channels' windows and did not see these writes
+        worker_manager = self.bot.get_cog('WorkerManager')
+        if worker_manager and worker_manager.pool:
+            worker_manager.pool.invalidate((guild_id, channel_id))
+    
+    def store_answer(self, message: discord.Message, question: str, version: Hashable, result: Dict):
+        """Cache the reply to a question, unless the model used tools or the channel is private."""
+        if not result['reply'] or result['tool_calls']:
+            return
+        
+        # Cached answers are served in every channel of the guild
+        if not visible_to_everyone(message.channel):
+            return
+        
+        # Replies address the asker by name; hits substitute the new asker
+        answer = result['reply']
+        display_name = message.author.display_name
+        if len(display_name) >= 3:
+            answer = answer.replace(display_name, NAME_PLACEHOLDER)
+        
+        usage = result['usage'] or {}
+        self.answer_cache.put(
+            str(message.guild.id), question, version, answer,
+            usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0),
+            result['timings'].get('model', 0.0)
+        )
+    
     async def process_message(self, message: discord.Message, context_message: discord.Message = None):
-        """Process a message and generate AI response."""
+        """Process a message and generate AI response.
+        
+        Independent steps run concurrently: the replied-to message, the
+        conversation history and attached images are loaded together, and the user turn is saved
+        while the model call is in flight. With AI_WORKERS set, everything
+        after the reply lookup runs in a worker process (see generate()).
+        """
         # Get memory manager if not already loaded
         if not self.memory_manager:
             self.memory_manager = self.bot.get_cog('MemoryManager')
+            if self.memory_manager:
+                self.memory_manager.context_cache.on_drop = self.prompt_assembler.forget
+        
+        timings = {}
+        total_start = time.perf_counter()
+        guild_id = str(message.guild.id)
+        channel_id = str(message.channel.id)
+        settings = await get_guild_settings(self.bot, guild_id)
+        max_messages = settings['context_messages']
+        
+        # Rate limits: queue briefly or reject before doing any work
+        quota_manager = self.bot.get_cog('QuotaManager')
+        if quota_manager:
+            allowed, retry_after = await self.timed(timings, 'quota', quota_manager.acquire(message))
+            if not allowed:
+                await deliver(
+                    self.bot, message.channel,
+                    f"⏳ {message.author.display_name}, I'm getting a lot of requests right now. "
+                    f"Please try again in {max(1, round(retry_after))} seconds."
+                )
+                return
+        
+        # Repeated questions can be answered without calling the model
+        question = self.cacheable_question(message, settings)
+        if question:
+            cache_version = self.answer_cache_version(guild_id)
+            cached = self.answer_cache.get(guild_id, question, cache_version, settings['answer_cache_similarity'])
+            if cached:
+                await self.send_cached_answer(message, cached, settings)
+                return
+        
+        worker_manager = self.bot.get_cog('WorkerManager')
+        if worker_manager and not worker_manager.pool:
+            worker_manager = None
+        
+        # Stage 1: reply context, history and images (all may hit I/O) load
+        # together. Workers keep their own history cache, so with workers
+        # the history is not loaded here
+        if context_message is None:
+            reply = asyncio.ensure_future(self.timed(timings, 'reply', self.resolve_reply(message)))
+        else:
+            reply = asyncio.get_running_loop().create_future()
+            reply.set_result(context_message)
+        
+        stages = [reply, self.timed(timings, 'images', self.load_images(message, reply, settings['max_images']))]
+        if not worker_manager:
+            stages.append(self.timed(timings, 'history', self.load_history(guild_id, channel_id, max_messages)))
+        context_message, images, *history = await asyncio.gather(*stages)
+        conversation_history = history[0] if history else None
         
         # Build message content
         user_content = message.content.replace(f'<@{self.bot.user.id}>', '').strip()
@@ -185,91 +508,271 @@ Always be respectful, helpful, and maintain a positive tone. You have access to
         if context_message:
             user_content = f"[Context - replying to message from {context_message.author.display_name}]: \"{context_message.content}\"\n\n{user_content}"
         
-        # Check for images
-        if message.attachments:
-            image_urls = [att.url for att in message.attachments if att.content_type and att.content_type.startswith('image/')]
-            if image_urls:
-                user_content += f"\n\n[User attached {len(image_urls)} image(s)]"
-        
-        # Get conversation history
-        conversation_history = self.memory_manager.get_conversation_context(message) if self.memory_manager else []
-        
-        # Check if user is admin
-        is_admin = message.author.guild_permissions.administrator
-        
-        # Build messages for OpenAI
-        messages = [
-            {"role": "system", "content": self.system_prompt}
-        ]
-        messages.extend(conversation_history)
-        messages.append({
-            "role": "user",
-            "content": f"[{message.author.display_name}]: {user_content}"
-        })
+        # Note images in the text too: the stored history keeps only this
+        # note, the image data is sent with this turn alone
+        attached = image_attachments(message)
+        if attached:
+            user_content += f"\n\n[User attached {len(attached)} image(s)]"
         
+        # Everything the model half of the pipeline needs, as plain data
+        job = {
+            'guild_id': guild_id,
+            'channel_id': channel_id,
+            'user_id': str(message.author.id),
+            'display_name': message.author.display_name,
+            'is_admin': message.author.guild_permissions.administrator,
+            'content': user_content,
+            'images': [image.to_content_part() for image in images],
+            'image_tokens': sum(image.tokens for image in images),
+            'settings': dict(settings)
+        }
+        
+        result = None
+        try:
+            # Stage 2-4: prompt, model call and storage, here or in a worker
+            if worker_manager:
+                result = await self.timed(timings, 'worker', worker_manager.submit(job))
+            else:
+                result = await self.generate(job, conversation_history)
+            timings.update(result['timings'])
+            
+            if result['error'] == 'provider':
+                await deliver(self.bot, message.channel, f"Sorry {message.author.display_name}, my AI provider is overloaded right now. Please try again in a minute.")
+            elif result['error']:
+                await deliver(self.bot, message.channel, f"Sorry {message.author.display_name}, I encountered an error processing your message. Please try again.")
+            else:
+                # Stage 5: run tools and deliver the reply
+                await self.timed(timings, 'respond', self.handle_response(message, result))
+                if question:
+                    self.store_answer(message, question, cache_version, result)
+        
+        except WorkerPoolBusy:
+            await deliver(
+                self.bot, message.channel,
+                f"⏳ {message.author.display_name}, I'm getting a lot of requests right now. Please try again in a few seconds."
+            )
+        
+        except Exception as e:
+            print(f"Error processing message: {e}")
+            await deliver(self.bot, message.channel, f"Sorry {message.author.display_name}, I encountered an error processing your message. Please try again.")
+        
+        finally:
+            timings['total'] = (time.perf_counter() - total_start) * 1000
+            self.record_timings(timings)
+            if result is not None:
+                if 'model' in result['timings']:
+                    usage = result['usage'] or {}
+                    self.router.record(
+                        result['decision'], result['timings']['model'],
+                        usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0),
+                        failed=result['usage'] is None
+                    )
+                if quota_manager and result['usage']:
+                    await quota_manager.record_tokens(message, result['usage']['prompt_tokens'] + result['usage']['completion_tokens'])
+    
+    async def generate(self, job: Dict, conversation_history: Optional[List[HistoryMessage]] = None) -> Dict:
+        """Build the prompt, call the model and store both turns of a job.
+        
+        This half of the pipeline needs no Discord objects, so it runs the
+        same way in the bot process and in worker processes. Returns the
+        reply, the tool calls for the caller to execute, the measured token
+        usage and the stage timings; errors are reported in `error`
+        ('provider' or 'error') instead of being raised.
+        """
+        timings = {}
+        guild_id = job['guild_id']
+        channel_id = job['channel_id']
+        settings = job['settings']
+        max_messages = settings['context_messages']
+        
+        if conversation_history is None:
+            conversation_history = await self.timed(timings, 'history', self.load_history(guild_id, channel_id, max_messages))
+        
+        self.refresh_system_prompt()
+        
+        # Stage 2: build the request
+        prepare_start = time.perf_counter()
+        
+        is_admin = job['is_admin']
+        tools = self.get_tools(is_admin, settings['enabled_tools'])
+        
+        # Build messages for OpenAI with a cache-friendly, stable prefix
+        window = self.prompt_assembler.select_window((guild_id, channel_id), conversation_history, max_messages)
+        messages = self.prompt_assembler.build(
+            self.system_prompt,
+            window,
+            f"[{job['display_name']}]: {job['content']}"
+        )
+        if job['images']:
+            # Images go last, after the cacheable prefix
+            messages[-1]['content'] = [{"type": "text", "text": messages[-1]['content']}, *job['images']]
+        
+        # Pick the fast or strong model from cheap local signals, counting
+        # only the history that is actually sent
+        history_tokens = sum(msg.token_count for msg in window)
+        decision = self.router.route(job['content'], is_admin, history_tokens, settings, len(job['images']))
+        
+        timings['prepare'] = (time.perf_counter() - prepare_start) * 1000
+        
+        # Stage 3: save the user turn while the model is working. A failed
+        # write is logged and does not cost the user the reply
+        async def persist_user_turn():
+            try:
+                await self.memory_manager.store_record(
+                    guild_id, channel_id, job['user_id'], job['display_name'], "user", job['content'],
+                    settings['max_memory_tokens']
+                )
+            except Exception as e:
+                print(f"Error storing user message: {e}")
+        
+        persist_task = None
+        if self.memory_manager:
+            persist_task = asyncio.create_task(self.timed(timings, 'persist', persist_user_turn()))
+        
+        result = {
+            'decision': decision,
+            'reply': None,
+            'tool_calls': [],
+            'usage': None,
+            'error': None,
+            'timings': timings
+        }
+        
+        response = None
         try:
             # Make OpenAI API call
-            response = await self.call_openai(messages, is_admin)
+            response = await self.timed(timings, 'model', self.call_openai(messages, is_admin, tools, settings, decision))
             
-            # Save user message to memory
-            if self.memory_manager:
-                await self.memory_manager.add_message_to_memory(message, "user", user_content)
+            # The assistant reply must be stored after the user turn
+            if persist_task:
+                await persist_task
             
-            # Process response
-            await self.handle_response(message, response)
+            response_message = response.choices[0].message
+            for tool_call in response_message.tool_calls or []:
+                result['tool_calls'].append((tool_call.function.name, json.loads(tool_call.function.arguments)))
             
+            if response_message.content:
+                # Save assistant response to memory, sized by the provider's
+                # completion count when available
+                if self.memory_manager:
+                    usage = getattr(response, 'usage', None)
+                    try:
+                        await self.memory_manager.store_record(
+                            guild_id, channel_id, job['user_id'], job['display_name'], "assistant",
+                            response_message.content, settings['max_memory_tokens'],
+                            usage.completion_tokens if usage else None
+                        )
+                    except Exception as e:
+                        print(f"Error storing assistant message: {e}")
+                result['reply'] = response_message.content
+        
+        except ProviderUnavailableError as e:
+            print(f"AI provider unavailable: {e} ({e.__cause__})")
+            result['error'] = 'provider'
+        
         except Exception as e:
-            print(f"Error processing message: {e}")
-            await message.channel.send(f"Sorry {message.author.display_name}, I encountered an error processing your message. Please try again.")
+            print(f"Error generating response: {e}")
+            result['error'] = 'error'
+        
+        finally:
+            if persist_task and not persist_task.done():
+                await asyncio.wait([persist_task])
+            if 'model' in timings:
+                await self.log_route(guild_id, channel_id, decision, job['content'], history_tokens, timings['model'], response)
+            if response is not None:
+                result['usage'] = await self.measure_usage(job, response, messages)
+        
+        return result
     
-    async def call_openai(self, messages: List[Dict], is_admin: bool):
-        """Call OpenAI API using new client structure (v1.0.0+)."""
+    async def call_openai(self, messages: List[Dict], is_admin: bool, tools: List[Dict] = None,
+                          settings: Dict = None, decision: RouteDecision = None):
+        """Call OpenAI API through the resilient client (retries and fallback models).
+        
+        `settings` are the guild's settings and `decision` the router's
+        choice of model and reply length (the guild's model and
+        `max_response_tokens` when omitted).
+        """
         if not self.openai_client:
             raise Exception("OpenAI client is not configured")
         
-        tools = self.get_available_tools(is_admin)
-        ai_model = os.getenv('AI_MODEL')
-        # Use new AsyncOpenAI client structure
-        response = await self.openai_client.chat.completions.create(
-            model=ai_model,
-            messages=messages,
+        if settings is None:
+            settings = DEFAULT_SETTINGS
+        if decision is None:
+            decision = RouteDecision('strong', settings['ai_model'], settings['max_response_tokens'], ())
+        if tools is None:
+            tools = self.get_tools(is_admin, settings['enabled_tools'])
+        response = await self.openai_client.create(
+            messages,
+            model=decision.model,
             tools=tools if tools else None,
             tool_choice="auto" if tools else None,
-            temperature=0.7,
-            max_tokens=2000
+            temperature=settings['temperature'],
+            max_tokens=decision.max_tokens
         )
         
+        self.prompt_assembler.record_usage(getattr(response, 'usage', None))
+        
         return response
     
-    async def handle_response(self, message: discord.Message, response):
-        """Handle the AI response and execute any tool calls."""
-        # Get the first choice from response
-        choice = response.choices[0]
-        response_message = choice.message
-        
-        # Check if there are tool calls (new structure uses tool_calls attribute)
-        if response_message.tool_calls:
-            for tool_call in response_message.tool_calls:
-                function_name = tool_call.function.name
-                function_args = json.loads(tool_call.function.arguments)
-                
-                # Execute the tool
-                result = await self.execute_tool(message, function_name, function_args)
-                
-                # Send result message
-                if result:
-                    await message.channel.send(result)
-        
-        # Send the text response
-        if response_message.content:
-            response_text = response_message.content
-            
-            # Save assistant response to memory
-            if self.memory_manager:
-                await self.memory_manager.add_message_to_memory(message, "assistant", response_text)
-            
-            # Split long messages
-            await self.send_long_message(message.channel, response_text)
+    async def log_route(self, guild_id: str, channel_id: str, decision: RouteDecision, user_content: str,
+                        history_tokens: int, latency_ms: float, response):
+        """Record a routing decision with its latency and token cost, for tuning the thresholds."""
+        usage = getattr(response, 'usage', None)
+        prompt_tokens = (usage.prompt_tokens or 0) if usage else 0
+        completion_tokens = (usage.completion_tokens or 0) if usage else 0
+        model = getattr(response, 'model', None) or decision.model
+        
+        reasons = ','.join(decision.reasons)
+        print(
+            f"Route {decision.route} ({reasons or 'simple'}) -> {model}: "
+            f"{latency_ms:,.0f} ms, {prompt_tokens}+{completion_tokens} tokens"
+        )
+        
+        try:
+            await asyncio.to_thread(
+                self.db.log_model_route,
+                guild_id, channel_id, decision.route, model, reasons,
+                len(user_content), history_tokens, round(latency_ms, 1),
+                prompt_tokens, completion_tokens, response is not None
+            )
+        except Exception as e:
+            print(f"Error logging model route: {e}")
+    
+    async def measure_usage(self, job: Dict, response, messages: List[Dict]) -> Dict:
+        """Record the response's token usage; returns the prompt and completion token counts."""
+        usage = getattr(response, 'usage', None)
+        if not self.memory_manager:
+            return {
+                'prompt_tokens': (usage.prompt_tokens or 0) if usage else 0,
+                'completion_tokens': (usage.completion_tokens or 0) if usage else 0
+            }
+        
+        try:
+            return await self.memory_manager.record_usage(
+                job['guild_id'], job['channel_id'], job['user_id'], response, messages, job['image_tokens']
+            )
+        except Exception as e:
+            print(f"Error recording token usage: {e}")
+            return {'prompt_tokens': 0, 'completion_tokens': 0}
+    
+    async def handle_response(self, message: discord.Message, result: Dict):
+        """Execute the reply's tool calls and deliver the results with the reply text."""
+        # Tool results and the reply are delivered together, merged into as
+        # few Discord messages as possible
+        parts = []
+        
+        for function_name, function_args in result['tool_calls']:
+            # Execute the tool
+            tool_result = await self.execute_tool(message, function_name, function_args)
+            if tool_result:
+                parts.append(tool_result)
+        
+        # Add the text response
+        if result['reply']:
+            parts.append(result['reply'])
+        
+        if parts:
+            await deliver(self.bot, message.channel, *parts)
     
     async def execute_tool(self, message: discord.Message, function_name: str, function_args: Dict) -> str:
         """Execute a tool function."""
@@ -300,38 +803,21 @@ Always be respectful, helpful, and maintain a positive tone. You have access to
             elif function_name == "user_activity_check" and self.admin_tools:
                 return await self.admin_tools.user_activity_tool(message, function_args.get('user_mention'))
             
+            elif function_name == "search_history" and self.admin_tools:
+                return await self.admin_tools.search_history_tool(
+                    message,
+                    function_args.get('query'),
+                    function_args.get('user_mention'),
+                    function_args.get('channel_mention'),
+                    function_args.get('days')
+                )
+            
             else:
                 return f"Tool '{function_name}' not available or not implemented."
         
         except Exception as e:
             return f"Error executing tool '{function_name}': {str(e)}"
     
-    async def send_long_message(self, channel, text: str):
-        """Split and send long messages (>2000 characters)."""
-        if len(text) <= 2000:
-            await channel.send(text)
-        else:
-            # Split by paragraphs first
-            chunks = []
-            current_chunk = ""
-            
-            for line in text.split('\n'):
-                if len(current_chunk) + len(line) + 1 <= 2000:
-                    current_chunk += line + '\n'
-                else:
-                    if current_chunk:
-                        chunks.append(current_chunk.strip())
-                    current_chunk = line + '\n'
-            
-            if current_chunk:
-                chunks.append(current_chunk.strip())
-            
-            # Send all chunks
-            for i, chunk in enumerate(chunks):
-                if i > 0:
-                    chunk = f"*(continued)*\n{chunk}"
-                await channel.send(chunk)
-    
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         """Listen for messages that mention the bot."""
@@ -347,16 +833,113 @@ Always be respectful, helpful, and maintain a positive tone. You have access to
         if self.bot.user not in message.mentions:
             return
         
-        # Check if this is a reply to another message
-        context_message = None
-        if message.reference and message.reference.message_id:
-            try:
-                context_message = await message.channel.fetch_message(message.reference.message_id)
-            except:
-                pass
+        # Process the message (reply context is resolved inside the pipeline)
+        await self.process_message(message)
+    
+    @commands.command(name='pipeline_stats')
+    @commands.has_permissions(administrator=True)
+    async def pipeline_stats(self, ctx):
+        """Show average time spent in each message processing stage."""
+        if not self.stage_count:
+            await ctx.send("No messages processed yet.")
+            return
+        
+        embed = discord.Embed(
+            title="⏱️ Pipeline Timings",
+            description=f"Averages over {self.stage_count:,} messages",
+            color=discord.Color.blue()
+        )
+        for stage in ('quota', 'reply', 'images', 'history', 'worker', 'prepare', 'persist', 'model', 'respond', 'total'):
+            if stage in self.stage_totals:
+                embed.add_field(
+                    name=stage.capitalize(),
+                    value=f"{self.stage_totals[stage] / self.stage_count:,.1f} ms (last {self.last_timings.get(stage, 0):,.1f} ms)",
+                    inline=True
+                )
+        
+        prompt_stats = self.prompt_assembler.get_stats()
+        embed.add_field(
+            name="Prompt Cache",
+            value=(
+                f"{prompt_stats['hit_rate']}% of requests hit ({prompt_stats['cache_hits']:,}/{prompt_stats['requests']:,})\n"
+                f"{prompt_stats['cached_tokens']:,} of {prompt_stats['prompt_tokens']:,} prompt tokens cached ({prompt_stats['cached_ratio']}%)"
+            ),
+            inline=False
+        )
+        
+        image_stats = self.image_processor.get_stats()
+        if image_stats['images'] or image_stats['failed'] or image_stats['too_large']:
+            embed.add_field(
+                name="Images",
+                value=(
+                    f"{image_stats['images']:,} sent, {image_stats['cache_hits']:,} from cache ({image_stats['hit_rate']}%), "
+                    f"{image_stats['too_large']:,} too large, {image_stats['failed']:,} failed\n"
+                    f"{image_stats['downloaded_bytes'] / 1024 / 1024:,.1f} MiB downloaded, "
+                    f"{image_stats['sent_bytes'] / 1024 / 1024:,.1f} MiB sent, ~{image_stats['tokens']:,} image tokens"
+                ),
+                inline=False
+            )
+        
+        delivery_manager = self.bot.get_cog('DeliveryManager')
+        if delivery_manager:
+            delivery_stats = delivery_manager.get_stats()
+            embed.add_field(
+                name="Delivery",
+                value=(
+                    f"{delivery_stats['parts']:,} parts sent as {delivery_stats['messages']:,} messages\n"
+                    f"{delivery_stats['paced']:,} sends paced ({delivery_stats['paced_seconds']:,.1f} s), "
+                    f"{delivery_stats['rate_limited']:,} rate limited\n"
+                    f"{delivery_stats['active_channels']:,} active channels, {delivery_stats['queued']:,} queued"
+                ),
+                inline=False
+            )
+        
+        route_stats = self.router.get_stats()
+        if route_stats:
+            embed.add_field(
+                name="Model Routes",
+                value="\n".join(
+                    f"{route.capitalize()}: {stats['requests']:,} requests, {stats['avg_latency_ms']:,.0f} ms avg, "
+                    f"{stats['avg_completion_tokens']:,} reply tokens avg"
+                    for route, stats in sorted(route_stats.items())
+                ),
+                inline=False
+            )
+        
+        await ctx.send(embed=embed)
+    
+    @commands.command(name='routing_stats')
+    @commands.has_permissions(administrator=True)
+    async def routing_stats(self, ctx, days: int = 7):
+        """Show how requests were split between the fast and strong models."""
+        summary = await asyncio.to_thread(self.db.get_routing_summary, str(ctx.guild.id), days)
+        
+        if not summary:
+            await ctx.send(f"No model requests in the last {days} days.")
+            return
+        
+        total = sum(row['requests'] for row in summary)
+        embed = discord.Embed(
+            title="🔀 Model Routing",
+            description=(
+                f"{total:,} requests in the last {days} days\n"
+                f"Fast model: {self.router.fast_model or 'not configured (set AI_FAST_MODEL)'}"
+            ),
+            color=discord.Color.blue()
+        )
+        
+        for row in summary[:20]:
+            embed.add_field(
+                name=f"{row['route'].capitalize()} · {row['model'] or 'default'}",
+                value=(
+                    f"{row['requests']:,} requests ({row['requests'] / total * 100:.0f}%), {row['failures']:,} failed\n"
+                    f"{row['avg_latency_ms']:,.0f} ms avg\n"
+                    f"{row['avg_prompt_tokens']:,} + {row['avg_completion_tokens']:,} tokens avg"
+                ),
+                inline=True
+            )
         
-        # Process the message
-        await self.process_message(message, context_message)
+        await ctx.send(embed=embed)
 
 async def setup(bot):
     """Setup function to load the cog."""
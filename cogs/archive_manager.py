@@ -0,0 +1,112 @@
+import discord
+from discord.ext import commands, tasks
+from storage import get_storage
+from datetime import datetime, timedelta
+import asyncio
+import os
+
+class ArchiveManager(commands.Cog):
+    """Moves old conversation history into compressed archive segments."""
+    
+    def __init__(self, bot):
+        self.bot = bot
+        self.db = get_storage()
+        
+        # Rows older than this many days are archived (0 disables age-based archival)
+        self.archive_after_days = int(os.getenv('ARCHIVE_AFTER_DAYS', '30'))
+        interval_hours = float(os.getenv('ARCHIVE_INTERVAL_HOURS', '6'))
+        
+        self.last_run = None
+        self.lock = asyncio.Lock()
+        
+        self.archive_task.change_interval(hours=interval_hours)
+        self.archive_task.start()
+    
+    def cog_unload(self):
+        """Stop the scheduled archival when the cog is unloaded."""
+        self.archive_task.cancel()
+    
+    async def run_archival(self) -> dict:
+        """Archive old history and vacuum the hot database."""
+        async with self.lock:
+            archived = 0
+            if self.archive_after_days > 0:
+                cutoff = (datetime.utcnow() - timedelta(days=self.archive_after_days)).strftime('%Y-%m-%d %H:%M:%S')
+                # Run in a thread so large archival batches never block the gateway
+                archived = await asyncio.to_thread(self.db.archive_messages, before=cutoff)
+            
+            # Cached context windows may still hold rows that were just archived
+            memory_manager = self.bot.get_cog('MemoryManager')
+            if archived and memory_manager:
+                memory_manager.invalidate_context()
+            
+            freed_pages = await asyncio.to_thread(self.db.vacuum)
+            
+            self.last_run = {
+                'time': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+                'archived': archived,
+                'freed_pages': freed_pages
+            }
+            print(f"Archival complete: {archived} messages archived, {freed_pages} pages freed")
+            return self.last_run
+    
+    @tasks.loop(hours=6)
+    async def archive_task(self):
+        """Scheduled archival run."""
+        try:
+            await self.run_archival()
+        except Exception as e:
+            print(f"Error during archival: {e}")
+    
+    @archive_task.before_loop
+    async def before_archive_task(self):
+        await self.bot.wait_until_ready()
+    
+    @commands.command(name='archive_stats')
+    @commands.has_permissions(administrator=True)
+    async def archive_stats(self, ctx):
+        """Show hot and archived conversation history for this server."""
+        stats = await asyncio.to_thread(self.db.get_archive_stats, str(ctx.guild.id))
+        
+        ratio = stats['raw_bytes'] / stats['compressed_bytes'] if stats['compressed_bytes'] else 0
+        
+        embed = discord.Embed(
+            title="📦 Archive Statistics",
+            color=discord.Color.blue()
+        )
+        embed.add_field(name="Active Messages", value=f"{stats['hot_messages']:,}", inline=True)
+        embed.add_field(name="Archived Messages", value=f"{stats['archived_messages']:,}", inline=True)
+        embed.add_field(name="Segments", value=f"{stats['segments']:,}", inline=True)
+        embed.add_field(
+            name="Archive Size",
+            value=f"{stats['compressed_bytes'] / 1024:,.1f} KiB ({ratio:.1f}x compression)",
+            inline=True
+        )
+        embed.add_field(name="Oldest Archived", value=stats['oldest_archived'] or "—", inline=True)
+        embed.add_field(
+            name="Policy",
+            value=f"Archive after {self.archive_after_days} days" if self.archive_after_days > 0 else "Age-based archival disabled",
+            inline=False
+        )
+        if self.last_run:
+            embed.set_footer(text=f"Last run {self.last_run['time']} UTC: {self.last_run['archived']} archived, {self.last_run['freed_pages']} pages freed")
+        
+        await ctx.send(embed=embed)
+    
+    @commands.command(name='archive_now')
+    @commands.has_permissions(administrator=True)
+    async def archive_now(self, ctx):
+        """Run archival and vacuum immediately."""
+        async with ctx.typing():
+            result = await self.run_archival()
+        
+        embed = discord.Embed(
+            title="📦 Archival Complete",
+            description=f"Archived {result['archived']:,} messages and freed {result['freed_pages']:,} database pages.",
+            color=discord.Color.green()
+        )
+        await ctx.send(embed=embed)
+
+async def setup(bot):
+    """Setup function to load the cog."""
+    await bot.add_cog(ArchiveManager(bot))
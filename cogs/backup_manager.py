@@ -0,0 +1,195 @@
+import discord
+from discord.ext import commands, tasks
+from database import DatabaseManager
+from storage import get_storage
+from backup import create_snapshot, list_snapshots, prune_snapshots, restore_snapshot
+from datetime import datetime
+import asyncio
+import os
+
+class BackupManager(commands.Cog):
+    """Scheduled online backups of the bot databases, with retention and restore."""
+    
+    def __init__(self, bot):
+        self.bot = bot
+        self.db = get_storage()
+        
+        self.backup_dir = os.getenv('BACKUP_DIR', 'backups')
+        self.keep = int(os.getenv('BACKUP_KEEP', '7'))
+        self.compress = os.getenv('BACKUP_COMPRESS', 'true').lower() in ('1', 'true', 'yes', 'on')
+        self.pages_per_step = int(os.getenv('BACKUP_PAGES_PER_STEP', '1024'))
+        interval_hours = float(os.getenv('BACKUP_INTERVAL_HOURS', '24'))
+        
+        self.last_run = None
+        self.lock = asyncio.Lock()
+        
+        # Snapshots copy the SQLite files; other backends have their own
+        # backup tooling (pg_dump, replicas)
+        self.enabled = isinstance(self.db, DatabaseManager)
+        if not self.enabled:
+            print("Backups disabled: the storage backend is not SQLite")
+        
+        # 0 disables scheduled backups; !backup_now still works
+        if self.enabled and interval_hours > 0:
+            self.backup_task.change_interval(hours=interval_hours)
+            self.backup_task.start()
+    
+    def cog_unload(self):
+        """Stop scheduled backups when the cog is unloaded."""
+        self.backup_task.cancel()
+    
+    @property
+    def database_paths(self):
+        return [self.db.db_path, self.db.archive_path]
+    
+    async def run_backup(self, label: str = '', probe: bool = False) -> dict:
+        """Snapshot both databases and apply the retention policy.
+        
+        With `probe`, write latency on the main database is measured while
+        the copy runs (see WriteProbe); this briefly adds a table to it.
+        """
+        if not self.enabled:
+            raise RuntimeError("backups are only available with the SQLite storage backend")
+        
+        async with self.lock:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            
+            # Runs in a thread; the copy reads a WAL snapshot, so message
+            # handling keeps writing while it runs
+            result = await asyncio.to_thread(
+                create_snapshot, self.database_paths, self.backup_dir,
+                self.pages_per_step, 0.005, self.compress, label,
+                self.db.db_path if probe else None
+            )
+            # A labelled (pre-restore) snapshot must not prune the snapshot
+            # that is about to be restored; scheduled runs prune each label
+            # to BACKUP_KEEP separately
+            result['pruned'] = [] if label else await asyncio.to_thread(prune_snapshots, self.backup_dir, self.keep)
+            result['time'] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+            
+            self.last_run = result
+            print(f"Backup {result['name']} complete: {result['pages']} pages in {result['seconds']:.2f}s, "
+                  f"{result['stored_bytes'] / 1024 / 1024:.1f} MiB stored, {len(result['pruned'])} old snapshots removed"
+                  + (f", write latency {self.format_latency(result)}" if probe else ""))
+            return result
+    
+    @staticmethod
+    def format_latency(result: dict) -> str:
+        """Write latency during a backup run compared with before it."""
+        during = result['write_latency']
+        idle = result['idle_write_latency']
+        return (
+            f"p50 {during['p50_ms']:.1f} ms, p99 {during['p99_ms']:.1f} ms, max {during['max_ms']:.1f} ms "
+            f"over {during['samples']:,} writes (idle p50 {idle['p50_ms']:.1f} ms, p99 {idle['p99_ms']:.1f} ms)"
+        )
+    
+    @tasks.loop(hours=24)
+    async def backup_task(self):
+        """Scheduled backup run."""
+        try:
+            await self.run_backup()
+        except Exception as e:
+            print(f"Error during backup: {e}")
+    
+    @backup_task.before_loop
+    async def before_backup_task(self):
+        await self.bot.wait_until_ready()
+    
+    @commands.command(name='backup_now')
+    @commands.has_permissions(administrator=True)
+    async def backup_now(self, ctx, option: str = None):
+        """Take a database snapshot immediately.
+        
+        `!backup_now --probe` also measures write latency during the copy.
+        """
+        if option not in (None, '--probe'):
+            await ctx.send("❌ Usage: `!backup_now [--probe]`")
+            return
+        
+        async with ctx.typing():
+            try:
+                result = await self.run_backup(probe=option == '--probe')
+            except Exception as e:
+                await ctx.send(f"❌ Backup failed: {str(e)}")
+                return
+        
+        embed = discord.Embed(
+            title="💾 Backup Complete",
+            description=f"Snapshot `{result['name']}` written in {result['seconds']:.2f}s.",
+            color=discord.Color.green()
+        )
+        embed.add_field(name="Database Size", value=f"{result['bytes'] / 1024 / 1024:,.1f} MiB", inline=True)
+        embed.add_field(name="Stored", value=f"{result['stored_bytes'] / 1024 / 1024:,.1f} MiB", inline=True)
+        embed.add_field(name="Removed Old Snapshots", value=str(len(result['pruned'])), inline=True)
+        if 'write_latency' in result:
+            embed.add_field(name="Write Latency During Backup", value=self.format_latency(result), inline=False)
+        await ctx.send(embed=embed)
+    
+    @commands.command(name='backups')
+    @commands.has_permissions(administrator=True)
+    async def backups(self, ctx):
+        """List the stored database snapshots."""
+        snapshots = await asyncio.to_thread(list_snapshots, self.backup_dir)
+        
+        embed = discord.Embed(
+            title="💾 Database Snapshots",
+            description="\n".join(
+                f"`{snapshot['name']}` — {snapshot['bytes'] / 1024 / 1024:,.1f} MiB"
+                for snapshot in snapshots[:20]
+            ) or "No snapshots yet.",
+            color=discord.Color.blue()
+        )
+        embed.set_footer(text=f"Keeping the newest {self.keep} snapshots of each label in {self.backup_dir}/")
+        if self.last_run:
+            value = f"{self.last_run['time']} UTC, {self.last_run['seconds']:.2f}s"
+            if 'write_latency' in self.last_run:
+                value += f"\nWrite latency: {self.format_latency(self.last_run)}"
+            embed.add_field(name="Last Run", value=value, inline=False)
+        await ctx.send(embed=embed)
+    
+    @commands.command(name='restore_backup')
+    @commands.is_owner()
+    async def restore_backup(self, ctx, name: str):
+        """Restore the databases from a snapshot (bot owner only).
+        
+        The current state is saved as a `pre-restore` snapshot first.
+        """
+        async with ctx.typing():
+            try:
+                safety = await self.run_backup(label='pre-restore')
+                async with self.lock:
+                    await asyncio.to_thread(restore_snapshot, self.backup_dir, name, self.database_paths)
+            except Exception as e:
+                await ctx.send(f"❌ Restore failed: {str(e)}")
+                return
+        
+        # Cached settings, context windows (here and in worker processes),
+        # answers and quota buckets describe the old state
+        memory_manager = self.bot.get_cog('MemoryManager')
+        worker_manager = self.bot.get_cog('WorkerManager')
+        if memory_manager:
+            memory_manager.invalidate_context()
+        elif worker_manager and worker_manager.pool:
+            worker_manager.pool.invalidate()
+        quota_manager = self.bot.get_cog('QuotaManager')
+        if quota_manager:
+            await quota_manager.reload_buckets()
+        ai_handler = self.bot.get_cog('AIHandler')
+        if ai_handler:
+            ai_handler.answer_cache.clear()
+        settings_manager = self.bot.get_cog('SettingsManager')
+        if settings_manager:
+            settings_manager.store.clear()
+        
+        print(f"Databases restored from {name} by {ctx.author}")
+        
+        embed = discord.Embed(
+            title="💾 Restore Complete",
+            description=f"Restored from `{name}`. The previous state was saved as `{safety['name']}`.",
+            color=discord.Color.green()
+        )
+        await ctx.send(embed=embed)
+
+async def setup(bot):
+    """Setup function to load the cog."""
+    await bot.add_cog(BackupManager(bot))
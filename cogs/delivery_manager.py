@@ -0,0 +1,143 @@
+import discord
+from discord.ext import commands
+from delivery import RateWindow, pack_messages
+from typing import Dict, List
+import asyncio
+import os
+
+class DeliveryManager(commands.Cog):
+    """Outbound message delivery: one send queue per channel, paced to Discord's rate limits."""
+    
+    def __init__(self, bot):
+        self.bot = bot
+        
+        # Discord allows about 5 messages per 5 seconds per channel and 50
+        # requests per second per bot; staying under them avoids 429s
+        self.channel_limit = int(os.getenv('SEND_CHANNEL_LIMIT', '5'))
+        self.channel_period = float(os.getenv('SEND_CHANNEL_PERIOD', '5'))
+        self.global_window = RateWindow(int(os.getenv('SEND_GLOBAL_LIMIT', '45')), 1.0)
+        
+        # Idle channel workers exit after this many seconds
+        self.idle_timeout = 30.0
+        
+        self.queues: Dict[int, asyncio.Queue] = {}
+        self.workers: Dict[int, asyncio.Task] = {}
+        self.windows: Dict[int, RateWindow] = {}
+        self.stats = {
+            'requests': 0,
+            'parts': 0,
+            'messages': 0,
+            'paced': 0,
+            'paced_seconds': 0.0,
+            'rate_limited': 0
+        }
+    
+    def cog_unload(self):
+        """Stop all channel workers and cancel the sends still waiting in their queues."""
+        for worker in self.workers.values():
+            worker.cancel()
+        
+        # Callers awaiting these would otherwise wait forever
+        for queue in self.queues.values():
+            while not queue.empty():
+                _, _, future = queue.get_nowait()
+                future.cancel()
+        
+        self.workers.clear()
+        self.queues.clear()
+        self.windows.clear()
+    
+    async def send(self, channel, *parts: str) -> List[discord.Message]:
+        """Queue texts for a channel and wait until they are sent.
+        
+        The parts are merged and split with a markdown-aware chunker, so they
+        go out in as few messages as possible. Messages to one channel are
+        sent in order, one request at a time.
+        """
+        chunks = pack_messages(list(parts))
+        if not chunks:
+            return []
+        
+        self.stats['requests'] += 1
+        self.stats['parts'] += sum(1 for part in parts if part and part.strip())
+        
+        future = asyncio.get_running_loop().create_future()
+        queue = self.queues.get(channel.id)
+        if queue is None:
+            queue = self.queues[channel.id] = asyncio.Queue()
+        await queue.put((channel, chunks, future))
+        
+        if channel.id not in self.workers:
+            self.workers[channel.id] = asyncio.create_task(self.channel_worker(channel.id, queue))
+        
+        return await future
+    
+    async def channel_worker(self, channel_id: int, queue: asyncio.Queue):
+        """Send queued messages of one channel in order; exit when idle."""
+        while True:
+            try:
+                channel, chunks, future = await asyncio.wait_for(queue.get(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    del self.workers[channel_id]
+                    del self.queues[channel_id]
+                    self.windows.pop(channel_id, None)
+                    return
+                continue
+            
+            try:
+                sent = []
+                for chunk in chunks:
+                    sent.append(await self.paced_send(channel, chunk))
+                if not future.done():
+                    future.set_result(sent)
+            except asyncio.CancelledError:
+                # Unloading: the message being sent is abandoned too
+                if not future.done():
+                    future.cancel()
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+    
+    async def paced_send(self, channel, content: str) -> discord.Message:
+        """Wait for a free slot in the channel and global windows, then send."""
+        window = self.windows.get(channel.id)
+        if window is None:
+            window = self.windows[channel.id] = RateWindow(self.channel_limit, self.channel_period)
+        
+        while True:
+            delay = max(window.delay(), self.global_window.delay())
+            if delay <= 0:
+                break
+            self.stats['paced'] += 1
+            self.stats['paced_seconds'] += delay
+            await asyncio.sleep(delay)
+        
+        window.record()
+        self.global_window.record()
+        
+        try:
+            message = await channel.send(content)
+        except discord.HTTPException as e:
+            if e.status != 429:
+                raise
+            # discord.py normally retries 429s itself; back off once if one escapes
+            self.stats['rate_limited'] += 1
+            await asyncio.sleep(getattr(e, 'retry_after', None) or self.channel_period)
+            message = await channel.send(content)
+        
+        self.stats['messages'] += 1
+        return message
+    
+    def get_stats(self) -> Dict:
+        """Get delivery counters."""
+        return {
+            **self.stats,
+            'active_channels': len(self.workers),
+            'queued': sum(queue.qsize() for queue in self.queues.values())
+        }
+
+async def setup(bot):
+    """Setup function to load the cog."""
+    await bot.add_cog(DeliveryManager(bot))
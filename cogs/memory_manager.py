@@ -1,16 +1,25 @@
 import discord
 from discord.ext import commands
-from database import DatabaseManager
+from storage import get_storage, HistoryMessage
+from typing import Dict, List, Optional, Tuple
+from context_cache import ContextCache
+from settings import get_guild_settings
 import tiktoken
+import asyncio
+import os
 
 class MemoryManager(commands.Cog):
     """Manages conversation memory and token tracking."""
     
     def __init__(self, bot):
         self.bot = bot
-        self.db = DatabaseManager()
-        self.max_tokens = 400000  # 400k token limit
+        self.db = get_storage()
         self.encoding = tiktoken.encoding_for_model("gpt-4")
+        
+        # Recent per-channel windows, so hot channels skip the database on reads
+        self.context_window = int(os.getenv('CONTEXT_MESSAGES', '50'))
+        cache_mb = float(os.getenv('CONTEXT_CACHE_MB', '32'))
+        self.context_cache = ContextCache(self.context_window, int(cache_mb * 1024 * 1024))
     
     def count_tokens(self, text: str) -> int:
         """Count tokens in a text string."""
@@ -20,55 +29,171 @@ class MemoryManager(commands.Cog):
             # Fallback: rough estimate
             return len(text) // 4
     
-    async def add_message_to_memory(self, message: discord.Message, role: str, content: str):
-        """Add a message to the conversation memory."""
-        guild_id = str(message.guild.id)
-        channel_id = str(message.channel.id)
-        user_id = str(message.author.id)
-        display_name = message.author.display_name
+    async def get_max_tokens(self, guild_id: str) -> int:
+        """Channel history size (in tokens) at which a guild's history is archived."""
+        return (await get_guild_settings(self.bot, guild_id))['max_memory_tokens']
+    
+    def store_message(self, guild_id: str, channel_id: str, user_id: str,
+                      display_name: str, role: str, content: str, max_tokens: int = 400000,
+                      token_count: Optional[int] = None):
+        """Count tokens and write a message to the database.
         
+        Blocking; called from a worker thread. `token_count` is the
+        provider-reported size when known; otherwise it is counted locally.
+        Returns the stored record and whether the channel's history was
+        archived to make room.
+        """
         # Count tokens
-        token_count = self.count_tokens(content)
+        if token_count is None:
+            token_count = self.count_tokens(content)
         
         # Check if we need to reset memory
+        archived = False
         total_tokens = self.db.get_total_tokens(guild_id, channel_id)
-        if total_tokens + token_count > self.max_tokens:
-            print(f"Token limit reached ({total_tokens + token_count}), resetting conversation for channel {channel_id}")
-            self.db.reset_conversation(guild_id, channel_id)
+        if total_tokens + token_count > max_tokens:
+            # Start a fresh context window but keep the old one in the archive
+            print(f"Token limit reached ({total_tokens + token_count}), archiving conversation for channel {channel_id}")
+            self.db.archive_messages(guild_id, channel_id)
+            archived = True
         
         # Add message to database
-        self.db.add_message(guild_id, channel_id, user_id, display_name, role, content, token_count)
+        record = self.db.add_message(guild_id, channel_id, user_id, display_name, role, content, token_count)
         
-        # Update user profile
-        self.db.update_user_profile(user_id, display_name, guild_id)
+        # Update the member's profile and activity rollups (user turns only)
+        if role == 'user':
+            self.db.record_user_activity(guild_id, channel_id, user_id, display_name, token_count, record.timestamp)
+        
+        return record, archived
     
-    def get_conversation_context(self, message: discord.Message, max_messages: int = 50):
-        """Retrieve conversation context for AI processing."""
+    async def add_message_to_memory(self, message: discord.Message, role: str, content: str,
+                                    token_count: Optional[int] = None):
+        """Add a message to the conversation memory.
+        
+        Pass `token_count` for assistant replies (the response's
+        `usage.completion_tokens`) to skip local tokenization.
+        """
         guild_id = str(message.guild.id)
-        channel_id = str(message.channel.id)
+        await self.store_record(
+            guild_id, str(message.channel.id), str(message.author.id), message.author.display_name,
+            role, content, await self.get_max_tokens(guild_id), token_count
+        )
+    
+    async def store_record(self, guild_id: str, channel_id: str, user_id: str, display_name: str,
+                           role: str, content: str, max_tokens: int, token_count: Optional[int] = None):
+        """Store a message and add it to the channel's cached window."""
+        key = (guild_id, channel_id)
+        
+        # Tokenizing and SQLite writes run off the event loop; the cache is
+        # only touched from the loop
+        record, archived = await asyncio.to_thread(
+            self.store_message, guild_id, channel_id, user_id,
+            display_name, role, content, max_tokens, token_count
+        )
+        
+        if archived:
+            self.context_cache.discard(key)
+        self.context_cache.append(key, record)
+    
+    def measure_usage(self, usage, prompt_messages: List[Dict], reply_text: str, image_tokens: int = 0) -> Dict:
+        """Token usage of one response: provider-reported, or counted locally if missing.
+        
+        Local counts use the gpt-4 encoding and are flagged as estimated,
+        since they may not match the model that answered; images count as
+        `image_tokens`.
+        """
+        if usage is not None and usage.prompt_tokens is not None:
+            details = getattr(usage, 'prompt_tokens_details', None)
+            return {
+                'prompt_tokens': usage.prompt_tokens,
+                'completion_tokens': usage.completion_tokens or 0,
+                'cached_tokens': (getattr(details, 'cached_tokens', None) or 0) if details else 0,
+                'estimated': False
+            }
+        
+        prompt_tokens = image_tokens
+        for msg in prompt_messages:
+            content = msg.get('content')
+            if isinstance(content, list):
+                content = ' '.join(part['text'] for part in content if part.get('type') == 'text')
+            if isinstance(content, str):
+                prompt_tokens += self.count_tokens(content)
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': self.count_tokens(reply_text or ''),
+            'cached_tokens': 0,
+            'estimated': True
+        }
+    
+    def store_usage(self, guild_id: str, channel_id: str, user_id: str, model: Optional[str],
+                    usage, prompt_messages: List[Dict], reply_text: str, image_tokens: int = 0) -> Dict:
+        """Measure and record one response's usage. Blocking; called from a worker thread."""
+        measured = self.measure_usage(usage, prompt_messages, reply_text, image_tokens)
+        self.db.record_usage(
+            guild_id, channel_id, user_id, model,
+            measured['prompt_tokens'], measured['completion_tokens'],
+            measured['cached_tokens'], measured['estimated']
+        )
+        return measured
+    
+    async def record_usage(self, guild_id: str, channel_id: str, user_id: str, response,
+                           prompt_messages: List[Dict], image_tokens: int = 0) -> Dict:
+        """Record the token usage of a model response for the usage reports.
+        
+        Returns the prompt, completion and cached token counts and whether
+        they were estimated locally.
+        """
+        usage = getattr(response, 'usage', None)
+        reply_text = response.choices[0].message.content if response.choices else ''
+        return await asyncio.to_thread(
+            self.store_usage, guild_id, channel_id, user_id,
+            getattr(response, 'model', None), usage, prompt_messages, reply_text, image_tokens
+        )
+    
+    async def load_history_window(self, guild_id: str, channel_id: str, max_messages: int = 50) -> List[HistoryMessage]:
+        """Get the most recent history records of a channel, cached when possible.
+        
+        Cache misses read storage in a worker thread; the window is only
+        cached if no write to the channel landed while the read was in flight.
+        """
+        key = (guild_id, channel_id)
         
-        history = self.db.get_conversation_history(guild_id, channel_id, max_messages)
+        cached = self.context_cache.get(key, max_messages)
+        if cached is not None:
+            return cached
         
-        # Format for OpenAI API
-        formatted_history = []
-        for msg in history:
-            formatted_history.append({
-                "role": msg['role'],
-                "content": f"[{msg['display_name']}]: {msg['content']}" if msg['role'] == 'user' else msg['content']
-            })
+        generation = self.context_cache.get_generation(key)
+        history = await asyncio.to_thread(
+            self.db.get_conversation_history, guild_id, channel_id, max(max_messages, self.context_window)
+        )
+        
+        # Skipped by put() if a write landed while the read was in flight
+        if max_messages <= self.context_window:
+            self.context_cache.put(key, history, generation)
+        
+        return history[-max_messages:]
+    
+    def invalidate_context(self, key: Optional[Tuple[str, str]] = None):
+        """Drop one channel's cached window (or all of them) here and in any worker processes."""
+        if key is None:
+            self.context_cache.clear()
+        else:
+            self.context_cache.invalidate(key)
         
-        return formatted_history
+        worker_manager = self.bot.get_cog('WorkerManager')
+        if worker_manager and worker_manager.pool:
+            worker_manager.pool.invalidate(key)
     
-    def get_token_usage(self, guild_id: str, channel_id: str) -> dict:
+    async def get_token_usage(self, guild_id: str, channel_id: str) -> dict:
         """Get current token usage for a channel."""
-        total_tokens = self.db.get_total_tokens(guild_id, channel_id)
-        percentage = (total_tokens / self.max_tokens) * 100
+        total_tokens = await asyncio.to_thread(self.db.get_total_tokens, guild_id, channel_id)
+        max_tokens = await self.get_max_tokens(guild_id)
+        percentage = (total_tokens / max_tokens) * 100
         
         return {
             'total_tokens': total_tokens,
-            'max_tokens': self.max_tokens,
+            'max_tokens': max_tokens,
             'percentage': round(percentage, 2),
-            'remaining': self.max_tokens - total_tokens
+            'remaining': max_tokens - total_tokens
         }
     
     @commands.command(name='memory_stats')
@@ -78,7 +203,8 @@ class MemoryManager(commands.Cog):
         guild_id = str(ctx.guild.id)
         channel_id = str(ctx.channel.id)
         
-        stats = self.get_token_usage(guild_id, channel_id)
+        stats = await self.get_token_usage(guild_id, channel_id)
+        cache_stats = self.context_cache.get_stats()
         
         embed = discord.Embed(
             title="💾 Memory Usage Statistics",
@@ -104,6 +230,84 @@ class MemoryManager(commands.Cog):
             value=f"{stats['max_tokens']:,} tokens",
             inline=False
         )
+        embed.add_field(
+            name="Context Cache",
+            value=(
+                f"{cache_stats['hit_rate']}% hit rate ({cache_stats['hits']:,} hits, {cache_stats['misses']:,} misses)\n"
+                f"{cache_stats['channels']:,} channels, {cache_stats['messages']:,} messages, "
+                f"{cache_stats['bytes'] / 1024 / 1024:,.1f} / {cache_stats['max_bytes'] / 1024 / 1024:,.0f} MiB"
+            ),
+            inline=False
+        )
+        
+        ai_handler = self.bot.get_cog('AIHandler')
+        answer_stats = ai_handler.answer_cache.get_stats(guild_id) if ai_handler else None
+        if answer_stats:
+            hits = answer_stats['hits'] + answer_stats['near_hits']
+            embed.add_field(
+                name="Answer Cache",
+                value=(
+                    f"{answer_stats['hit_rate']}% hit rate ({hits:,} hits, {answer_stats['near_hits']:,} near-duplicate, "
+                    f"{answer_stats['misses']:,} misses)\n"
+                    f"{answer_stats['entries']:,} answers cached, {answer_stats['invalidations']:,} invalidations\n"
+                    f"Saved {answer_stats['saved_tokens']:,} tokens and {answer_stats['saved_ms'] / 1000:,.1f}s of model time"
+                ),
+                inline=False
+            )
+        
+        await ctx.send(embed=embed)
+    
+    @commands.command(name='usage_report')
+    @commands.has_permissions(administrator=True)
+    async def usage_report(self, ctx, days: int = 7):
+        """Show model token usage for this server, per day and per model."""
+        guild_id = str(ctx.guild.id)
+        days = max(1, min(days, 90))
+        
+        daily = await asyncio.to_thread(self.db.get_daily_usage, guild_id, days)
+        totals = await asyncio.to_thread(self.db.get_usage_totals, guild_id)
+        
+        if not totals:
+            await ctx.send("No model usage recorded yet.")
+            return
+        
+        embed = discord.Embed(
+            title="📈 Token Usage",
+            description=f"Provider-reported tokens (prompt + completion), last {days} days",
+            color=discord.Color.blue()
+        )
+        
+        if daily:
+            lines = []
+            for row in daily:
+                line = (
+                    f"`{row['day']}` {row['requests']:,} req · "
+                    f"{row['prompt_tokens']:,} + {row['completion_tokens']:,} · "
+                    f"{row['cached_tokens']:,} cached"
+                )
+                if row['estimated_requests']:
+                    line += f" · {row['estimated_requests']:,} estimated"
+                lines.append(line)
+            embed.add_field(name="Per Day", value="\n".join(lines)[:1024], inline=False)
+            
+            period_requests = sum(row['requests'] for row in daily)
+            period_tokens = sum(row['prompt_tokens'] + row['completion_tokens'] for row in daily)
+            embed.add_field(
+                name="Period Total",
+                value=f"{period_requests:,} requests, {period_tokens:,} tokens",
+                inline=False
+            )
+        
+        for row in totals[:10]:
+            embed.add_field(
+                name=row['model'],
+                value=(
+                    f"{row['requests']:,} requests since {row['first_day']}\n"
+                    f"{row['prompt_tokens']:,} prompt ({row['cached_tokens']:,} cached)\n"
+                    f"{row['completion_tokens']:,} completion"
+                ),
+                inline=True
+            )
         
         await ctx.send(embed=embed)
     
@@ -114,7 +318,8 @@ class MemoryManager(commands.Cog):
         guild_id = str(ctx.guild.id)
         channel_id = str(ctx.channel.id)
         
-        self.db.reset_conversation(guild_id, channel_id)
+        await asyncio.to_thread(self.db.reset_conversation, guild_id, channel_id)
+        self.invalidate_context((guild_id, channel_id))
         
         embed = discord.Embed(
             title="🔄 Memory Reset",
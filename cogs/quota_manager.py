@@ -0,0 +1,190 @@
+import discord
+from discord.ext import commands, tasks
+from storage import get_storage
+from quota import TokenBucket
+from settings import get_guild_settings
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import os
+import time
+
+class QuotaManager(commands.Cog):
+    """Per-user, per-channel and per-guild rate limits for AI requests."""
+    
+    def __init__(self, bot):
+        self.bot = bot
+        self.db = get_storage()
+        
+        # Requests are queued for at most this many seconds before being rejected
+        self.max_wait = float(os.getenv('QUOTA_MAX_WAIT', '10'))
+        
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.metrics: Dict[str, Dict[str, int]] = {}
+    
+    async def cog_load(self):
+        """Restore bucket levels saved by a previous run and start persisting them."""
+        await self.reload_buckets()
+        self.persist_task.start()
+    
+    async def cog_unload(self):
+        """Stop the persistence loop and save bucket state one last time."""
+        self.persist_task.cancel()
+        await asyncio.to_thread(self.save_buckets)
+    
+    async def reload_buckets(self):
+        """Replace the in-memory buckets with the saved ones, e.g. on startup or after a restore."""
+        rows = await asyncio.to_thread(self.db.load_quota_buckets)
+        self.buckets = {
+            key: TokenBucket(capacity, level, updated) for key, capacity, level, updated in rows
+        }
+    
+    def save_buckets(self):
+        """Persist bucket levels, dropping buckets that have refilled completely."""
+        now = time.time()
+        for key, bucket in list(self.buckets.items()):
+            bucket.refill(now)
+            if bucket.is_full():
+                del self.buckets[key]
+        
+        rows = [(key, b.capacity, b.level, b.updated) for key, b in self.buckets.items()]
+        self.db.save_quota_buckets(rows)
+    
+    async def get_limits(self, guild_id: str) -> Dict:
+        """Get the effective per-minute limits of a guild from its settings."""
+        settings = await get_guild_settings(self.bot, guild_id)
+        return {
+            f"{scope}_{kind}": settings[f"quota_{scope}_{kind}"]
+            for scope in ('user', 'channel', 'guild')
+            for kind in ('requests', 'tokens')
+        }
+    
+    def get_metrics(self, guild_id: str) -> Dict[str, int]:
+        if guild_id not in self.metrics:
+            self.metrics[guild_id] = {'allowed': 0, 'queued': 0, 'rejected': 0}
+        return self.metrics[guild_id]
+    
+    def get_bucket(self, key: str, capacity: float) -> Optional[TokenBucket]:
+        """Get or create a bucket; a capacity of 0 means unlimited (no bucket)."""
+        if capacity <= 0:
+            return None
+        
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(capacity)
+        elif bucket.capacity != capacity:
+            bucket.set_capacity(capacity)
+        return bucket
+    
+    def scope_keys(self, guild_id: str, channel_id: str, user_id: str) -> List[Tuple[str, str]]:
+        """(scope, bucket key prefix) pairs for a message's author, channel and guild."""
+        return [
+            ('user', f"user:{guild_id}:{user_id}"),
+            ('channel', f"channel:{guild_id}:{channel_id}"),
+            ('guild', f"guild:{guild_id}")
+        ]
+    
+    def get_buckets(self, message: discord.Message, kind: str, limits: Dict) -> List[TokenBucket]:
+        """Get the user, channel and guild buckets of one kind ('requests' or 'tokens')."""
+        guild_id = str(message.guild.id)
+        buckets = []
+        for scope, prefix in self.scope_keys(guild_id, str(message.channel.id), str(message.author.id)):
+            bucket = self.get_bucket(f"{prefix}:{kind}", limits[f"{scope}_{kind}"])
+            if bucket:
+                buckets.append(bucket)
+        return buckets
+    
+    async def acquire(self, message: discord.Message) -> Tuple[bool, float]:
+        """Admit a request, queueing it briefly if a bucket is empty.
+        
+        Returns (allowed, retry_after). Requests that would have to wait
+        longer than QUOTA_MAX_WAIT seconds are rejected.
+        """
+        metrics = self.get_metrics(str(message.guild.id))
+        deadline = time.monotonic() + self.max_wait
+        queued = False
+        
+        while True:
+            limits = await self.get_limits(str(message.guild.id))
+            request_buckets = self.get_buckets(message, 'requests', limits)
+            token_buckets = self.get_buckets(message, 'tokens', limits)
+            
+            # Token buckets only need to be out of debt; requests take one token each
+            wait = max(
+                [bucket.wait_time(1) for bucket in request_buckets] +
+                [bucket.wait_time(0) for bucket in token_buckets] +
+                [0.0]
+            )
+            
+            if wait == 0:
+                for bucket in request_buckets:
+                    bucket.take(1)
+                metrics['allowed'] += 1
+                if queued:
+                    metrics['queued'] += 1
+                return True, 0.0
+            
+            if time.monotonic() + wait > deadline:
+                metrics['rejected'] += 1
+                return False, wait
+            
+            queued = True
+            await asyncio.sleep(wait)
+    
+    async def record_tokens(self, message: discord.Message, tokens: int):
+        """Charge the model tokens used by a request to its token buckets."""
+        if not tokens:
+            return
+        limits = await self.get_limits(str(message.guild.id))
+        for bucket in self.get_buckets(message, 'tokens', limits):
+            bucket.charge(tokens)
+    
+    @tasks.loop(minutes=1)
+    async def persist_task(self):
+        """Periodically persist bucket state to the database."""
+        try:
+            await asyncio.to_thread(self.save_buckets)
+        except Exception as e:
+            print(f"Error saving quota buckets: {e}")
+    
+    @commands.command(name='quota_usage')
+    @commands.has_permissions(administrator=True)
+    async def quota_usage(self, ctx, member: discord.Member = None):
+        """Show current quota usage for this server, channel and a member."""
+        member = member or ctx.author
+        guild_id = str(ctx.guild.id)
+        limits = await self.get_limits(guild_id)
+        metrics = self.get_metrics(guild_id)
+        now = time.time()
+        
+        embed = discord.Embed(
+            title="🚦 Quota Usage",
+            color=discord.Color.blue()
+        )
+        
+        labels = {'user': member.display_name, 'channel': f"#{ctx.channel.name}", 'guild': "Server"}
+        for scope, prefix in self.scope_keys(guild_id, str(ctx.channel.id), str(member.id)):
+            lines = []
+            for kind in ('requests', 'tokens'):
+                capacity = limits[f"{scope}_{kind}"]
+                if capacity <= 0:
+                    lines.append(f"**{kind.capitalize()}:** unlimited")
+                    continue
+                bucket = self.buckets.get(f"{prefix}:{kind}")
+                if bucket:
+                    bucket.refill(now)
+                available = bucket.level if bucket else capacity
+                used = capacity - available
+                lines.append(f"**{kind.capitalize()}:** {used:,.0f} / {capacity:,} per minute")
+            embed.add_field(name=labels[scope], value="\n".join(lines), inline=True)
+        
+        embed.add_field(
+            name="Requests Since Startup",
+            value=f"✅ {metrics['allowed']:,} allowed · ⏳ {metrics['queued']:,} queued · ❌ {metrics['rejected']:,} rejected",
+            inline=False
+        )
+        
+        await ctx.send(embed=embed)
+
+async def setup(bot):
+    """Setup function to load the cog."""
+    await bot.add_cog(QuotaManager(bot))
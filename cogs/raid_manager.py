@@ -0,0 +1,199 @@
+import discord
+from discord.ext import commands
+from storage import get_storage
+from raid import RaidDetector, content_key
+from settings import get_guild_settings
+from datetime import timedelta
+from typing import Optional
+import asyncio
+import os
+import re
+
+class RaidManager(commands.Cog):
+    """Real-time join raid and spam detection with alerts and automatic timeouts."""
+    
+    def __init__(self, bot):
+        self.bot = bot
+        self.db = get_storage()
+        
+        self.detector = RaidDetector(
+            join_window=float(os.getenv('RAID_JOIN_WINDOW', '60')),
+            message_window=float(os.getenv('SPAM_MESSAGE_WINDOW', '10')),
+            duplicate_window=float(os.getenv('SPAM_DUPLICATE_WINDOW', '60')),
+            max_users=int(os.getenv('RAID_TRACKED_USERS', '2048')),
+            max_contents=int(os.getenv('RAID_TRACKED_MESSAGES', '1024')),
+            alert_cooldown=float(os.getenv('RAID_ALERT_COOLDOWN', '60'))
+        )
+        self.timeout_minutes = float(os.getenv('RAID_TIMEOUT_MINUTES', '10'))
+        
+        self.metrics = {'alerts': 0, 'timeouts': 0, 'errors': 0}
+    
+    def get_alert_channel(self, guild: discord.Guild, settings) -> Optional[discord.abc.Messageable]:
+        """The configured alert channel, else the server's updates or system channel."""
+        configured = settings['raid_alert_channel']
+        if configured:
+            # Accept a raw id or a channel mention
+            match = re.search(r'\d+', configured)
+            channel = guild.get_channel(int(match.group())) if match else None
+            if channel:
+                return channel
+        return guild.public_updates_channel or guild.system_channel
+    
+    async def log_action(self, guild: discord.Guild, action_type: str, target: discord.Member = None, details: str = None):
+        """Record an automatic action in admin_actions_log under the bot's name."""
+        await asyncio.to_thread(
+            self.db.log_admin_action,
+            str(guild.id),
+            str(guild.me.id),
+            guild.me.display_name,
+            action_type,
+            str(target.id) if target else None,
+            target.display_name if target else None,
+            details
+        )
+    
+    async def alert(self, guild: discord.Guild, settings, kind: str, title: str, description: str):
+        """Post an alert for admins, at most once per RAID_ALERT_COOLDOWN seconds per kind."""
+        if not self.detector.should_alert(str(guild.id), kind):
+            return
+        
+        self.metrics['alerts'] += 1
+        print(f"[{guild.name}] {title}: {description}")
+        await self.log_action(guild, f"{kind}_alert", details=description)
+        
+        channel = self.get_alert_channel(guild, settings)
+        if channel is None:
+            return
+        
+        action = (
+            f"Members are timed out for {self.timeout_minutes:g} minutes automatically."
+            if settings['raid_auto_timeout'] else
+            "Automatic timeouts are off (`!set_setting raid_auto_timeout true`)."
+        )
+        embed = discord.Embed(title=f"🚨 {title}", description=f"{description}\n\n{action}", color=discord.Color.red())
+        try:
+            await channel.send(embed=embed)
+        except discord.HTTPException as e:
+            self.metrics['errors'] += 1
+            print(f"Error sending raid alert: {e}")
+    
+    async def timeout_member(self, member: discord.Member, reason: str):
+        """Time out a member unless they are already timed out or ranked at or above the bot."""
+        if member.is_timed_out() or member.top_role >= member.guild.me.top_role:
+            return
+        
+        try:
+            await member.timeout(timedelta(minutes=self.timeout_minutes), reason=reason)
+        except discord.HTTPException as e:
+            self.metrics['errors'] += 1
+            print(f"Error timing out {member.display_name}: {e}")
+            return
+        
+        self.metrics['timeouts'] += 1
+        await self.log_action(member.guild, "auto_timeout", member, reason)
+    
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        """Count joins; during a raid, alert admins and optionally time out new members."""
+        if member.bot:
+            return
+        
+        guild = member.guild
+        settings = await get_guild_settings(self.bot, str(guild.id))
+        if not self.detector.record_join(str(guild.id), settings):
+            return
+        
+        await self.alert(
+            guild, settings, 'raid', "Join Raid",
+            f"{settings['raid_join_limit']:,} or more members joined within {self.detector.join_window:g} seconds."
+        )
+        if settings['raid_auto_timeout']:
+            await self.timeout_member(member, "Joined during a raid")
+    
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        """Count every guild message; act on authors who flood or post the same text repeatedly."""
+        if not message.guild or message.author.bot:
+            return
+        
+        # Moderators are never flagged
+        permissions = getattr(message.author, 'guild_permissions', None)
+        if permissions is None or permissions.manage_messages:
+            return
+        
+        settings = await get_guild_settings(self.bot, str(message.guild.id))
+        spam = self.detector.record_message(
+            str(message.guild.id), str(message.author.id), content_key(message.content), settings
+        )
+        if spam is None:
+            return
+        
+        if spam == 'rate':
+            description = (
+                f"{message.author.mention} sent more than {settings['spam_message_limit']:,} messages "
+                f"within {self.detector.message_window:g} seconds in {message.channel.mention}."
+            )
+        else:
+            description = (
+                f"The same message was posted more than {settings['spam_duplicate_limit']:,} times "
+                f"within {self.detector.duplicate_window:g} seconds, latest by {message.author.mention} "
+                f"in {message.channel.mention}."
+            )
+        
+        await self.alert(message.guild, settings, spam, "Spam Detected", description)
+        if settings['raid_auto_timeout']:
+            await self.timeout_member(message.author, f"Spam ({'message rate' if spam == 'rate' else 'duplicate messages'})")
+    
+    @commands.command(name='raid_status')
+    @commands.has_permissions(administrator=True)
+    async def raid_status(self, ctx):
+        """Show the raid and spam detector's current state for this server."""
+        settings = await get_guild_settings(self.bot, str(ctx.guild.id))
+        current = self.detector.get_guild_stats(str(ctx.guild.id))
+        totals = self.detector.stats
+        
+        def limit(value):
+            return f"{value:,}" if value else "off"
+        
+        embed = discord.Embed(
+            title="🛡️ Raid Protection",
+            description="🚨 **Raid in progress**" if current['raid'] else "No raid in progress",
+            color=discord.Color.red() if current['raid'] else discord.Color.green()
+        )
+        embed.add_field(
+            name="Joins",
+            value=f"{current['joins']:,} in the last {self.detector.join_window:g}s (raid at {limit(settings['raid_join_limit'])})",
+            inline=False
+        )
+        embed.add_field(
+            name="Spam Limits",
+            value=(
+                f"{limit(settings['spam_message_limit'])} messages per user per {self.detector.message_window:g}s\n"
+                f"{limit(settings['spam_duplicate_limit'])} copies of a message per {self.detector.duplicate_window:g}s\n"
+                f"Tracking {current['users']:,} members and {current['contents']:,} messages"
+            ),
+            inline=False
+        )
+        embed.add_field(
+            name="Actions",
+            value=(
+                f"Automatic timeouts: {'on' if settings['raid_auto_timeout'] else 'off'}\n"
+                f"Alert channel: {getattr(self.get_alert_channel(ctx.guild, settings), 'mention', 'none')}"
+            ),
+            inline=False
+        )
+        embed.add_field(
+            name="Since Startup (all servers)",
+            value=(
+                f"{totals['messages']:,} messages and {totals['joins']:,} joins checked\n"
+                f"{totals['raids']:,} raids, {totals['rate_spam']:,} rate and {totals['duplicate_spam']:,} duplicate spam messages\n"
+                f"{self.metrics['alerts']:,} alerts, {self.metrics['timeouts']:,} timeouts"
+            ),
+            inline=False
+        )
+        
+        await ctx.send(embed=embed)
+
+async def setup(bot):
+    """Setup function to load the cog."""
+    await bot.add_cog(RaidManager(bot))
@@ -1,6 +1,7 @@
 import discord
 from discord.ext import commands
 import aiohttp
+from delivery import deliver
 import os
 
 class SearchTool(commands.Cog):
@@ -62,27 +63,8 @@ class SearchTool(commands.Cog):
         async with ctx.typing():
             results = await self.perform_search(query)
         
-        # Split long messages if needed
-        if len(results) <= 2000:
-            await ctx.send(results)
-        else:
-            # Split into chunks
-            chunks = []
-            current_chunk = ""
-            
-            for line in results.split('\n'):
-                if len(current_chunk) + len(line) + 1 <= 2000:
-                    current_chunk += line + '\n'
-                else:
-                    if current_chunk:
-                        chunks.append(current_chunk.strip())
-                    current_chunk = line + '\n'
-            
-            if current_chunk:
-                chunks.append(current_chunk.strip())
-            
-            for chunk in chunks:
-                await ctx.send(chunk)
+        # Long results are split without breaking markdown
+        await deliver(self.bot, ctx.channel, results)
 
 async def setup(bot):
     """Setup function to load the cog."""
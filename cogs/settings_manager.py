@@ -0,0 +1,94 @@
+import discord
+import asyncio
+from discord.ext import commands
+from storage import get_storage
+from settings import SettingsStore, SETTING_DEFINITIONS, parse_setting, format_setting
+
+class SettingsManager(commands.Cog):
+    """Per-server settings backed by the server_settings table."""
+    
+    def __init__(self, bot):
+        self.bot = bot
+        self.db = get_storage()
+        self.store = SettingsStore(self.db)
+    
+    @commands.command(name='settings')
+    @commands.has_permissions(administrator=True)
+    async def settings(self, ctx):
+        """Show all settings for this server."""
+        guild_id = str(ctx.guild.id)
+        current = await self.store.get_all(guild_id)
+        overrides = await asyncio.to_thread(self.store.get_overrides, guild_id)
+        
+        embed = discord.Embed(
+            title="⚙️ Server Settings",
+            description="Change with `!set_setting <name> <value>`, restore with `!reset_setting <name>`. ✏️ = changed for this server.",
+            color=discord.Color.blue()
+        )
+        for name, definition in SETTING_DEFINITIONS.items():
+            marker = " ✏️" if name in overrides else ""
+            embed.add_field(
+                name=f"{name}{marker}",
+                value=f"`{format_setting(current[name])}`\n{definition.description}",
+                inline=True
+            )
+        
+        await ctx.send(embed=embed)
+    
+    @commands.command(name='set_setting')
+    @commands.has_permissions(administrator=True)
+    async def set_setting(self, ctx, name: str, *, value: str):
+        """Change a setting for this server."""
+        try:
+            parsed = parse_setting(name, value)
+        except ValueError as e:
+            await ctx.send(f"❌ {e}")
+            return
+        
+        await self.store.set(str(ctx.guild.id), name, parsed)
+        
+        await asyncio.to_thread(
+            self.db.log_admin_action,
+            str(ctx.guild.id),
+            str(ctx.author.id),
+            ctx.author.display_name,
+            "set_setting",
+            details=f"{name} = {format_setting(parsed)}"
+        )
+        
+        embed = discord.Embed(
+            title="⚙️ Setting Updated",
+            description=f"`{name}` is now `{format_setting(parsed)}`.",
+            color=discord.Color.green()
+        )
+        await ctx.send(embed=embed)
+    
+    @commands.command(name='reset_setting')
+    @commands.has_permissions(administrator=True)
+    async def reset_setting(self, ctx, name: str):
+        """Restore a setting to its default for this server."""
+        if name not in SETTING_DEFINITIONS:
+            await ctx.send(f"❌ Unknown setting: {name}")
+            return
+        
+        await self.store.reset(str(ctx.guild.id), name)
+        
+        await asyncio.to_thread(
+            self.db.log_admin_action,
+            str(ctx.guild.id),
+            str(ctx.author.id),
+            ctx.author.display_name,
+            "reset_setting",
+            details=name
+        )
+        
+        embed = discord.Embed(
+            title="⚙️ Setting Reset",
+            description=f"`{name}` is back to `{format_setting(SETTING_DEFINITIONS[name].default)}`.",
+            color=discord.Color.green()
+        )
+        await ctx.send(embed=embed)
+
+async def setup(bot):
+    """Setup function to load the cog."""
+    await bot.add_cog(SettingsManager(bot))
@@ -0,0 +1,89 @@
+import discord
+from discord.ext import commands, tasks
+from worker_pool import WorkerPool
+from typing import Dict
+import os
+
+class WorkerManager(commands.Cog):
+    """Optional multi-process mode: AI requests run in a pool of worker processes.
+    
+    Off unless AI_WORKERS is set; the gateway process then only receives
+    events, checks quotas, runs tools and delivers replies.
+    """
+    
+    def __init__(self, bot):
+        self.bot = bot
+        self.pool = None
+        
+        workers = int(os.getenv('AI_WORKERS', '0'))
+        # Workers write history through their own storage instance, which
+        # the in-memory backend cannot share between processes
+        if workers > 0 and os.getenv('STORAGE_BACKEND', 'sqlite').lower() == 'memory':
+            print("AI workers disabled: the memory storage backend cannot be shared between processes")
+            workers = 0
+        if workers > 0:
+            self.pool = WorkerPool(
+                workers,
+                max_pending=int(os.getenv('AI_WORKER_QUEUE', '32')),
+                concurrency=int(os.getenv('AI_WORKER_CONCURRENCY', '16')),
+                stale_after=float(os.getenv('AI_WORKER_STALE_AFTER', '30'))
+            )
+    
+    async def cog_load(self):
+        if self.pool:
+            self.pool.start()
+            self.health_check.start()
+            print(f"Started {self.pool.size} AI worker processes")
+    
+    async def cog_unload(self):
+        self.health_check.cancel()
+        if self.pool:
+            await self.pool.stop()
+    
+    async def submit(self, job: Dict) -> Dict:
+        """Run a job in the worker pool (raises WorkerPoolBusy when the worker's queue is full)."""
+        return await self.pool.submit(job)
+    
+    @tasks.loop(seconds=10)
+    async def health_check(self):
+        """Restart crashed or unresponsive workers."""
+        try:
+            await self.pool.check_health()
+        except Exception as e:
+            print(f"Error checking worker health: {e}")
+    
+    @commands.command(name='worker_stats')
+    @commands.has_permissions(administrator=True)
+    async def worker_stats(self, ctx):
+        """Show the state of the AI worker processes."""
+        if not self.pool:
+            await ctx.send("Worker processes are disabled (set AI_WORKERS to enable them).")
+            return
+        
+        stats = self.pool.get_stats()
+        embed = discord.Embed(
+            title="⚙️ AI Workers",
+            description=(
+                f"{stats['submitted']:,} jobs submitted, {stats['completed']:,} completed, {stats['pending']:,} pending\n"
+                f"{stats['rejected']:,} rejected (queue full), {stats['lost']:,} lost, {stats['restarts']:,} restarts"
+            ),
+            color=discord.Color.blue()
+        )
+        
+        for worker_id, worker in enumerate(stats['workers']):
+            value = (
+                f"{'🟢 alive' if worker['alive'] else '🔴 down'} · pid {worker['pid']}\n"
+                f"{worker['jobs']:,} jobs, {worker['errors']:,} errors, {worker['pending']:,} pending\n"
+                f"Last heartbeat {worker['heartbeat_age']:.0f}s ago"
+            )
+            if worker['cache']:
+                value += f"\nContext cache {worker['cache']['hit_rate']}% hits, {worker['cache']['channels']:,} channels"
+            if worker['prompt']:
+                value += f"\nPrompt cache {worker['prompt']['cached_ratio']}% of prompt tokens"
+            embed.add_field(name=f"Worker {worker_id}", value=value, inline=True)
+        
+        await ctx.send(embed=embed)
+
+async def setup(bot):
+    """Setup function to load the cog."""
+    await bot.add_cog(WorkerManager(bot))
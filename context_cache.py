@@ -0,0 +1,145 @@
+import sys
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional, Tuple
+from storage import HistoryMessage
+
+def estimate_size(message: HistoryMessage) -> int:
+    """Estimate the memory footprint of a history record in bytes."""
+    return sys.getsizeof(message) + sum(sys.getsizeof(value) for value in message)
+
+class ContextCache:
+    """Bounded LRU cache of recent per-channel conversation windows.
+    
+    Each channel keeps a ring buffer of its last `window_size` messages as
+    HistoryMessage records. When the total estimated size
+    of all windows exceeds `max_bytes`, the least recently used channels are
+    evicted.
+    
+    `on_drop`, if set, is called with the key of every window that is
+    invalidated or evicted (and with None when the cache is cleared), so
+    per-channel state kept elsewhere can be dropped along with it.
+    """
+    
+    def __init__(self, window_size: int = 50, max_bytes: int = 32 * 1024 * 1024):
+        self.window_size = window_size
+        self.max_bytes = max_bytes
+        self.windows: "OrderedDict[Tuple[str, str], deque]" = OrderedDict()
+        self.window_bytes: Dict[Tuple[str, str], int] = {}
+        self.total_bytes = 0
+        # Bumped on every write or invalidation, so a database read that
+        # raced with a write is not cached; `epoch` does the same for clear()
+        self.generations: Dict[Tuple[str, str], int] = {}
+        self.epoch = 0
+        self.on_drop: Optional[Callable[[Optional[Tuple[str, str]]], None]] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key: Tuple[str, str], max_messages: int) -> Optional[List[HistoryMessage]]:
+        """Return the last `max_messages` cached messages, or None on a miss."""
+        window = self.windows.get(key)
+        if window is None or max_messages > self.window_size:
+            self.misses += 1
+            return None
+        
+        self.windows.move_to_end(key)
+        self.hits += 1
+        
+        messages = list(window)
+        return messages[-max_messages:] if max_messages < len(messages) else messages
+    
+    def get_generation(self, key: Tuple[str, str]) -> int:
+        """Get the write generation of a channel, to pass back to put().
+        
+        Both counters only grow, so their sum changes whenever the channel
+        is written to or the whole cache is cleared.
+        """
+        return self.epoch + self.generations.get(key, 0)
+    
+    def put(self, key: Tuple[str, str], messages: List[HistoryMessage], generation: int = None):
+        """Cache a channel window loaded from the database.
+        
+        If `generation` is given and the channel was written to since it was
+        read, the window may be stale and is not cached.
+        """
+        if generation is not None and generation != self.get_generation(key):
+            return
+        
+        self.discard(key)
+        
+        window = deque(messages[-self.window_size:], maxlen=self.window_size)
+        self.windows[key] = window
+        self.window_bytes[key] = sum(estimate_size(msg) for msg in window)
+        self.total_bytes += self.window_bytes[key]
+        self.evict()
+    
+    def append(self, key: Tuple[str, str], message: HistoryMessage):
+        """Append a new message to a cached window.
+        
+        Channels that are not cached are left alone; their next read loads
+        the window from the database.
+        """
+        self.generations[key] = self.generations.get(key, 0) + 1
+        
+        window = self.windows.get(key)
+        if window is None:
+            return
+        
+        # Concurrent writes can finish out of order; reload rather than misorder
+        if window and message.id < window[-1].id:
+            self.discard(key)
+            return
+        
+        size = estimate_size(message)
+        if len(window) == window.maxlen:
+            size -= estimate_size(window[0])
+        window.append(message)
+        
+        self.window_bytes[key] += size
+        self.total_bytes += size
+        self.windows.move_to_end(key)
+        self.evict()
+    
+    def invalidate(self, key: Tuple[str, str]):
+        """Drop a channel window, e.g. after its history was reset or archived."""
+        self.discard(key)
+        if self.on_drop:
+            self.on_drop(key)
+    
+    def discard(self, key: Tuple[str, str]):
+        """Drop a channel window that is only out of date; it is reloaded on the next read."""
+        self.generations[key] = self.generations.get(key, 0) + 1
+        if self.windows.pop(key, None) is not None:
+            self.total_bytes -= self.window_bytes.pop(key)
+    
+    def clear(self):
+        """Drop every cached window."""
+        self.epoch += 1
+        self.windows.clear()
+        self.window_bytes.clear()
+        self.total_bytes = 0
+        if self.on_drop:
+            self.on_drop(None)
+    
+    def evict(self):
+        """Evict least recently used windows until the cache fits in `max_bytes`."""
+        while self.total_bytes > self.max_bytes and self.windows:
+            key, _ = self.windows.popitem(last=False)
+            self.total_bytes -= self.window_bytes.pop(key)
+            self.evictions += 1
+            if self.on_drop:
+                self.on_drop(key)
+    
+    def get_stats(self) -> Dict:
+        """Get hit rate and memory footprint statistics."""
+        lookups = self.hits + self.misses
+        return {
+            'channels': len(self.windows),
+            'messages': sum(len(window) for window in self.windows.values()),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups * 100, 2) if lookups else 0.0
+        }
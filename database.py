@@ -1,26 +1,72 @@
 import sqlite3
 import json
+import zlib
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterator
 import os
+from storage import Storage, HistoryMessage
 
-class DatabaseManager:
-    """Manages SQLite database operations for Nebula bot."""
+# Maximum number of messages stored in one compressed archive segment
+ARCHIVE_SEGMENT_SIZE = 500
+
+def to_fts_query(query: str) -> str:
+    """Convert free text into an FTS5 query that matches all terms.
+    
+    Each term is quoted so user input can never be parsed as FTS5 syntax.
+    A trailing '*' on a term is kept as a prefix search.
+    """
+    terms = []
+    for term in query.split():
+        prefix = term.endswith('*') and len(term) > 1
+        term = term.rstrip('*').replace('"', '""')
+        if term:
+            terms.append(f'"{term}"*' if prefix else f'"{term}"')
+    return ' '.join(terms)
+
+def make_snippet(content: str, terms: List[str], width: int = 160) -> str:
+    """Cut a short excerpt of `content` around the first matching term."""
+    lowered = content.lower()
+    positions = [lowered.find(term) for term in terms if term and lowered.find(term) >= 0]
+    start = max(0, min(positions) - width // 4) if positions else 0
+    snippet = content[start:start + width]
+    if start > 0:
+        snippet = '…' + snippet
+    if start + width < len(content):
+        snippet += '…'
+    return snippet
+
+class DatabaseManager(Storage):
+    """Manages SQLite database operations for Nebula bot (the default storage backend)."""
     
-    def __init__(self, db_path: str = "nebula.db"):
+    def __init__(self, db_path: str = "nebula.db", archive_path: str = None):
         """Initialize database connection."""
         self.db_path = db_path
+        self.archive_path = archive_path or f"{os.path.splitext(db_path)[0]}_archive.db"
         self.init_database()
     
     def get_connection(self):
         """Get a database connection."""
         return sqlite3.connect(self.db_path)
     
+    def get_archive_connection(self):
+        """Get a database connection with the archive database attached as `archive`."""
+        conn = self.get_connection()
+        conn.execute('ATTACH DATABASE ? AS archive', (self.archive_path,))
+        return conn
+    
     def init_database(self):
         """Initialize database tables."""
         conn = self.get_connection()
         cursor = conn.cursor()
         
+        # Only takes effect on a new database; existing ones are converted
+        # by the first vacuum() run
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        
+        # WAL lets readers (including online backups) run alongside writers;
+        # the setting is stored in the database file
+        cursor.execute('PRAGMA journal_mode = WAL')
+        
         # Conversation history table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS conversation_history (
@@ -36,18 +82,79 @@ class DatabaseManager:
             )
         ''')
         
-        # User profiles table
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_history_channel
+            ON conversation_history (guild_id, channel_id, timestamp)
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_history_timestamp
+            ON conversation_history (timestamp)
+        ''')
+        
+        # User profiles table, one row per member of each guild. Older
+        # databases keyed it by user_id alone, sharing one profile across
+        # guilds; those rows are copied over once.
+        cursor.execute('PRAGMA table_info(user_profiles)')
+        profile_keys = [row[1] for row in cursor.fetchall() if row[5]]
+        if profile_keys == ['user_id']:
+            cursor.execute('ALTER TABLE user_profiles RENAME TO user_profiles_old')
+        
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS user_profiles (
-                user_id TEXT PRIMARY KEY,
-                display_name TEXT NOT NULL,
                 guild_id TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                display_name TEXT NOT NULL,
                 first_seen DATETIME DEFAULT CURRENT_TIMESTAMP,
                 last_seen DATETIME DEFAULT CURRENT_TIMESTAMP,
-                message_count INTEGER DEFAULT 0
+                message_count INTEGER DEFAULT 0,
+                PRIMARY KEY (guild_id, user_id)
             )
         ''')
         
+        if profile_keys == ['user_id']:
+            cursor.execute('''
+                INSERT INTO user_profiles (guild_id, user_id, display_name, first_seen, last_seen, message_count)
+                SELECT guild_id, user_id, display_name, first_seen, last_seen, message_count
+                FROM user_profiles_old
+            ''')
+            cursor.execute('DROP TABLE user_profiles_old')
+        
+        # Activity rollups: message and token counters per (guild, user, day)
+        # and per (guild, channel, day), updated with every user message
+        cursor.execute('''
+            SELECT 1 FROM sqlite_master
+            WHERE type = 'table' AND name = 'activity_daily'
+        ''')
+        activity_exists = cursor.fetchone() is not None
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS activity_daily (
+                guild_id TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                day DATE NOT NULL,
+                messages INTEGER DEFAULT 0,
+                tokens INTEGER DEFAULT 0,
+                PRIMARY KEY (guild_id, user_id, day)
+            ) WITHOUT ROWID
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_activity_guild_day
+            ON activity_daily (guild_id, day)
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS channel_activity_daily (
+                guild_id TEXT NOT NULL,
+                channel_id TEXT NOT NULL,
+                day DATE NOT NULL,
+                messages INTEGER DEFAULT 0,
+                tokens INTEGER DEFAULT 0,
+                PRIMARY KEY (guild_id, day, channel_id)
+            ) WITHOUT ROWID
+        ''')
+        
         # Server settings table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS server_settings (
@@ -58,6 +165,66 @@ class DatabaseManager:
             )
         ''')
         
+        # Quota token buckets, persisted periodically by the QuotaManager cog
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS quota_buckets (
+                bucket_key TEXT PRIMARY KEY,
+                capacity REAL NOT NULL,
+                level REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        ''')
+        
+        # Provider-reported token usage, one row per model response
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS usage_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id TEXT NOT NULL,
+                channel_id TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                model TEXT,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                cached_tokens INTEGER DEFAULT 0,
+                estimated BOOLEAN DEFAULT 0,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_usage_guild
+            ON usage_log (guild_id, timestamp)
+        ''')
+        
+        # Usage rollups, updated in the same transaction as usage_log so
+        # reports never scan the raw rows
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS usage_daily (
+                guild_id TEXT NOT NULL,
+                day DATE NOT NULL,
+                model TEXT NOT NULL,
+                requests INTEGER DEFAULT 0,
+                prompt_tokens INTEGER DEFAULT 0,
+                completion_tokens INTEGER DEFAULT 0,
+                cached_tokens INTEGER DEFAULT 0,
+                estimated_requests INTEGER DEFAULT 0,
+                PRIMARY KEY (guild_id, day, model)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS usage_totals (
+                guild_id TEXT NOT NULL,
+                model TEXT NOT NULL,
+                requests INTEGER DEFAULT 0,
+                prompt_tokens INTEGER DEFAULT 0,
+                completion_tokens INTEGER DEFAULT 0,
+                cached_tokens INTEGER DEFAULT 0,
+                first_day DATE,
+                PRIMARY KEY (guild_id, model)
+            )
+        ''')
+        
         # Admin actions log table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS admin_actions_log (
@@ -73,51 +240,215 @@ class DatabaseManager:
             )
         ''')
         
+        # Keyset paging and exports walk a guild's rows in id order; an index
+        # on guild_id alone is ordered by rowid within each guild
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_admin_logs_guild
+            ON admin_actions_log (guild_id)
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_history_guild
+            ON conversation_history (guild_id)
+        ''')
+        
+        # One row per model request, for tuning the fast/strong router
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS model_routing_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id TEXT NOT NULL,
+                channel_id TEXT NOT NULL,
+                route TEXT NOT NULL,
+                model TEXT,
+                reasons TEXT,
+                input_chars INTEGER,
+                history_tokens INTEGER,
+                latency_ms REAL,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                success BOOLEAN,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_routing_guild
+            ON model_routing_log(guild_id, timestamp)
+        ''')
+        
+        # Full-text index over conversation history (external content table,
+        # kept in sync by triggers so every write path is covered)
+        cursor.execute('''
+            SELECT 1 FROM sqlite_master
+            WHERE type = 'table' AND name = 'conversation_fts'
+        ''')
+        fts_exists = cursor.fetchone() is not None
+        
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS conversation_fts USING fts5(
+                content,
+                content='conversation_history',
+                content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS conversation_history_fts_insert
+            AFTER INSERT ON conversation_history BEGIN
+                INSERT INTO conversation_fts(rowid, content) VALUES (new.id, new.content);
+            END
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS conversation_history_fts_delete
+            AFTER DELETE ON conversation_history BEGIN
+                INSERT INTO conversation_fts(conversation_fts, rowid, content)
+                VALUES ('delete', old.id, old.content);
+            END
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS conversation_history_fts_update
+            AFTER UPDATE OF content ON conversation_history BEGIN
+                INSERT INTO conversation_fts(conversation_fts, rowid, content)
+                VALUES ('delete', old.id, old.content);
+                INSERT INTO conversation_fts(rowid, content) VALUES (new.id, new.content);
+            END
+        ''')
+        
+        # Index rows that were written before the FTS table existed
+        if not fts_exists:
+            cursor.execute("INSERT INTO conversation_fts(conversation_fts) VALUES ('rebuild')")
+        
         conn.commit()
         conn.close()
+        
+        self.init_archive()
+        
+        # Count messages that were written before the rollups existed
+        if not activity_exists:
+            self.rebuild_activity()
+        
         print("Database initialized successfully")
     
+    def init_archive(self):
+        """Initialize the archive database holding compressed history segments."""
+        conn = sqlite3.connect(self.archive_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('PRAGMA journal_mode = WAL')
+        
+        # Each segment holds up to ARCHIVE_SEGMENT_SIZE messages of one channel
+        # as zlib-compressed JSON lines
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archive_segments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id TEXT NOT NULL,
+                channel_id TEXT NOT NULL,
+                first_message_id INTEGER NOT NULL,
+                last_message_id INTEGER NOT NULL,
+                start_timestamp DATETIME NOT NULL,
+                end_timestamp DATETIME NOT NULL,
+                message_count INTEGER NOT NULL,
+                token_count INTEGER DEFAULT 0,
+                raw_size INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_segments_guild
+            ON archive_segments (guild_id, end_timestamp)
+        ''')
+        
+        # Search index over archived text: a contentless FTS table (the text
+        # itself stays compressed in the segments) and a map from message id
+        # to its segment, so a search only decompresses segments holding hits
+        cursor.execute('''
+            SELECT 1 FROM sqlite_master
+            WHERE type = 'table' AND name = 'archive_fts'
+        ''')
+        fts_exists = cursor.fetchone() is not None
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archive_messages (
+                id INTEGER PRIMARY KEY,
+                segment_id INTEGER NOT NULL,
+                user_id TEXT,
+                timestamp DATETIME NOT NULL
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS archive_fts USING fts5(
+                content,
+                content='',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+        
+        # Index segments that were written before the search index existed
+        if not fts_exists:
+            segments = cursor.execute('SELECT id, data FROM archive_segments').fetchall()
+            for segment_id, data in segments:
+                messages = [json.loads(line) for line in zlib.decompress(data).decode('utf-8').split('\n')]
+                self.index_segment(cursor, 'main', segment_id, messages)
+        
+        conn.commit()
+        conn.close()
+    
+    def index_segment(self, cursor, schema: str, segment_id: int, messages: List[Dict]):
+        """Add the messages of an archive segment to the archive search index."""
+        cursor.executemany(
+            f'INSERT INTO {schema}.archive_messages (id, segment_id, user_id, timestamp) VALUES (?, ?, ?, ?)',
+            [(msg['id'], segment_id, msg['user_id'], msg['timestamp']) for msg in messages]
+        )
+        cursor.executemany(
+            f'INSERT INTO {schema}.archive_fts (rowid, content) VALUES (?, ?)',
+            [(msg['id'], msg['content']) for msg in messages]
+        )
+    
     def add_message(self, guild_id: str, channel_id: str, user_id: str, 
-                   display_name: str, role: str, content: str, token_count: int = 0):
+                   display_name: str, role: str, content: str, token_count: int = 0) -> HistoryMessage:
         """Add a message to conversation history."""
+        timestamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        
         conn = self.get_connection()
         cursor = conn.cursor()
         
         cursor.execute('''
             INSERT INTO conversation_history 
-            (guild_id, channel_id, user_id, display_name, role, content, token_count)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (guild_id, channel_id, user_id, display_name, role, content, token_count))
+            (guild_id, channel_id, user_id, display_name, role, content, timestamp, token_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (guild_id, channel_id, user_id, display_name, role, content, timestamp, token_count))
         
+        message_id = cursor.lastrowid
         conn.commit()
         conn.close()
+        
+        return HistoryMessage(message_id, display_name, role, content, timestamp, token_count)
     
     def get_conversation_history(self, guild_id: str, channel_id: str, 
-                                limit: int = 50) -> List[Dict]:
-        """Retrieve recent conversation history."""
+                                limit: int = 50) -> List[HistoryMessage]:
+        """Retrieve recent conversation history in chronological order."""
         conn = self.get_connection()
         cursor = conn.cursor()
         
         cursor.execute('''
-            SELECT display_name, role, content, timestamp, token_count
+            SELECT id, display_name, role, content, timestamp, token_count
             FROM conversation_history
             WHERE guild_id = ? AND channel_id = ?
-            ORDER BY timestamp DESC
+            ORDER BY timestamp DESC, id DESC
             LIMIT ?
         ''', (guild_id, channel_id, limit))
         
-        messages = []
-        for row in cursor.fetchall():
-            messages.append({
-                'display_name': row[0],
-                'role': row[1],
-                'content': row[2],
-                'timestamp': row[3],
-                'token_count': row[4]
-            })
-        
+        messages = list(map(HistoryMessage._make, cursor.fetchall()))
         conn.close()
-        return list(reversed(messages))  # Return in chronological order
+        
+        messages.reverse()  # Return in chronological order
+        return messages
     
     def get_total_tokens(self, guild_id: str, channel_id: str) -> int:
         """Get total token count for a conversation."""
@@ -148,25 +479,354 @@ class DatabaseManager:
         conn.close()
         print(f"Conversation history reset for guild {guild_id}, channel {channel_id}")
     
-    def update_user_profile(self, user_id: str, display_name: str, guild_id: str):
-        """Update or create user profile."""
+    def archive_messages(self, guild_id: str = None, channel_id: str = None,
+                         before: str = None) -> int:
+        """Move conversation history rows into compressed archive segments.
+        
+        Archives every row matching the filters: all rows older than `before`,
+        or a whole channel when `guild_id` and `channel_id` are given. Each
+        segment is committed before its rows are deleted (in WAL mode a
+        transaction is not atomic across attached databases); rows left
+        behind by a crash between the two are dropped by the next run, so
+        messages are never lost or duplicated. Returns the number of rows
+        archived.
+        """
+        filters = ''
+        params = []
+        if guild_id:
+            filters += ' AND guild_id = ?'
+            params.append(guild_id)
+        if channel_id:
+            filters += ' AND channel_id = ?'
+            params.append(channel_id)
+        if before:
+            filters += ' AND timestamp < ?'
+            params.append(before)
+        
+        conn = self.get_archive_connection()
+        cursor = conn.cursor()
+        archived = 0
+        
+        try:
+            cursor.execute(f'''
+                SELECT DISTINCT guild_id, channel_id
+                FROM conversation_history
+                WHERE 1 = 1{filters}
+            ''', params)
+            channels = cursor.fetchall()
+            
+            for channel_guild_id, channel_channel_id in channels:
+                self.drop_archived_rows(cursor, channel_guild_id, channel_channel_id)
+                conn.commit()
+                
+                last_id = 0
+                while True:
+                    cursor.execute(f'''
+                        SELECT id, user_id, display_name, role, content, timestamp, token_count
+                        FROM conversation_history
+                        WHERE guild_id = ? AND channel_id = ? AND id > ?{filters}
+                        ORDER BY id
+                        LIMIT ?
+                    ''', [channel_guild_id, channel_channel_id, last_id] + params + [ARCHIVE_SEGMENT_SIZE])
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    
+                    messages = [
+                        {
+                            'id': row[0],
+                            'user_id': row[1],
+                            'display_name': row[2],
+                            'role': row[3],
+                            'content': row[4],
+                            'timestamp': row[5],
+                            'token_count': row[6]
+                        }
+                        for row in rows
+                    ]
+                    raw = '\n'.join(json.dumps(msg, ensure_ascii=False) for msg in messages).encode('utf-8')
+                    timestamps = [row[5] for row in rows]
+                    
+                    cursor.execute('''
+                        INSERT INTO archive.archive_segments
+                        (guild_id, channel_id, first_message_id, last_message_id, start_timestamp,
+                         end_timestamp, message_count, token_count, raw_size, data)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (channel_guild_id, channel_channel_id, rows[0][0], rows[-1][0],
+                          min(timestamps), max(timestamps), len(rows),
+                          sum(row[6] or 0 for row in rows), len(raw), zlib.compress(raw, 6)))
+                    # Indexed in the same transaction as the segment
+                    self.index_segment(cursor, 'archive', cursor.lastrowid, messages)
+                    conn.commit()
+                    
+                    cursor.executemany(
+                        'DELETE FROM conversation_history WHERE id = ?',
+                        [(row[0],) for row in rows]
+                    )
+                    conn.commit()
+                    
+                    archived += len(rows)
+                    last_id = rows[-1][0]
+        finally:
+            conn.close()
+        
+        return archived
+    
+    def drop_archived_rows(self, cursor, guild_id: str, channel_id: str):
+        """Delete hot rows of a channel that its newest archive segment already holds."""
+        cursor.execute('''
+            SELECT first_message_id, last_message_id, data
+            FROM archive.archive_segments
+            WHERE guild_id = ? AND channel_id = ?
+            ORDER BY id DESC
+            LIMIT 1
+        ''', (guild_id, channel_id))
+        segment = cursor.fetchone()
+        if not segment:
+            return
+        
+        # Only decompress the segment when rows in its id range remain
+        cursor.execute('''
+            SELECT 1 FROM conversation_history
+            WHERE id BETWEEN ? AND ? AND guild_id = ? AND channel_id = ?
+            LIMIT 1
+        ''', (segment[0], segment[1], guild_id, channel_id))
+        if not cursor.fetchone():
+            return
+        
+        ids = [(json.loads(line)['id'],) for line in zlib.decompress(segment[2]).decode('utf-8').split('\n')]
+        cursor.executemany('DELETE FROM conversation_history WHERE id = ?', ids)
+    
+    def search_archive(self, guild_id: str, query: str, user_id: str = None,
+                       channel_id: str = None, since: str = None, until: str = None,
+                       limit: int = 20) -> List[Dict]:
+        """Search archived messages for all terms of `query`, newest first.
+        
+        Matches come from the archive's FTS index with every filter applied
+        in SQL, so only the segments holding the returned messages are
+        decompressed.
+        """
+        fts_query = to_fts_query(query)
+        if not fts_query:
+            return []
+        
+        sql = '''
+            SELECT m.id, m.segment_id
+            FROM archive_fts
+            JOIN archive_messages m ON m.id = archive_fts.rowid
+            JOIN archive_segments s ON s.id = m.segment_id
+            WHERE archive_fts MATCH ? AND s.guild_id = ?
+        '''
+        params = [fts_query, guild_id]
+        
+        if user_id:
+            sql += ' AND m.user_id = ?'
+            params.append(user_id)
+        if channel_id:
+            sql += ' AND s.channel_id = ?'
+            params.append(channel_id)
+        if since:
+            sql += ' AND m.timestamp >= ?'
+            params.append(since)
+        if until:
+            sql += ' AND m.timestamp < ?'
+            params.append(until)
+        
+        sql += ' ORDER BY archive_fts.rowid DESC LIMIT ?'
+        params.append(limit)
+        
+        conn = sqlite3.connect(self.archive_path)
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(sql, params)
+            matches = cursor.fetchall()
+            if not matches:
+                return []
+            
+            wanted = {message_id for message_id, _ in matches}
+            segment_ids = sorted({segment_id for _, segment_id in matches})
+            cursor.execute(
+                f'SELECT channel_id, data FROM archive_segments WHERE id IN ({", ".join("?" * len(segment_ids))})',
+                segment_ids
+            )
+            messages = {}
+            for segment_channel_id, data in cursor:
+                for line in zlib.decompress(data).decode('utf-8').split('\n'):
+                    msg = json.loads(line)
+                    if msg['id'] in wanted:
+                        msg['channel_id'] = segment_channel_id
+                        messages[msg['id']] = msg
+        finally:
+            conn.close()
+        
+        terms = [term.rstrip('*').lower() for term in query.split() if term.rstrip('*')]
+        results = []
+        for message_id, _ in matches:
+            msg = messages[message_id]
+            results.append({
+                'id': msg['id'],
+                'channel_id': msg['channel_id'],
+                'user_id': msg['user_id'],
+                'display_name': msg['display_name'],
+                'role': msg['role'],
+                'snippet': make_snippet(msg['content'], terms),
+                'timestamp': msg['timestamp'],
+                'archived': True
+            })
+        
+        return results
+    
+    def get_archive_stats(self, guild_id: str = None) -> Dict:
+        """Get hot table and archive size statistics."""
+        conn = self.get_archive_connection()
+        cursor = conn.cursor()
+        
+        where = ' WHERE guild_id = ?' if guild_id else ''
+        params = (guild_id,) if guild_id else ()
+        
+        cursor.execute(f'SELECT COUNT(*) FROM conversation_history{where}', params)
+        hot_messages = cursor.fetchone()[0]
+        
+        cursor.execute(f'''
+            SELECT COUNT(*), SUM(message_count), SUM(raw_size), SUM(LENGTH(data)), MIN(start_timestamp)
+            FROM archive.archive_segments{where}
+        ''', params)
+        segments, archived_messages, raw_size, compressed_size, oldest = cursor.fetchone()
+        
+        conn.close()
+        
+        return {
+            'hot_messages': hot_messages,
+            'segments': segments,
+            'archived_messages': archived_messages or 0,
+            'raw_bytes': raw_size or 0,
+            'compressed_bytes': compressed_size or 0,
+            'oldest_archived': oldest
+        }
+    
+    def vacuum(self, max_pages: int = 0) -> int:
+        """Return free pages to the filesystem after archival.
+        
+        Databases created before incremental auto-vacuum was enabled are
+        converted with one full VACUUM; afterwards only an incremental vacuum
+        runs (`max_pages` = 0 frees every free page). Returns the number of
+        pages freed.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            # Merge FTS index segments left behind by the deleted rows
+            cursor.execute("INSERT INTO conversation_fts(conversation_fts) VALUES ('optimize')")
+            conn.commit()
+            
+            cursor.execute('PRAGMA freelist_count')
+            free_before = cursor.fetchone()[0]
+            
+            cursor.execute('PRAGMA auto_vacuum')
+            if cursor.fetchone()[0] != 2:
+                cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                cursor.execute('VACUUM')
+                return free_before
+            
+            # executescript steps the pragma to completion; a plain execute()
+            # would free a single page
+            conn.executescript(f'PRAGMA incremental_vacuum({int(max_pages)});')
+            
+            cursor.execute('PRAGMA freelist_count')
+            return free_before - cursor.fetchone()[0]
+        finally:
+            conn.close()
+    
+    def record_user_activity(self, guild_id: str, channel_id: str, user_id: str,
+                             display_name: str, token_count: int = 0, timestamp: str = None):
+        """Update a member's profile and the activity rollups for one user message."""
+        timestamp = timestamp or datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        day = timestamp[:10]
+        
         conn = self.get_connection()
         cursor = conn.cursor()
         
         cursor.execute('''
-            INSERT INTO user_profiles (user_id, display_name, guild_id, message_count)
-            VALUES (?, ?, ?, 1)
-            ON CONFLICT(user_id) DO UPDATE SET
+            INSERT INTO user_profiles (guild_id, user_id, display_name, first_seen, last_seen, message_count)
+            VALUES (?, ?, ?, ?, ?, 1)
+            ON CONFLICT(guild_id, user_id) DO UPDATE SET
                 display_name = excluded.display_name,
-                last_seen = CURRENT_TIMESTAMP,
+                last_seen = excluded.last_seen,
                 message_count = message_count + 1
-        ''', (user_id, display_name, guild_id))
+        ''', (guild_id, user_id, display_name, timestamp, timestamp))
+        
+        cursor.execute('''
+            INSERT INTO activity_daily (guild_id, user_id, day, messages, tokens)
+            VALUES (?, ?, ?, 1, ?)
+            ON CONFLICT(guild_id, user_id, day) DO UPDATE SET
+                messages = messages + 1,
+                tokens = tokens + excluded.tokens
+        ''', (guild_id, user_id, day, token_count))
+        
+        cursor.execute('''
+            INSERT INTO channel_activity_daily (guild_id, channel_id, day, messages, tokens)
+            VALUES (?, ?, ?, 1, ?)
+            ON CONFLICT(guild_id, day, channel_id) DO UPDATE SET
+                messages = messages + 1,
+                tokens = tokens + excluded.tokens
+        ''', (guild_id, channel_id, day, token_count))
+        
+        conn.commit()
+        conn.close()
+    
+    def rebuild_activity(self):
+        """Recompute the activity rollups from conversation history and the archive."""
+        user_counts = {}
+        channel_counts = {}
+        
+        def add(guild_id, channel_id, user_id, day, messages, tokens):
+            for counts, key in ((user_counts, (guild_id, user_id, day)),
+                                (channel_counts, (guild_id, channel_id, day))):
+                current = counts.get(key, (0, 0))
+                counts[key] = (current[0] + messages, current[1] + tokens)
+        
+        conn = sqlite3.connect(self.archive_path)
+        try:
+            for guild_id, channel_id, data in conn.execute(
+                'SELECT guild_id, channel_id, data FROM archive_segments'
+            ):
+                for line in zlib.decompress(data).decode('utf-8').split('\n'):
+                    msg = json.loads(line)
+                    if msg['role'] == 'user':
+                        add(guild_id, channel_id, msg['user_id'], msg['timestamp'][:10], 1, msg['token_count'] or 0)
+        finally:
+            conn.close()
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT guild_id, channel_id, user_id, date(timestamp), COUNT(*), SUM(token_count)
+            FROM conversation_history
+            WHERE role = 'user'
+            GROUP BY guild_id, channel_id, user_id, date(timestamp)
+        ''')
+        for row in cursor.fetchall():
+            add(row[0], row[1], row[2], row[3], row[4], row[5] or 0)
+        
+        cursor.execute('DELETE FROM activity_daily')
+        cursor.execute('DELETE FROM channel_activity_daily')
+        cursor.executemany(
+            'INSERT INTO activity_daily (guild_id, user_id, day, messages, tokens) VALUES (?, ?, ?, ?, ?)',
+            [key + value for key, value in user_counts.items()]
+        )
+        cursor.executemany(
+            'INSERT INTO channel_activity_daily (guild_id, channel_id, day, messages, tokens) VALUES (?, ?, ?, ?, ?)',
+            [key + value for key, value in channel_counts.items()]
+        )
         
         conn.commit()
         conn.close()
     
     def get_user_activity(self, user_id: str, guild_id: str) -> Optional[Dict]:
-        """Get user activity information."""
+        """Get a member's profile and 7/30/90-day activity from the daily rollups."""
         conn = self.get_connection()
         cursor = conn.cursor()
         
@@ -174,24 +834,27 @@ class DatabaseManager:
         cursor.execute('''
             SELECT display_name, first_seen, last_seen, message_count
             FROM user_profiles
-            WHERE user_id = ? AND guild_id = ?
-        ''', (user_id, guild_id))
+            WHERE guild_id = ? AND user_id = ?
+        ''', (guild_id, user_id))
         
         profile = cursor.fetchone()
         if not profile:
             conn.close()
             return None
         
-        # Get recent message count
+        # At most 90 rollup rows, however many messages the user wrote
         cursor.execute('''
-            SELECT COUNT(*)
-            FROM conversation_history
-            WHERE user_id = ? AND guild_id = ?
-            AND timestamp > datetime('now', '-7 days')
-        ''', (user_id, guild_id))
-        
-        recent_messages = cursor.fetchone()[0]
+            SELECT
+                SUM(CASE WHEN day > date('now', '-7 days') THEN messages ELSE 0 END),
+                SUM(CASE WHEN day > date('now', '-30 days') THEN messages ELSE 0 END),
+                SUM(messages),
+                SUM(CASE WHEN day > date('now', '-30 days') THEN 1 ELSE 0 END),
+                SUM(tokens)
+            FROM activity_daily
+            WHERE guild_id = ? AND user_id = ? AND day > date('now', '-90 days')
+        ''', (guild_id, user_id))
         
+        recent = cursor.fetchone()
         conn.close()
         
         return {
@@ -199,9 +862,67 @@ class DatabaseManager:
             'first_seen': profile[1],
             'last_seen': profile[2],
             'total_messages': profile[3],
-            'messages_last_7_days': recent_messages
+            'messages_last_7_days': recent[0] or 0,
+            'messages_last_30_days': recent[1] or 0,
+            'messages_last_90_days': recent[2] or 0,
+            'active_days_last_30_days': recent[3] or 0,
+            'tokens_last_90_days': recent[4] or 0
         }
     
+    def get_top_users(self, guild_id: str, days: int = 7, limit: int = 10) -> List[Dict]:
+        """Most active members of a guild over the last `days` days."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT a.user_id, p.display_name, SUM(a.messages), SUM(a.tokens), COUNT(*)
+            FROM activity_daily a
+            LEFT JOIN user_profiles p ON p.guild_id = a.guild_id AND p.user_id = a.user_id
+            WHERE a.guild_id = ? AND a.day > date('now', ?)
+            GROUP BY a.user_id
+            ORDER BY SUM(a.messages) DESC
+            LIMIT ?
+        ''', (guild_id, f'-{days} days', limit))
+        
+        users = []
+        for row in cursor.fetchall():
+            users.append({
+                'user_id': row[0],
+                'display_name': row[1] or row[0],
+                'messages': row[2],
+                'tokens': row[3],
+                'active_days': row[4]
+            })
+        
+        conn.close()
+        return users
+    
+    def get_channel_activity(self, guild_id: str, days: int = 7, limit: int = 10) -> List[Dict]:
+        """Busiest channels of a guild over the last `days` days."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT channel_id, SUM(messages), SUM(tokens), COUNT(*)
+            FROM channel_activity_daily
+            WHERE guild_id = ? AND day > date('now', ?)
+            GROUP BY channel_id
+            ORDER BY SUM(messages) DESC
+            LIMIT ?
+        ''', (guild_id, f'-{days} days', limit))
+        
+        channels = []
+        for row in cursor.fetchall():
+            channels.append({
+                'channel_id': row[0],
+                'messages': row[1],
+                'tokens': row[2],
+                'active_days': row[3]
+            })
+        
+        conn.close()
+        return channels
+    
     def log_admin_action(self, guild_id: str, admin_id: str, admin_name: str,
                         action_type: str, target_id: str = None, 
                         target_name: str = None, details: str = None):
@@ -218,28 +939,453 @@ class DatabaseManager:
         conn.commit()
         conn.close()
     
-    def get_admin_logs(self, guild_id: str, limit: int = 50) -> List[Dict]:
-        """Retrieve admin action logs."""
+    def get_admin_logs(self, guild_id: str, limit: int = 10, before_id: int = None,
+                       after_id: int = None) -> List[Dict]:
+        """Retrieve one page of admin action logs, newest first.
+        
+        Pages are addressed by id (keyset pagination): pass the last id of a
+        page as `before_id` for the next, older page, or the first id as
+        `after_id` for the previous, newer page.
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT admin_name, action_type, target_name, details, timestamp
-            FROM admin_actions_log
-            WHERE guild_id = ?
-            ORDER BY timestamp DESC
-            LIMIT ?
-        ''', (guild_id, limit))
+        if after_id is not None:
+            cursor.execute('''
+                SELECT id, admin_name, action_type, target_name, details, timestamp
+                FROM admin_actions_log
+                WHERE guild_id = ? AND id > ?
+                ORDER BY id ASC
+                LIMIT ?
+            ''', (guild_id, after_id, limit))
+            rows = cursor.fetchall()[::-1]
+        else:
+            cursor.execute('''
+                SELECT id, admin_name, action_type, target_name, details, timestamp
+                FROM admin_actions_log
+                WHERE guild_id = ? AND id < ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (guild_id, before_id if before_id is not None else 2 ** 63 - 1, limit))
+            rows = cursor.fetchall()
         
         logs = []
-        for row in cursor.fetchall():
+        for row in rows:
             logs.append({
-                'admin_name': row[0],
-                'action_type': row[1],
-                'target_name': row[2],
-                'details': row[3],
-                'timestamp': row[4]
+                'id': row[0],
+                'admin_name': row[1],
+                'action_type': row[2],
+                'target_name': row[3],
+                'details': row[4],
+                'timestamp': row[5]
             })
         
         conn.close()
         return logs
+    
+    def count_admin_logs(self, guild_id: str) -> int:
+        """Count a guild's admin action log entries."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT COUNT(*) FROM admin_actions_log WHERE guild_id = ?', (guild_id,))
+        count = cursor.fetchone()[0]
+        
+        conn.close()
+        return count
+    
+    def iter_admin_logs(self, guild_id: str, since: str = None,
+                        batch_size: int = 1000) -> Iterator[Dict]:
+        """Yield every admin action log entry of a guild, oldest first, in id-keyed batches."""
+        sql = '''
+            SELECT id, admin_id, admin_name, action_type, target_id, target_name, details, timestamp
+            FROM admin_actions_log
+            WHERE guild_id = ? AND id > ?
+        '''
+        params = [guild_id]
+        if since:
+            sql += ' AND timestamp >= ?'
+            params.append(since)
+        sql += ' ORDER BY id LIMIT ?'
+        
+        last_id = 0
+        while True:
+            conn = self.get_connection()
+            rows = conn.execute(sql, [params[0], last_id] + params[1:] + [batch_size]).fetchall()
+            conn.close()
+            
+            for row in rows:
+                yield {
+                    'id': row[0],
+                    'admin_id': row[1],
+                    'admin_name': row[2],
+                    'action_type': row[3],
+                    'target_id': row[4],
+                    'target_name': row[5],
+                    'details': row[6],
+                    'timestamp': row[7]
+                }
+            
+            if len(rows) < batch_size:
+                break
+            last_id = rows[-1][0]
+    
+    def iter_history_export(self, guild_id: str, channel_id: str = None, since: str = None,
+                            include_archive: bool = True, batch_size: int = 1000) -> Iterator[Dict]:
+        """Yield a guild's conversation history for export, oldest first.
+        
+        Archived segments come first (one decompressed segment in memory at
+        a time), then the hot table in id-keyed batches. A connection is only
+        held for one batch, so writers are never blocked for the whole export.
+        """
+        if include_archive:
+            sql = '''
+                SELECT id, channel_id, data
+                FROM archive_segments
+                WHERE guild_id = ? AND id > ?
+            '''
+            params = [guild_id]
+            if channel_id:
+                sql += ' AND channel_id = ?'
+                params.append(channel_id)
+            if since:
+                sql += ' AND end_timestamp >= ?'
+                params.append(since)
+            sql += ' ORDER BY id LIMIT 1'
+            
+            last_segment = 0
+            while True:
+                conn = sqlite3.connect(self.archive_path)
+                segment = conn.execute(sql, [params[0], last_segment] + params[1:]).fetchone()
+                conn.close()
+                if segment is None:
+                    break
+                
+                last_segment, segment_channel_id, data = segment
+                for line in zlib.decompress(data).decode('utf-8').split('\n'):
+                    msg = json.loads(line)
+                    if since and msg['timestamp'] < since:
+                        continue
+                    yield {
+                        'id': msg['id'],
+                        'channel_id': segment_channel_id,
+                        'user_id': msg['user_id'],
+                        'display_name': msg['display_name'],
+                        'role': msg['role'],
+                        'content': msg['content'],
+                        'timestamp': msg['timestamp'],
+                        'token_count': msg['token_count'],
+                        'archived': True
+                    }
+        
+        sql = '''
+            SELECT id, channel_id, user_id, display_name, role, content, timestamp, token_count
+            FROM conversation_history
+            WHERE guild_id = ? AND id > ?
+        '''
+        params = [guild_id]
+        if channel_id:
+            sql += ' AND channel_id = ?'
+            params.append(channel_id)
+        if since:
+            sql += ' AND timestamp >= ?'
+            params.append(since)
+        sql += ' ORDER BY id LIMIT ?'
+        
+        last_id = 0
+        while True:
+            conn = self.get_connection()
+            rows = conn.execute(sql, [params[0], last_id] + params[1:] + [batch_size]).fetchall()
+            conn.close()
+            
+            for row in rows:
+                yield {
+                    'id': row[0],
+                    'channel_id': row[1],
+                    'user_id': row[2],
+                    'display_name': row[3],
+                    'role': row[4],
+                    'content': row[5],
+                    'timestamp': row[6],
+                    'token_count': row[7],
+                    'archived': False
+                }
+            
+            if len(rows) < batch_size:
+                break
+            last_id = rows[-1][0]
+    
+    def search_history(self, guild_id: str, query: str, user_id: str = None,
+                       channel_id: str = None, since: str = None, until: str = None,
+                       limit: int = 20, include_archive: bool = True) -> List[Dict]:
+        """Full-text search over conversation history, newest matches first.
+        
+        `since` and `until` are UTC timestamps in SQLite format
+        ('YYYY-MM-DD HH:MM:SS'); a plain date also works. When the hot table
+        has fewer than `limit` matches, older matches are read from the
+        archive.
+        """
+        fts_query = to_fts_query(query)
+        if not fts_query:
+            return []
+        
+        sql = '''
+            SELECT h.id, h.channel_id, h.user_id, h.display_name, h.role,
+                   snippet(conversation_fts, 0, '**', '**', '…', 16), h.timestamp
+            FROM conversation_fts
+            JOIN conversation_history h ON h.id = conversation_fts.rowid
+            WHERE conversation_fts MATCH ? AND h.guild_id = ?
+        '''
+        params = [fts_query, guild_id]
+        
+        if user_id:
+            sql += ' AND h.user_id = ?'
+            params.append(user_id)
+        if channel_id:
+            sql += ' AND h.channel_id = ?'
+            params.append(channel_id)
+        if since:
+            sql += ' AND h.timestamp >= ?'
+            params.append(since)
+        if until:
+            sql += ' AND h.timestamp < ?'
+            params.append(until)
+        
+        # Ordering by the FTS rowid lets SQLite walk the index backwards and
+        # stop at LIMIT instead of sorting every match
+        sql += ' ORDER BY conversation_fts.rowid DESC LIMIT ?'
+        params.append(limit)
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+        
+        results = []
+        for row in rows:
+            results.append({
+                'id': row[0],
+                'channel_id': row[1],
+                'user_id': row[2],
+                'display_name': row[3],
+                'role': row[4],
+                'snippet': row[5],
+                'timestamp': row[6],
+                'archived': False
+            })
+        
+        if include_archive and len(results) < limit:
+            results.extend(self.search_archive(
+                guild_id, query, user_id, channel_id, since, until, limit - len(results)
+            ))
+        
+        return results
+    
+    def get_server_settings(self, guild_id: str) -> Dict:
+        """Get the settings JSON of a guild (empty dict if none are stored)."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT settings FROM server_settings WHERE guild_id = ?
+        ''', (guild_id,))
+        
+        row = cursor.fetchone()
+        conn.close()
+        
+        if not row or not row[0]:
+            return {}
+        return json.loads(row[0])
+    
+    def update_server_settings(self, guild_id: str, settings: Dict):
+        """Create or replace the settings JSON of a guild."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            INSERT INTO server_settings (guild_id, settings)
+            VALUES (?, ?)
+            ON CONFLICT(guild_id) DO UPDATE SET
+                settings = excluded.settings,
+                updated_at = CURRENT_TIMESTAMP
+        ''', (guild_id, json.dumps(settings)))
+        
+        conn.commit()
+        conn.close()
+    
+    def save_quota_buckets(self, buckets: List[tuple]):
+        """Replace the persisted quota buckets with (key, capacity, level, updated) rows."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('DELETE FROM quota_buckets')
+        cursor.executemany('''
+            INSERT INTO quota_buckets (bucket_key, capacity, level, updated)
+            VALUES (?, ?, ?, ?)
+        ''', buckets)
+        
+        conn.commit()
+        conn.close()
+    
+    def load_quota_buckets(self) -> List[tuple]:
+        """Load persisted quota buckets as (key, capacity, level, updated) rows."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT bucket_key, capacity, level, updated FROM quota_buckets')
+        rows = cursor.fetchall()
+        
+        conn.close()
+        return rows
+    
+    def log_model_route(self, guild_id: str, channel_id: str, route: str, model: Optional[str],
+                        reasons: str, input_chars: int, history_tokens: int, latency_ms: float,
+                        prompt_tokens: int, completion_tokens: int, success: bool):
+        """Record the routing decision and outcome of one model request."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            INSERT INTO model_routing_log
+            (guild_id, channel_id, route, model, reasons, input_chars, history_tokens,
+             latency_ms, prompt_tokens, completion_tokens, success)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (guild_id, channel_id, route, model, reasons, input_chars, history_tokens,
+              latency_ms, prompt_tokens, completion_tokens, success))
+        
+        conn.commit()
+        conn.close()
+    
+    def get_routing_summary(self, guild_id: str, days: int = 7) -> List[Dict]:
+        """Per route and model: request count, failures, average latency and tokens."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT route, model, COUNT(*), SUM(NOT success), AVG(latency_ms),
+                   AVG(prompt_tokens), AVG(completion_tokens)
+            FROM model_routing_log
+            WHERE guild_id = ? AND timestamp >= datetime('now', ?)
+            GROUP BY route, model
+            ORDER BY COUNT(*) DESC
+        ''', (guild_id, f'-{days} days'))
+        
+        summary = []
+        for row in cursor.fetchall():
+            summary.append({
+                'route': row[0],
+                'model': row[1],
+                'requests': row[2],
+                'failures': row[3],
+                'avg_latency_ms': round(row[4] or 0, 1),
+                'avg_prompt_tokens': round(row[5] or 0),
+                'avg_completion_tokens': round(row[6] or 0)
+            })
+        
+        conn.close()
+        return summary
+    
+    def record_usage(self, guild_id: str, channel_id: str, user_id: str, model: Optional[str],
+                     prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0,
+                     estimated: bool = False):
+        """Record the token usage of one model response and update the rollups."""
+        now = datetime.utcnow()
+        timestamp = now.strftime('%Y-%m-%d %H:%M:%S')
+        day = now.strftime('%Y-%m-%d')
+        model = model or 'unknown'
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            INSERT INTO usage_log
+            (guild_id, channel_id, user_id, model, prompt_tokens, completion_tokens,
+             cached_tokens, estimated, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (guild_id, channel_id, user_id, model, prompt_tokens, completion_tokens,
+              cached_tokens, estimated, timestamp))
+        
+        cursor.execute('''
+            INSERT INTO usage_daily
+            (guild_id, day, model, requests, prompt_tokens, completion_tokens,
+             cached_tokens, estimated_requests)
+            VALUES (?, ?, ?, 1, ?, ?, ?, ?)
+            ON CONFLICT(guild_id, day, model) DO UPDATE SET
+                requests = requests + 1,
+                prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                completion_tokens = completion_tokens + excluded.completion_tokens,
+                cached_tokens = cached_tokens + excluded.cached_tokens,
+                estimated_requests = estimated_requests + excluded.estimated_requests
+        ''', (guild_id, day, model, prompt_tokens, completion_tokens, cached_tokens, int(estimated)))
+        
+        cursor.execute('''
+            INSERT INTO usage_totals
+            (guild_id, model, requests, prompt_tokens, completion_tokens, cached_tokens, first_day)
+            VALUES (?, ?, 1, ?, ?, ?, ?)
+            ON CONFLICT(guild_id, model) DO UPDATE SET
+                requests = requests + 1,
+                prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                completion_tokens = completion_tokens + excluded.completion_tokens,
+                cached_tokens = cached_tokens + excluded.cached_tokens
+        ''', (guild_id, model, prompt_tokens, completion_tokens, cached_tokens, day))
+        
+        conn.commit()
+        conn.close()
+    
+    def get_daily_usage(self, guild_id: str, days: int = 7) -> List[Dict]:
+        """Per-day usage of a guild (all models combined), newest day first."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT day, SUM(requests), SUM(prompt_tokens), SUM(completion_tokens),
+                   SUM(cached_tokens), SUM(estimated_requests)
+            FROM usage_daily
+            WHERE guild_id = ? AND day > date('now', ?)
+            GROUP BY day
+            ORDER BY day DESC
+        ''', (guild_id, f'-{days} days'))
+        
+        usage = []
+        for row in cursor.fetchall():
+            usage.append({
+                'day': row[0],
+                'requests': row[1],
+                'prompt_tokens': row[2],
+                'completion_tokens': row[3],
+                'cached_tokens': row[4],
+                'estimated_requests': row[5]
+            })
+        
+        conn.close()
+        return usage
+    
+    def get_usage_totals(self, guild_id: str) -> List[Dict]:
+        """All-time usage of a guild per model, largest first."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT model, requests, prompt_tokens, completion_tokens, cached_tokens, first_day
+            FROM usage_totals
+            WHERE guild_id = ?
+            ORDER BY prompt_tokens + completion_tokens DESC
+        ''', (guild_id,))
+        
+        totals = []
+        for row in cursor.fetchall():
+            totals.append({
+                'model': row[0],
+                'requests': row[1],
+                'prompt_tokens': row[2],
+                'completion_tokens': row[3],
+                'cached_tokens': row[4],
+                'first_day': row[5]
+            })
+        
+        conn.close()
+        return totals
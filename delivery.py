@@ -0,0 +1,204 @@
+import re
+import time
+from collections import deque
+from typing import List
+
+# Discord's message length limit
+MESSAGE_LIMIT = 2000
+
+# Prefixed to every message after the first of one reply
+CONTINUED_MARKER = "*(continued)*"
+
+def split_long_line(line: str, limit: int) -> List[str]:
+    """Split a single line longer than `limit`, preferring whitespace."""
+    pieces = []
+    while len(line) > limit:
+        cut = line.rfind(' ', 0, limit)
+        if cut <= 0:
+            cut = limit
+        pieces.append(line[:cut])
+        line = line[cut:].lstrip(' ')
+    pieces.append(line)
+    return pieces
+
+# A ``` that is not escaped with a backslash
+FENCE_PATTERN = re.compile(r'(?<!\\)```')
+
+def count_fences(line: str) -> int:
+    """Count the fence markers in a line; an odd count opens or closes a code block.
+    
+    Discord treats every unescaped ``` as a fence, wherever it is on the
+    line, so inline blocks such as ```x``` (two markers) leave the state
+    unchanged.
+    """
+    return len(FENCE_PATTERN.findall(line))
+
+def split_code_block(lines: List[str], limit: int) -> List[str]:
+    """Split an oversized code block, closing and reopening the fence in every piece.
+    
+    Text before the opening fence and after the closing one is kept outside
+    the fence, in the first and last pieces.
+    """
+    # The block opens at the last marker of its first line and closes at the
+    # first marker of its last line
+    opening = list(FENCE_PATTERN.finditer(lines[0]))[-1]
+    prefix = lines[0][:opening.start()].rstrip()
+    opener = lines[0][opening.start():]
+    body = lines[1:]
+    if len(opener) > limit // 4:
+        # Not a language tag: keep it as code
+        body.insert(0, opener[3:])
+        opener = '```'
+    
+    suffix = ''
+    if body and count_fences(body[-1]) % 2:
+        closing = FENCE_PATTERN.search(body[-1])
+        last_line = body[-1][:closing.start()]
+        suffix = body[-1][closing.end():].strip()
+        body = body[:-1] + ([last_line] if last_line.strip() else [])
+    
+    budget = limit - len(opener) - len('\n\n```')
+    # A short prefix shares the first piece
+    lead = len(prefix) + 1 if prefix and len(prefix) < limit // 4 else 0
+    pieces = []
+    current = []
+    size = lead
+    for line in body:
+        for part in split_long_line(line, budget - lead):
+            if current and size + len(part) + 1 > budget:
+                pieces.append(current)
+                current, size = [], 0
+            current.append(part)
+            size += len(part) + 1
+    if current or not pieces:
+        pieces.append(current)
+    
+    chunks = ['\n'.join([opener] + piece + ['```']) for piece in pieces]
+    if lead:
+        chunks[0] = f"{prefix}\n{chunks[0]}"
+    elif prefix:
+        chunks = split_long_line(prefix, limit) + chunks
+    if suffix:
+        if len(chunks[-1]) + 1 + len(suffix) <= limit:
+            chunks[-1] += ' ' + suffix
+        else:
+            chunks += split_long_line(suffix, limit)
+    return chunks
+
+def markdown_units(text: str) -> List[List[str]]:
+    """Group lines into units that should stay together: whole code blocks or single lines."""
+    units = []
+    fence = None
+    for line in text.split('\n'):
+        if fence is not None:
+            fence.append(line)
+            if count_fences(line) % 2:
+                units.append(fence)
+                fence = None
+        elif count_fences(line) % 2:
+            fence = [line]
+        else:
+            units.append([line])
+    
+    # An unterminated fence (e.g. a truncated reply) runs to the end of the text
+    if fence is not None:
+        units.append(fence)
+    return units
+
+def split_markdown(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Split text into messages of at most `limit` characters.
+    
+    Lines are packed greedily and code blocks are kept whole; a code block
+    that does not fit in one message is split on line boundaries with the
+    fence closed and reopened, so every message renders correctly on its
+    own.
+    """
+    text = text.strip()
+    if len(text) <= limit:
+        return [text] if text else []
+    
+    chunks = []
+    current = ''
+    
+    def flush():
+        nonlocal current
+        if current.strip():
+            chunks.append(current.strip('\n'))
+        current = ''
+    
+    for unit in markdown_units(text):
+        block = '\n'.join(unit)
+        candidate = f"{current}\n{block}" if current else block
+        if len(candidate) <= limit:
+            current = candidate
+            continue
+        
+        if len(block) <= limit:
+            flush()
+            current = block
+            continue
+        
+        if count_fences(unit[0]) % 2:
+            pieces = split_code_block(unit, limit)
+        else:
+            pieces = split_long_line(block, limit)
+        # The first piece joins the current message if it fits; the last
+        # stays open so following lines can join it
+        if current and len(current) + 1 + len(pieces[0]) <= limit:
+            pieces[0] = f"{current}\n{pieces[0]}"
+            current = ''
+        flush()
+        chunks.extend(pieces[:-1])
+        current = pieces[-1]
+    
+    flush()
+    return chunks
+
+def pack_messages(parts: List[str], limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Merge several texts (tool results, the reply) into as few messages as possible.
+    
+    Follow-up messages start with CONTINUED_MARKER on a line of its own, so
+    readers can tell a split reply from a new one.
+    """
+    text = '\n\n'.join(part.strip() for part in parts if part and part.strip())
+    if len(text) <= limit:
+        return [text] if text else []
+    
+    chunks = split_markdown(text, limit - len(CONTINUED_MARKER) - 1)
+    return [chunks[0]] + [f"{CONTINUED_MARKER}\n{chunk}" for chunk in chunks[1:]]
+
+class RateWindow:
+    """Allows at most `limit` events per `period` seconds (sliding window)."""
+    
+    __slots__ = ('limit', 'period', 'events')
+    
+    def __init__(self, limit: int, period: float):
+        self.limit = limit
+        self.period = period
+        self.events = deque()
+    
+    def delay(self, now: float = None) -> float:
+        """Seconds until another event is allowed (0 if allowed now)."""
+        now = time.monotonic() if now is None else now
+        while self.events and now - self.events[0] >= self.period:
+            self.events.popleft()
+        if len(self.events) < self.limit:
+            return 0.0
+        return self.period - (now - self.events[0])
+    
+    def record(self, now: float = None):
+        self.events.append(time.monotonic() if now is None else now)
+
+async def deliver(bot, channel, *parts: str):
+    """Send texts to a channel through the DeliveryManager cog, merged and chunked.
+    
+    Falls back to sending the chunks directly if the cog is not loaded.
+    """
+    delivery_manager = bot.get_cog('DeliveryManager')
+    if delivery_manager is not None:
+        return await delivery_manager.send(channel, *parts)
+    
+    sent = []
+    for chunk in pack_messages(list(parts)):
+        sent.append(await channel.send(chunk))
+    return sent
@@ -0,0 +1,102 @@
+import csv
+import gzip
+import io
+import json
+import os
+from typing import Dict, Iterable, List
+
+EXPORT_FORMATS = ('jsonl', 'csv')
+
+ADMIN_LOG_FIELDS = ['id', 'timestamp', 'admin_id', 'admin_name', 'action_type',
+                    'target_id', 'target_name', 'details']
+
+HISTORY_FIELDS = ['id', 'timestamp', 'channel_id', 'user_id', 'display_name', 'role',
+                  'content', 'token_count', 'archived']
+
+class ExportWriter:
+    """Streams rows into gzip-compressed JSONL or CSV files.
+    
+    Rows are compressed as they are written, so memory use does not depend
+    on the export size. When a file's compressed size approaches
+    `max_bytes` (Discord's upload limit), a new part is started.
+    """
+    
+    def __init__(self, directory: str, basename: str, fields: List[str], fmt: str = 'jsonl',
+                 max_bytes: int = 25 * 1024 * 1024):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+        
+        self.directory = directory
+        self.basename = basename
+        self.fields = fields
+        self.fmt = fmt
+        # gzip buffers internally, so leave headroom below the limit
+        self.max_bytes = max(max_bytes - 1024 * 1024, max_bytes // 2)
+        
+        self.paths: List[str] = []
+        self.rows = 0
+        self.raw = None
+        self.stream = None
+        self.csv_writer = None
+    
+    def open_part(self):
+        self.close_part()
+        
+        suffix = f"-part{len(self.paths) + 1}" if self.paths else ""
+        path = os.path.join(self.directory, f"{self.basename}{suffix}.{self.fmt}.gz")
+        self.paths.append(path)
+        
+        self.raw = open(path, 'wb')
+        self.stream = io.TextIOWrapper(gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=6), encoding='utf-8', newline='')
+        if self.fmt == 'csv':
+            self.csv_writer = csv.DictWriter(self.stream, fieldnames=self.fields, extrasaction='ignore')
+            self.csv_writer.writeheader()
+    
+    def close_part(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.raw.close()
+            self.stream = None
+            self.raw = None
+    
+    def write(self, row: Dict):
+        if self.stream is None or self.raw.tell() >= self.max_bytes:
+            # The first part is renamed once a second one is needed
+            if len(self.paths) == 1:
+                first = self.paths[0]
+                self.close_part()
+                renamed = first.replace(f".{self.fmt}.gz", f"-part1.{self.fmt}.gz")
+                os.replace(first, renamed)
+                self.paths[0] = renamed
+            self.open_part()
+        
+        if self.fmt == 'csv':
+            self.csv_writer.writerow(row)
+        else:
+            self.stream.write(json.dumps({field: row.get(field) for field in self.fields}, ensure_ascii=False))
+            self.stream.write('\n')
+        self.rows += 1
+    
+    def close(self) -> List[str]:
+        """Finish the export and return the paths of the written files."""
+        if self.stream is None and not self.paths:
+            # No rows: still produce an (empty) file
+            self.open_part()
+        self.close_part()
+        return self.paths
+
+def export_rows(rows: Iterable[Dict], directory: str, basename: str, fields: List[str],
+                fmt: str = 'jsonl', max_bytes: int = 25 * 1024 * 1024) -> Dict:
+    """Write rows to compressed export files. Blocking; run it in a worker thread."""
+    writer = ExportWriter(directory, basename, fields, fmt, max_bytes)
+    try:
+        for row in rows:
+            writer.write(row)
+    finally:
+        paths = writer.close()
+    
+    return {
+        'rows': writer.rows,
+        'paths': paths,
+        'bytes': sum(os.path.getsize(path) for path in paths)
+    }
@@ -0,0 +1,186 @@
+import asyncio
+import base64
+import hashlib
+import io
+import math
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+from PIL import Image, ImageOps
+
+# Larger images are rejected before decoding (decompression bombs)
+MAX_SOURCE_PIXELS = 40_000_000
+
+def estimate_image_tokens(width: int, height: int, detail: str) -> int:
+    """Prompt tokens an image costs with OpenAI-style vision pricing.
+    
+    'low' detail is a flat 85 tokens. 'high' detail fits the image into
+    2048x2048, scales its shortest side down to 768 and charges 170 tokens
+    per 512px tile plus 85.
+    """
+    if detail == 'low':
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    if min(width, height) > 768:
+        scale = 768 / min(width, height)
+        width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+class ProcessedImage(NamedTuple):
+    """An attachment downscaled and re-encoded for the model."""
+    data_url: str
+    detail: str
+    width: int
+    height: int
+    source_bytes: int
+    encoded_bytes: int
+    tokens: int
+    
+    def to_content_part(self) -> Dict:
+        """Format the image as an OpenAI multimodal content part."""
+        return {"type": "image_url", "image_url": {"url": self.data_url, "detail": self.detail}}
+
+class ImageProcessor:
+    """Turns image attachments into compact content parts for vision models.
+    
+    Attachments of one message are downloaded concurrently; anything larger
+    than `max_bytes` is skipped before downloading. Decoding, downscaling to
+    `max_side` pixels and JPEG re-encoding run in a small thread pool, off
+    the event loop. Results are cached by attachment id and by content hash
+    (a repost of the same image is a hit too) in an LRU bounded by
+    `cache_bytes`, so replies and re-mentions reuse them.
+    """
+    
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024, max_side: int = 768, quality: int = 80,
+                 detail: str = 'high', cache_bytes: int = 16 * 1024 * 1024, threads: int = 2,
+                 download_timeout: float = 15.0):
+        self.max_bytes = max_bytes
+        self.detail = detail
+        # The provider shrinks low-detail images to 512px anyway
+        self.max_side = min(max_side, 512) if detail == 'low' else max_side
+        self.quality = quality
+        self.cache_bytes = cache_bytes
+        self.download_timeout = download_timeout
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='image')
+        
+        self.cache: "OrderedDict[str, ProcessedImage]" = OrderedDict()
+        self.attachment_hashes: Dict[int, str] = {}
+        self.total_bytes = 0
+        
+        self.stats = {
+            'images': 0,
+            'cache_hits': 0,
+            'too_large': 0,
+            'failed': 0,
+            'downloaded_bytes': 0,
+            'sent_bytes': 0,
+            'tokens': 0,
+            'process_ms': 0.0
+        }
+    
+    async def process(self, attachments: List) -> List[ProcessedImage]:
+        """Process image attachments concurrently, skipping those that fail or are too large."""
+        results = await asyncio.gather(*(self.process_one(attachment) for attachment in attachments))
+        images = [image for image in results if image is not None]
+        
+        self.stats['images'] += len(images)
+        self.stats['sent_bytes'] += sum(image.encoded_bytes for image in images)
+        self.stats['tokens'] += sum(image.tokens for image in images)
+        return images
+    
+    async def process_one(self, attachment) -> Optional[ProcessedImage]:
+        digest = self.attachment_hashes.get(attachment.id)
+        if digest and digest in self.cache:
+            return self.cache_hit(digest)
+        
+        if attachment.size > self.max_bytes:
+            self.stats['too_large'] += 1
+            print(f"Skipping image {attachment.filename}: {attachment.size:,} bytes exceeds the {self.max_bytes:,} byte limit")
+            return None
+        
+        try:
+            data = await asyncio.wait_for(attachment.read(), self.download_timeout)
+            self.stats['downloaded_bytes'] += len(data)
+            
+            digest = hashlib.sha256(data).hexdigest()
+            self.attachment_hashes[attachment.id] = digest
+            if digest in self.cache:
+                return self.cache_hit(digest)
+            
+            started = time.perf_counter()
+            image = await asyncio.get_running_loop().run_in_executor(self.executor, self.encode, data)
+            self.stats['process_ms'] += (time.perf_counter() - started) * 1000
+        except Exception as e:
+            self.stats['failed'] += 1
+            print(f"Error processing image {attachment.filename}: {e}")
+            return None
+        
+        self.store(digest, image)
+        return image
+    
+    def cache_hit(self, digest: str) -> ProcessedImage:
+        self.cache.move_to_end(digest)
+        self.stats['cache_hits'] += 1
+        return self.cache[digest]
+    
+    def store(self, digest: str, image: ProcessedImage):
+        self.cache[digest] = image
+        self.total_bytes += len(image.data_url)
+        while self.total_bytes > self.cache_bytes and len(self.cache) > 1:
+            _, evicted = self.cache.popitem(last=False)
+            self.total_bytes -= len(evicted.data_url)
+        
+        # Ids of evicted images only cost a dict entry; trim them occasionally
+        if len(self.attachment_hashes) > 4 * max(len(self.cache), 256):
+            self.attachment_hashes = {
+                attachment_id: digest for attachment_id, digest in self.attachment_hashes.items()
+                if digest in self.cache
+            }
+    
+    def encode(self, data: bytes) -> ProcessedImage:
+        """Decode, downscale and re-encode one image as JPEG. Blocking; runs in the thread pool."""
+        with Image.open(io.BytesIO(data)) as source:
+            if source.width * source.height > MAX_SOURCE_PIXELS:
+                raise ValueError(f"image is too large ({source.width}x{source.height})")
+            
+            # draft() lets the JPEG decoder downscale while decoding, which
+            # is much cheaper than decoding at full size
+            source.draft('RGB', (self.max_side, self.max_side))
+            image = ImageOps.exif_transpose(source)
+            
+            if image.mode in ('RGBA', 'LA', 'P'):
+                # JPEG has no alpha; flatten transparent images onto white
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+            
+            image.thumbnail((self.max_side, self.max_side), Image.LANCZOS)
+            
+            output = io.BytesIO()
+            image.save(output, 'JPEG', quality=self.quality, optimize=True)
+            encoded = output.getvalue()
+        
+        return ProcessedImage(
+            data_url="data:image/jpeg;base64," + base64.b64encode(encoded).decode('ascii'),
+            detail=self.detail,
+            width=image.width,
+            height=image.height,
+            source_bytes=len(data),
+            encoded_bytes=len(encoded),
+            tokens=estimate_image_tokens(image.width, image.height, self.detail)
+        )
+    
+    def get_stats(self) -> Dict:
+        """Get image processing and cache statistics."""
+        lookups = self.stats['images'] + self.stats['failed'] + self.stats['too_large']
+        return {
+            **self.stats,
+            'hit_rate': round(self.stats['cache_hits'] / lookups * 100, 2) if lookups else 0.0,
+            'cached': len(self.cache),
+            'cache_bytes': self.total_bytes
+        }
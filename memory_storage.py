@@ -0,0 +1,450 @@
+import itertools
+import json
+import threading
+from typing import List, Dict, Optional, Iterator
+from storage import Storage, HistoryMessage, WORD_PATTERN, search_terms, utc_now, utc_cutoff
+from database import make_snippet
+
+def matches_terms(content: str, terms: List[tuple]) -> bool:
+    """Whether `content` contains every term of search_terms() as whole words."""
+    words = WORD_PATTERN.findall(content.lower())
+    for phrase, prefix in terms:
+        *head, last = phrase
+        if not any(
+            words[i:i + len(head)] == head
+            and (words[i + len(head)].startswith(last) if prefix else words[i + len(head)] == last)
+            for i in range(len(words) - len(head))
+        ):
+            return False
+    return True
+
+class MemoryStorage(Storage):
+    """Storage backend keeping everything in process memory.
+    
+    Nothing survives a restart and nothing is shared between processes, so
+    it suits tests, benchmarks and throwaway bots rather than production
+    (and cannot be combined with AI_WORKERS). Behaves like the SQLite
+    backend otherwise: same ordering, filters, id sequences and rollups.
+    """
+    
+    def __init__(self):
+        # Methods are called from several threads via asyncio.to_thread
+        self.lock = threading.RLock()
+        self.ids = {
+            'history': itertools.count(1),
+            'admin_log': itertools.count(1)
+        }
+        
+        # (guild_id, channel_id) -> list of row dicts in id order
+        self.history: Dict[tuple, List[Dict]] = {}
+        self.archive: Dict[tuple, List[Dict]] = {}
+        self.profiles: Dict[tuple, Dict] = {}
+        self.activity_daily: Dict[tuple, List[int]] = {}
+        self.channel_activity_daily: Dict[tuple, List[int]] = {}
+        self.admin_log: List[Dict] = []
+        self.settings: Dict[str, str] = {}
+        self.quota_buckets: List[tuple] = []
+        self.routing_log: List[Dict] = []
+        self.usage_daily: Dict[tuple, Dict] = {}
+        self.usage_totals: Dict[tuple, Dict] = {}
+    
+    def add_message(self, guild_id: str, channel_id: str, user_id: str,
+                    display_name: str, role: str, content: str, token_count: int = 0) -> HistoryMessage:
+        """Add a message to conversation history."""
+        with self.lock:
+            row = {
+                'id': next(self.ids['history']),
+                'user_id': user_id,
+                'display_name': display_name,
+                'role': role,
+                'content': content,
+                'timestamp': utc_now(),
+                'token_count': token_count
+            }
+            self.history.setdefault((guild_id, channel_id), []).append(row)
+        return self.to_history_message(row)
+    
+    @staticmethod
+    def to_history_message(row: Dict) -> HistoryMessage:
+        return HistoryMessage(row['id'], row['display_name'], row['role'], row['content'],
+                              row['timestamp'], row['token_count'])
+    
+    def get_conversation_history(self, guild_id: str, channel_id: str,
+                                 limit: int = 50) -> List[HistoryMessage]:
+        """Retrieve recent conversation history in chronological order."""
+        with self.lock:
+            rows = self.history.get((guild_id, channel_id), [])
+            # Rows are appended in id and timestamp order
+            return [self.to_history_message(row) for row in rows[-limit:]] if limit > 0 else []
+    
+    def get_total_tokens(self, guild_id: str, channel_id: str) -> int:
+        """Get total token count for a conversation."""
+        with self.lock:
+            return sum(row['token_count'] or 0 for row in self.history.get((guild_id, channel_id), []))
+    
+    def reset_conversation(self, guild_id: str, channel_id: str):
+        """Reset conversation history for a channel."""
+        with self.lock:
+            self.history.pop((guild_id, channel_id), None)
+        print(f"Conversation history reset for guild {guild_id}, channel {channel_id}")
+    
+    def archive_messages(self, guild_id: str = None, channel_id: str = None,
+                         before: str = None) -> int:
+        """Move matching history rows into the (uncompressed) archive. Returns the row count."""
+        archived = 0
+        with self.lock:
+            for key in list(self.history):
+                if (guild_id and key[0] != guild_id) or (channel_id and key[1] != channel_id):
+                    continue
+                rows = self.history[key]
+                moved = [row for row in rows if not before or row['timestamp'] < before]
+                if not moved:
+                    continue
+                self.archive.setdefault(key, []).extend(moved)
+                self.archive[key].sort(key=lambda row: row['id'])
+                self.history[key] = [row for row in rows if before and row['timestamp'] >= before]
+                archived += len(moved)
+        return archived
+    
+    def get_archive_stats(self, guild_id: str = None) -> Dict:
+        """Get hot history and archive size statistics."""
+        with self.lock:
+            hot = [rows for key, rows in self.history.items() if not guild_id or key[0] == guild_id]
+            archived = [row for key, rows in self.archive.items() if not guild_id or key[0] == guild_id for row in rows]
+            raw_size = sum(len(json.dumps(row, ensure_ascii=False).encode('utf-8')) for row in archived)
+            return {
+                'hot_messages': sum(len(rows) for rows in hot),
+                'segments': 0,
+                'archived_messages': len(archived),
+                'raw_bytes': raw_size,
+                'compressed_bytes': raw_size,
+                'oldest_archived': min((row['timestamp'] for row in archived), default=None)
+            }
+    
+    def iter_history_export(self, guild_id: str, channel_id: str = None, since: str = None,
+                            include_archive: bool = True, batch_size: int = 1000) -> Iterator[Dict]:
+        """Yield a guild's conversation history for export, oldest first (archived rows first)."""
+        sources = ((self.archive, True), (self.history, False)) if include_archive else ((self.history, False),)
+        for table, archived in sources:
+            with self.lock:
+                rows = [
+                    {**row, 'channel_id': key[1]}
+                    for key, channel_rows in table.items()
+                    if key[0] == guild_id and (not channel_id or key[1] == channel_id)
+                    for row in channel_rows
+                    if not since or row['timestamp'] >= since
+                ]
+            rows.sort(key=lambda row: row['id'])
+            for row in rows:
+                yield {
+                    'id': row['id'],
+                    'channel_id': row['channel_id'],
+                    'user_id': row['user_id'],
+                    'display_name': row['display_name'],
+                    'role': row['role'],
+                    'content': row['content'],
+                    'timestamp': row['timestamp'],
+                    'token_count': row['token_count'],
+                    'archived': archived
+                }
+    
+    def search_history(self, guild_id: str, query: str, user_id: str = None,
+                       channel_id: str = None, since: str = None, until: str = None,
+                       limit: int = 20, include_archive: bool = True) -> List[Dict]:
+        """Search conversation history for all terms of `query` (whole words, see search_terms()), newest first."""
+        terms = search_terms(query)
+        if not terms:
+            return []
+        words = [word for phrase, _ in terms for word in phrase]
+        
+        results = []
+        sources = ((self.history, False), (self.archive, True)) if include_archive else ((self.history, False),)
+        for table, archived in sources:
+            with self.lock:
+                rows = [
+                    {**row, 'channel_id': key[1]}
+                    for key, channel_rows in table.items()
+                    if key[0] == guild_id and (not channel_id or key[1] == channel_id)
+                    for row in channel_rows
+                ]
+            rows.sort(key=lambda row: row['id'], reverse=True)
+            
+            for row in rows:
+                if len(results) >= limit:
+                    return results
+                if user_id and row['user_id'] != user_id:
+                    continue
+                if (since and row['timestamp'] < since) or (until and row['timestamp'] >= until):
+                    continue
+                if matches_terms(row['content'], terms):
+                    results.append({
+                        'id': row['id'],
+                        'channel_id': row['channel_id'],
+                        'user_id': row['user_id'],
+                        'display_name': row['display_name'],
+                        'role': row['role'],
+                        'snippet': make_snippet(row['content'], words),
+                        'timestamp': row['timestamp'],
+                        'archived': archived
+                    })
+        return results
+    
+    def record_user_activity(self, guild_id: str, channel_id: str, user_id: str,
+                             display_name: str, token_count: int = 0, timestamp: str = None):
+        """Update a member's profile and the activity rollups for one user message."""
+        timestamp = timestamp or utc_now()
+        day = timestamp[:10]
+        
+        with self.lock:
+            profile = self.profiles.setdefault((guild_id, user_id), {
+                'first_seen': timestamp,
+                'message_count': 0
+            })
+            profile['display_name'] = display_name
+            profile['last_seen'] = timestamp
+            profile['message_count'] += 1
+            
+            for counts, key in ((self.activity_daily, (guild_id, user_id, day)),
+                                (self.channel_activity_daily, (guild_id, channel_id, day))):
+                current = counts.setdefault(key, [0, 0])
+                current[0] += 1
+                current[1] += token_count
+    
+    def get_user_activity(self, user_id: str, guild_id: str) -> Optional[Dict]:
+        """Get a member's profile and 7/30/90-day activity, or None for unknown members."""
+        cutoffs = {days: utc_cutoff(days)[:10] for days in (7, 30, 90)}
+        recent = {'7': 0, '30': 0, '90': 0, 'days_30': 0, 'tokens': 0}
+        
+        with self.lock:
+            profile = self.profiles.get((guild_id, user_id))
+            if not profile:
+                return None
+            profile = dict(profile)
+            
+            for (row_guild_id, row_user_id, day), (messages, tokens) in self.activity_daily.items():
+                if row_guild_id != guild_id or row_user_id != user_id or day <= cutoffs[90]:
+                    continue
+                recent['90'] += messages
+                recent['tokens'] += tokens
+                if day > cutoffs[30]:
+                    recent['30'] += messages
+                    recent['days_30'] += 1
+                if day > cutoffs[7]:
+                    recent['7'] += messages
+        
+        return {
+            'display_name': profile['display_name'],
+            'first_seen': profile['first_seen'],
+            'last_seen': profile['last_seen'],
+            'total_messages': profile['message_count'],
+            'messages_last_7_days': recent['7'],
+            'messages_last_30_days': recent['30'],
+            'messages_last_90_days': recent['90'],
+            'active_days_last_30_days': recent['days_30'],
+            'tokens_last_90_days': recent['tokens']
+        }
+    
+    def sum_activity(self, counts: Dict[tuple, List[int]], guild_id: str, days: int) -> Dict[str, List[int]]:
+        """Sum (messages, tokens, active days) per user or channel over the last `days` days."""
+        cutoff = utc_cutoff(days)[:10]
+        totals = {}
+        with self.lock:
+            for (row_guild_id, key, day), (messages, tokens) in counts.items():
+                if row_guild_id != guild_id or day <= cutoff:
+                    continue
+                total = totals.setdefault(key, [0, 0, 0])
+                total[0] += messages
+                total[1] += tokens
+                total[2] += 1
+        return totals
+    
+    def get_top_users(self, guild_id: str, days: int = 7, limit: int = 10) -> List[Dict]:
+        """Most active members of a guild over the last `days` days."""
+        totals = self.sum_activity(self.activity_daily, guild_id, days)
+        users = []
+        for user_id, (messages, tokens, active_days) in sorted(totals.items(), key=lambda item: -item[1][0])[:limit]:
+            profile = self.profiles.get((guild_id, user_id))
+            users.append({
+                'user_id': user_id,
+                'display_name': profile['display_name'] if profile else user_id,
+                'messages': messages,
+                'tokens': tokens,
+                'active_days': active_days
+            })
+        return users
+    
+    def get_channel_activity(self, guild_id: str, days: int = 7, limit: int = 10) -> List[Dict]:
+        """Busiest channels of a guild over the last `days` days."""
+        totals = self.sum_activity(self.channel_activity_daily, guild_id, days)
+        channels = []
+        for channel_id, (messages, tokens, active_days) in sorted(totals.items(), key=lambda item: -item[1][0])[:limit]:
+            channels.append({
+                'channel_id': channel_id,
+                'messages': messages,
+                'tokens': tokens,
+                'active_days': active_days
+            })
+        return channels
+    
+    def log_admin_action(self, guild_id: str, admin_id: str, admin_name: str,
+                         action_type: str, target_id: str = None,
+                         target_name: str = None, details: str = None):
+        """Log an admin action."""
+        with self.lock:
+            self.admin_log.append({
+                'id': next(self.ids['admin_log']),
+                'guild_id': guild_id,
+                'admin_id': admin_id,
+                'admin_name': admin_name,
+                'action_type': action_type,
+                'target_id': target_id,
+                'target_name': target_name,
+                'details': details,
+                'timestamp': utc_now()
+            })
+    
+    def get_admin_logs(self, guild_id: str, limit: int = 10, before_id: int = None,
+                       after_id: int = None) -> List[Dict]:
+        """Retrieve one page of admin action logs, newest first (keyset pagination by id)."""
+        with self.lock:
+            rows = [row for row in self.admin_log if row['guild_id'] == guild_id]
+        
+        if after_id is not None:
+            rows = [row for row in rows if row['id'] > after_id][:limit][::-1]
+        else:
+            rows = [row for row in reversed(rows) if before_id is None or row['id'] < before_id][:limit]
+        
+        return [{
+            'id': row['id'],
+            'admin_name': row['admin_name'],
+            'action_type': row['action_type'],
+            'target_name': row['target_name'],
+            'details': row['details'],
+            'timestamp': row['timestamp']
+        } for row in rows]
+    
+    def count_admin_logs(self, guild_id: str) -> int:
+        """Count a guild's admin action log entries."""
+        with self.lock:
+            return sum(1 for row in self.admin_log if row['guild_id'] == guild_id)
+    
+    def iter_admin_logs(self, guild_id: str, since: str = None,
+                        batch_size: int = 1000) -> Iterator[Dict]:
+        """Yield every admin action log entry of a guild, oldest first."""
+        with self.lock:
+            rows = [
+                row for row in self.admin_log
+                if row['guild_id'] == guild_id and (not since or row['timestamp'] >= since)
+            ]
+        for row in rows:
+            yield {key: value for key, value in row.items() if key != 'guild_id'}
+    
+    def get_server_settings(self, guild_id: str) -> Dict:
+        """Get the settings JSON of a guild (empty dict if none are stored)."""
+        # Stored serialized, so callers never share the stored object
+        with self.lock:
+            settings = self.settings.get(guild_id)
+        return json.loads(settings) if settings else {}
+    
+    def update_server_settings(self, guild_id: str, settings: Dict):
+        """Create or replace the settings JSON of a guild."""
+        with self.lock:
+            self.settings[guild_id] = json.dumps(settings)
+    
+    def save_quota_buckets(self, buckets: List[tuple]):
+        """Replace the persisted quota buckets with (key, capacity, level, updated) rows."""
+        with self.lock:
+            self.quota_buckets = [tuple(bucket) for bucket in buckets]
+    
+    def load_quota_buckets(self) -> List[tuple]:
+        """Load persisted quota buckets as (key, capacity, level, updated) rows."""
+        with self.lock:
+            return list(self.quota_buckets)
+    
+    def log_model_route(self, guild_id: str, channel_id: str, route: str, model: Optional[str],
+                        reasons: str, input_chars: int, history_tokens: int, latency_ms: float,
+                        prompt_tokens: int, completion_tokens: int, success: bool):
+        """Record the routing decision and outcome of one model request."""
+        with self.lock:
+            self.routing_log.append({
+                'guild_id': guild_id,
+                'route': route,
+                'model': model,
+                'latency_ms': latency_ms,
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'success': bool(success),
+                'timestamp': utc_now()
+            })
+    
+    def get_routing_summary(self, guild_id: str, days: int = 7) -> List[Dict]:
+        """Per route and model: request count, failures, average latency and tokens."""
+        cutoff = utc_cutoff(days)
+        groups = {}
+        with self.lock:
+            for row in self.routing_log:
+                if row['guild_id'] == guild_id and row['timestamp'] >= cutoff:
+                    groups.setdefault((row['route'], row['model']), []).append(row)
+        
+        summary = []
+        for (route, model), rows in sorted(groups.items(), key=lambda item: -len(item[1])):
+            summary.append({
+                'route': route,
+                'model': model,
+                'requests': len(rows),
+                'failures': sum(1 for row in rows if not row['success']),
+                'avg_latency_ms': round(sum(row['latency_ms'] or 0 for row in rows) / len(rows), 1),
+                'avg_prompt_tokens': round(sum(row['prompt_tokens'] or 0 for row in rows) / len(rows)),
+                'avg_completion_tokens': round(sum(row['completion_tokens'] or 0 for row in rows) / len(rows))
+            })
+        return summary
+    
+    def record_usage(self, guild_id: str, channel_id: str, user_id: str, model: Optional[str],
+                     prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0,
+                     estimated: bool = False):
+        """Update the usage rollups for one model response (raw rows are not kept)."""
+        day = utc_now()[:10]
+        model = model or 'unknown'
+        
+        with self.lock:
+            daily = self.usage_daily.setdefault((guild_id, day, model), {
+                'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                'cached_tokens': 0, 'estimated_requests': 0
+            })
+            totals = self.usage_totals.setdefault((guild_id, model), {
+                'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                'cached_tokens': 0, 'first_day': day
+            })
+            for counts in (daily, totals):
+                counts['requests'] += 1
+                counts['prompt_tokens'] += prompt_tokens
+                counts['completion_tokens'] += completion_tokens
+                counts['cached_tokens'] += cached_tokens
+            daily['estimated_requests'] += int(estimated)
+    
+    def get_daily_usage(self, guild_id: str, days: int = 7) -> List[Dict]:
+        """Per-day usage of a guild (all models combined), newest day first."""
+        cutoff = utc_cutoff(days)[:10]
+        per_day = {}
+        with self.lock:
+            for (row_guild_id, day, model), counts in self.usage_daily.items():
+                if row_guild_id != guild_id or day <= cutoff:
+                    continue
+                total = per_day.setdefault(day, {
+                    'day': day, 'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                    'cached_tokens': 0, 'estimated_requests': 0
+                })
+                for key, value in counts.items():
+                    total[key] += value
+        return sorted(per_day.values(), key=lambda row: row['day'], reverse=True)
+    
+    def get_usage_totals(self, guild_id: str) -> List[Dict]:
+        """All-time usage of a guild per model, largest first."""
+        with self.lock:
+            totals = [
+                {'model': model, **counts}
+                for (row_guild_id, model), counts in self.usage_totals.items()
+                if row_guild_id == guild_id
+            ]
+        totals.sort(key=lambda row: row['prompt_tokens'] + row['completion_tokens'], reverse=True)
+        return totals
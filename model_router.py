@@ -0,0 +1,112 @@
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Phrases that suggest an administrator wants a moderation tool
+ADMIN_INTENT = re.compile(
+    r'\b(kick|ban|unban|mute|timeout|warn|moderat\w*|create (a |the )?channel|'
+    r'activity|who said|search (the )?history|chat history)\b',
+    re.IGNORECASE
+)
+
+# Phrases that suggest a web search is needed
+SEARCH_INTENT = re.compile(
+    r'\b(search|look ?up|google|latest|news|today|current(ly)?|price of|weather|'
+    r'who won|release date|recent(ly)?)\b',
+    re.IGNORECASE
+)
+
+class RouteDecision(NamedTuple):
+    """Where one request is sent and why."""
+    route: str                  # 'fast' or 'strong'
+    model: Optional[str]        # None means the client's default model
+    max_tokens: int
+    reasons: Tuple[str, ...]
+
+class ModelRouter:
+    """Sends simple turns to a fast model and everything else to a strong one.
+    
+    Classification uses cheap local signals only: message length, code
+    blocks, admin-tool or search intent, attached images, and the token
+    count of the history that goes with the request. Any signal routes to the strong model; a
+    turn with none of them is answered by the fast model with a smaller
+    reply budget. Routing is off when no fast model is configured.
+    """
+    
+    def __init__(self, fast_model: Optional[str] = None, strong_model: Optional[str] = None,
+                 fast_max_tokens: int = 600, max_fast_chars: int = 280,
+                 max_fast_history_tokens: int = 4000):
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.fast_max_tokens = fast_max_tokens
+        self.max_fast_chars = max_fast_chars
+        self.max_fast_history_tokens = max_fast_history_tokens
+        
+        self.stats: Dict[str, Dict[str, float]] = {}
+    
+    @property
+    def enabled(self) -> bool:
+        return bool(self.fast_model)
+    
+    def classify(self, text: str, is_admin: bool, history_tokens: int, images: int = 0) -> List[str]:
+        """Return the reasons a turn needs the strong model (empty for a simple turn)."""
+        reasons = []
+        if images:
+            reasons.append('image')
+        if len(text) > self.max_fast_chars:
+            reasons.append('long')
+        if '```' in text:
+            reasons.append('code')
+        if is_admin and ADMIN_INTENT.search(text):
+            reasons.append('admin')
+        if SEARCH_INTENT.search(text):
+            reasons.append('search')
+        if history_tokens > self.max_fast_history_tokens:
+            reasons.append('history')
+        return reasons
+    
+    def route(self, text: str, is_admin: bool, history_tokens: int, settings: Dict,
+              images: int = 0) -> RouteDecision:
+        """Pick the model and reply budget for one turn.
+        
+        `settings` are the guild's settings: `ai_model` replaces the strong
+        model, `max_response_tokens` caps both routes and `model_routing`
+        turns routing off for the guild.
+        """
+        strong_model = settings['ai_model'] or self.strong_model
+        max_tokens = settings['max_response_tokens']
+        
+        if not self.enabled or not settings['model_routing']:
+            return RouteDecision('strong', strong_model, max_tokens, ('disabled',))
+        
+        reasons = self.classify(text, is_admin, history_tokens, images)
+        if reasons:
+            return RouteDecision('strong', strong_model, max_tokens, tuple(reasons))
+        return RouteDecision('fast', self.fast_model, min(self.fast_max_tokens, max_tokens), ())
+    
+    def record(self, decision: RouteDecision, latency_ms: float, prompt_tokens: int = 0,
+               completion_tokens: int = 0, failed: bool = False):
+        """Add the outcome of a routed request to the per-route totals."""
+        stats = self.stats.setdefault(decision.route, {
+            'requests': 0, 'failures': 0, 'latency_ms': 0.0,
+            'prompt_tokens': 0, 'completion_tokens': 0
+        })
+        stats['requests'] += 1
+        stats['latency_ms'] += latency_ms
+        if failed:
+            stats['failures'] += 1
+        stats['prompt_tokens'] += prompt_tokens
+        stats['completion_tokens'] += completion_tokens
+    
+    def get_stats(self) -> Dict[str, Dict]:
+        """Get per-route request counts, average latency and average tokens."""
+        result = {}
+        for route, stats in self.stats.items():
+            requests = stats['requests']
+            result[route] = {
+                'requests': requests,
+                'failures': stats['failures'],
+                'avg_latency_ms': round(stats['latency_ms'] / requests, 1),
+                'avg_prompt_tokens': round(stats['prompt_tokens'] / requests),
+                'avg_completion_tokens': round(stats['completion_tokens'] / requests)
+            }
+        return result
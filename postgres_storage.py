@@ -0,0 +1,718 @@
+import asyncio
+import json
+import threading
+from typing import List, Dict, Optional, Iterator
+from storage import Storage, HistoryMessage, search_terms, utc_now, utc_cutoff
+from database import make_snippet
+
+try:
+    import asyncpg
+except ImportError:  # Optional dependency, only needed with STORAGE_BACKEND=postgres
+    asyncpg = None
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS conversation_history (
+        id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+        guild_id TEXT NOT NULL,
+        channel_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        display_name TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        token_count INTEGER DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_history_channel ON conversation_history (guild_id, channel_id, id);
+    CREATE INDEX IF NOT EXISTS idx_history_timestamp ON conversation_history (timestamp);
+    CREATE INDEX IF NOT EXISTS idx_history_guild ON conversation_history (guild_id, id);
+    -- Word index for !search; the 'simple' configuration lowercases without stemming
+    ALTER TABLE conversation_history ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED;
+    CREATE INDEX IF NOT EXISTS idx_history_search ON conversation_history USING GIN (search_vector);
+    
+    -- Archived rows keep their ids; PostgreSQL compresses large values itself
+    CREATE TABLE IF NOT EXISTS archived_messages (
+        id BIGINT PRIMARY KEY,
+        guild_id TEXT NOT NULL,
+        channel_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        display_name TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        token_count INTEGER DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_archived_guild ON archived_messages (guild_id, id);
+    ALTER TABLE archived_messages ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED;
+    CREATE INDEX IF NOT EXISTS idx_archived_search ON archived_messages USING GIN (search_vector);
+    
+    CREATE TABLE IF NOT EXISTS user_profiles (
+        guild_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        display_name TEXT NOT NULL,
+        first_seen TEXT NOT NULL,
+        last_seen TEXT NOT NULL,
+        message_count INTEGER DEFAULT 0,
+        PRIMARY KEY (guild_id, user_id)
+    );
+    
+    CREATE TABLE IF NOT EXISTS activity_daily (
+        guild_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        day TEXT NOT NULL,
+        messages INTEGER DEFAULT 0,
+        tokens INTEGER DEFAULT 0,
+        PRIMARY KEY (guild_id, user_id, day)
+    );
+    CREATE INDEX IF NOT EXISTS idx_activity_guild_day ON activity_daily (guild_id, day);
+    
+    CREATE TABLE IF NOT EXISTS channel_activity_daily (
+        guild_id TEXT NOT NULL,
+        channel_id TEXT NOT NULL,
+        day TEXT NOT NULL,
+        messages INTEGER DEFAULT 0,
+        tokens INTEGER DEFAULT 0,
+        PRIMARY KEY (guild_id, day, channel_id)
+    );
+    
+    CREATE TABLE IF NOT EXISTS server_settings (
+        guild_id TEXT PRIMARY KEY,
+        settings TEXT,
+        created_at TIMESTAMPTZ DEFAULT now(),
+        updated_at TIMESTAMPTZ DEFAULT now()
+    );
+    
+    CREATE TABLE IF NOT EXISTS quota_buckets (
+        bucket_key TEXT PRIMARY KEY,
+        capacity DOUBLE PRECISION NOT NULL,
+        level DOUBLE PRECISION NOT NULL,
+        updated DOUBLE PRECISION NOT NULL
+    );
+    
+    CREATE TABLE IF NOT EXISTS usage_log (
+        id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+        guild_id TEXT NOT NULL,
+        channel_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        model TEXT,
+        prompt_tokens INTEGER NOT NULL,
+        completion_tokens INTEGER NOT NULL,
+        cached_tokens INTEGER DEFAULT 0,
+        estimated BOOLEAN DEFAULT FALSE,
+        timestamp TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_usage_guild ON usage_log (guild_id, timestamp);
+    
+    CREATE TABLE IF NOT EXISTS usage_daily (
+        guild_id TEXT NOT NULL,
+        day TEXT NOT NULL,
+        model TEXT NOT NULL,
+        requests INTEGER DEFAULT 0,
+        prompt_tokens BIGINT DEFAULT 0,
+        completion_tokens BIGINT DEFAULT 0,
+        cached_tokens BIGINT DEFAULT 0,
+        estimated_requests INTEGER DEFAULT 0,
+        PRIMARY KEY (guild_id, day, model)
+    );
+    
+    CREATE TABLE IF NOT EXISTS usage_totals (
+        guild_id TEXT NOT NULL,
+        model TEXT NOT NULL,
+        requests BIGINT DEFAULT 0,
+        prompt_tokens BIGINT DEFAULT 0,
+        completion_tokens BIGINT DEFAULT 0,
+        cached_tokens BIGINT DEFAULT 0,
+        first_day TEXT,
+        PRIMARY KEY (guild_id, model)
+    );
+    
+    CREATE TABLE IF NOT EXISTS admin_actions_log (
+        id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+        guild_id TEXT NOT NULL,
+        admin_id TEXT NOT NULL,
+        admin_name TEXT NOT NULL,
+        action_type TEXT NOT NULL,
+        target_id TEXT,
+        target_name TEXT,
+        details TEXT,
+        timestamp TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_admin_logs_guild ON admin_actions_log (guild_id, id);
+    
+    CREATE TABLE IF NOT EXISTS model_routing_log (
+        id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+        guild_id TEXT NOT NULL,
+        channel_id TEXT NOT NULL,
+        route TEXT NOT NULL,
+        model TEXT,
+        reasons TEXT,
+        input_chars INTEGER,
+        history_tokens INTEGER,
+        latency_ms DOUBLE PRECISION,
+        prompt_tokens INTEGER,
+        completion_tokens INTEGER,
+        success BOOLEAN,
+        timestamp TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_routing_guild ON model_routing_log (guild_id, timestamp);
+'''
+
+class PostgresStorage(Storage):
+    """Storage backend on PostgreSQL through an asyncpg connection pool.
+    
+    Lets several bot processes or hosts share one database. The Storage
+    interface is blocking (cogs call it through asyncio.to_thread), so the
+    pool lives on its own event loop in a background thread and each method
+    submits its query there and waits for the result; up to `max_size`
+    queries from different threads run at once. Timestamps are stored as
+    text in the same format as the SQLite backend, so filters and exports
+    behave identically.
+    """
+    
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10):
+        if asyncpg is None:
+            raise RuntimeError("STORAGE_BACKEND=postgres requires the asyncpg package (pip install asyncpg)")
+        
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='postgres-storage', daemon=True)
+        self.thread.start()
+        
+        # create_pool() returns an awaitable Pool, not a coroutine
+        async def connect():
+            return await asyncpg.create_pool(dsn, min_size=min_size, max_size=max_size)
+        
+        self.pool = self.run(connect())
+        self.execute(SCHEMA)
+        print("PostgreSQL storage initialized successfully")
+    
+    def run(self, coro):
+        """Run a coroutine on the pool's event loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+    
+    def execute(self, sql: str, *args) -> str:
+        return self.run(self.pool.execute(sql, *args))
+    
+    def fetch(self, sql: str, *args) -> list:
+        return self.run(self.pool.fetch(sql, *args))
+    
+    def fetchrow(self, sql: str, *args):
+        return self.run(self.pool.fetchrow(sql, *args))
+    
+    def fetchval(self, sql: str, *args):
+        return self.run(self.pool.fetchval(sql, *args))
+    
+    def transaction(self, statements: List[tuple]):
+        """Execute (sql, args) statements in one transaction."""
+        async def run():
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    for sql, args in statements:
+                        await conn.execute(sql, *args)
+        self.run(run())
+    
+    def close(self):
+        """Close the pool and stop its event loop."""
+        self.run(self.pool.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+    
+    def add_message(self, guild_id: str, channel_id: str, user_id: str,
+                    display_name: str, role: str, content: str, token_count: int = 0) -> HistoryMessage:
+        """Add a message to conversation history."""
+        timestamp = utc_now()
+        message_id = self.fetchval('''
+            INSERT INTO conversation_history
+            (guild_id, channel_id, user_id, display_name, role, content, timestamp, token_count)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+            RETURNING id
+        ''', guild_id, channel_id, user_id, display_name, role, content, timestamp, token_count)
+        return HistoryMessage(message_id, display_name, role, content, timestamp, token_count)
+    
+    def get_conversation_history(self, guild_id: str, channel_id: str,
+                                 limit: int = 50) -> List[HistoryMessage]:
+        """Retrieve recent conversation history in chronological order."""
+        rows = self.fetch('''
+            SELECT id, display_name, role, content, timestamp, token_count
+            FROM conversation_history
+            WHERE guild_id = $1 AND channel_id = $2
+            ORDER BY id DESC
+            LIMIT $3
+        ''', guild_id, channel_id, limit)
+        return [HistoryMessage(*row) for row in reversed(rows)]
+    
+    def get_total_tokens(self, guild_id: str, channel_id: str) -> int:
+        """Get total token count for a conversation."""
+        result = self.fetchval('''
+            SELECT SUM(token_count)
+            FROM conversation_history
+            WHERE guild_id = $1 AND channel_id = $2
+        ''', guild_id, channel_id)
+        return int(result) if result else 0
+    
+    def reset_conversation(self, guild_id: str, channel_id: str):
+        """Reset conversation history for a channel."""
+        self.execute('''
+            DELETE FROM conversation_history
+            WHERE guild_id = $1 AND channel_id = $2
+        ''', guild_id, channel_id)
+        print(f"Conversation history reset for guild {guild_id}, channel {channel_id}")
+    
+    @staticmethod
+    def filters(start: int, guild_id: str = None, channel_id: str = None, user_id: str = None,
+                since: str = None, until: str = None, before: str = None) -> tuple:
+        """Build AND-ed WHERE conditions, numbering placeholders from `start`."""
+        sql = ''
+        params = []
+        for condition, value in (('guild_id = ', guild_id), ('channel_id = ', channel_id),
+                                 ('user_id = ', user_id), ('timestamp >= ', since),
+                                 ('timestamp < ', until), ('timestamp < ', before)):
+            if value:
+                params.append(value)
+                sql += f' AND {condition}${start + len(params) - 1}'
+        return sql, params
+    
+    def archive_messages(self, guild_id: str = None, channel_id: str = None,
+                         before: str = None) -> int:
+        """Move matching history rows into `archived_messages` in one transaction. Returns the row count."""
+        where, params = self.filters(1, guild_id=guild_id, channel_id=channel_id, before=before)
+        status = self.execute(f'''
+            WITH moved AS (
+                DELETE FROM conversation_history
+                WHERE TRUE{where}
+                RETURNING id, guild_id, channel_id, user_id, display_name, role, content, timestamp, token_count
+            )
+            INSERT INTO archived_messages
+            (id, guild_id, channel_id, user_id, display_name, role, content, timestamp, token_count)
+            SELECT * FROM moved
+            ON CONFLICT (id) DO NOTHING
+        ''', *params)
+        # Status is 'INSERT 0 <rows>'
+        return int(status.split()[-1])
+    
+    def get_archive_stats(self, guild_id: str = None) -> Dict:
+        """Get hot history and archive size statistics."""
+        where = ' WHERE guild_id = $1' if guild_id else ''
+        params = (guild_id,) if guild_id else ()
+        
+        hot_messages = self.fetchval(f'SELECT COUNT(*) FROM conversation_history{where}', *params)
+        archived = self.fetchrow(f'''
+            SELECT COUNT(*), SUM(octet_length(content))::bigint, SUM(pg_column_size(content))::bigint, MIN(timestamp)
+            FROM archived_messages{where}
+        ''', *params)
+        
+        return {
+            'hot_messages': hot_messages,
+            'segments': 0,
+            'archived_messages': archived[0],
+            'raw_bytes': archived[1] or 0,
+            'compressed_bytes': archived[2] or 0,
+            'oldest_archived': archived[3]
+        }
+    
+    def iter_history_export(self, guild_id: str, channel_id: str = None, since: str = None,
+                            include_archive: bool = True, batch_size: int = 1000) -> Iterator[Dict]:
+        """Yield a guild's conversation history for export, oldest first, in id-keyed batches.
+        
+        Archived rows come first, then the hot table; no connection is held
+        between batches.
+        """
+        where, params = self.filters(3, channel_id=channel_id, since=since)
+        tables = (('archived_messages', True), ('conversation_history', False)) if include_archive \
+            else (('conversation_history', False),)
+        
+        for table, archived in tables:
+            last_id = 0
+            while True:
+                rows = self.fetch(f'''
+                    SELECT id, channel_id, user_id, display_name, role, content, timestamp, token_count
+                    FROM {table}
+                    WHERE guild_id = $1 AND id > $2{where}
+                    ORDER BY id
+                    LIMIT {int(batch_size)}
+                ''', guild_id, last_id, *params)
+                
+                for row in rows:
+                    yield {
+                        'id': row[0],
+                        'channel_id': row[1],
+                        'user_id': row[2],
+                        'display_name': row[3],
+                        'role': row[4],
+                        'content': row[5],
+                        'timestamp': row[6],
+                        'token_count': row[7],
+                        'archived': archived
+                    }
+                
+                if len(rows) < batch_size:
+                    break
+                last_id = rows[-1][0]
+    
+    def search_history(self, guild_id: str, query: str, user_id: str = None,
+                       channel_id: str = None, since: str = None, until: str = None,
+                       limit: int = 20, include_archive: bool = True) -> List[Dict]:
+        """Search conversation history for all terms of `query` (whole words, see search_terms()), newest first.
+        
+        Terms are matched against the GIN-indexed search_vector column. When
+        the hot table has fewer than `limit` matches, older matches are read
+        from the archive.
+        """
+        terms = search_terms(query)
+        if not terms:
+            return []
+        words = [word for phrase, _ in terms for word in phrase]
+        
+        # Each term is a phrase of quoted lexemes, its last one a prefix with '*'
+        tsquery = ' & '.join(
+            ' <-> '.join("'" + word.replace("'", "''") + "'" for word in phrase) + (':*' if prefix else '')
+            for phrase, prefix in terms
+        )
+        where, params = self.filters(2, user_id=user_id, channel_id=channel_id, since=since, until=until)
+        params.append(tsquery)
+        where += f" AND search_vector @@ to_tsquery('simple', ${len(params) + 1})"
+        
+        results = []
+        tables = (('conversation_history', False), ('archived_messages', True)) if include_archive \
+            else (('conversation_history', False),)
+        for table, archived in tables:
+            rows = self.fetch(f'''
+                SELECT id, channel_id, user_id, display_name, role, content, timestamp
+                FROM {table}
+                WHERE guild_id = $1{where}
+                ORDER BY id DESC
+                LIMIT {int(limit - len(results))}
+            ''', guild_id, *params)
+            
+            for row in rows:
+                results.append({
+                    'id': row[0],
+                    'channel_id': row[1],
+                    'user_id': row[2],
+                    'display_name': row[3],
+                    'role': row[4],
+                    'snippet': make_snippet(row[5], words),
+                    'timestamp': row[6],
+                    'archived': archived
+                })
+            if len(results) >= limit:
+                break
+        
+        return results
+    
+    def record_user_activity(self, guild_id: str, channel_id: str, user_id: str,
+                             display_name: str, token_count: int = 0, timestamp: str = None):
+        """Update a member's profile and the activity rollups for one user message."""
+        timestamp = timestamp or utc_now()
+        day = timestamp[:10]
+        
+        self.transaction([
+            ('''
+                INSERT INTO user_profiles (guild_id, user_id, display_name, first_seen, last_seen, message_count)
+                VALUES ($1, $2, $3, $4, $4, 1)
+                ON CONFLICT (guild_id, user_id) DO UPDATE SET
+                    display_name = excluded.display_name,
+                    last_seen = excluded.last_seen,
+                    message_count = user_profiles.message_count + 1
+            ''', (guild_id, user_id, display_name, timestamp)),
+            ('''
+                INSERT INTO activity_daily (guild_id, user_id, day, messages, tokens)
+                VALUES ($1, $2, $3, 1, $4)
+                ON CONFLICT (guild_id, user_id, day) DO UPDATE SET
+                    messages = activity_daily.messages + 1,
+                    tokens = activity_daily.tokens + excluded.tokens
+            ''', (guild_id, user_id, day, token_count)),
+            ('''
+                INSERT INTO channel_activity_daily (guild_id, channel_id, day, messages, tokens)
+                VALUES ($1, $2, $3, 1, $4)
+                ON CONFLICT (guild_id, day, channel_id) DO UPDATE SET
+                    messages = channel_activity_daily.messages + 1,
+                    tokens = channel_activity_daily.tokens + excluded.tokens
+            ''', (guild_id, channel_id, day, token_count))
+        ])
+    
+    def get_user_activity(self, user_id: str, guild_id: str) -> Optional[Dict]:
+        """Get a member's profile and 7/30/90-day activity from the daily rollups."""
+        profile = self.fetchrow('''
+            SELECT display_name, first_seen, last_seen, message_count
+            FROM user_profiles
+            WHERE guild_id = $1 AND user_id = $2
+        ''', guild_id, user_id)
+        if not profile:
+            return None
+        
+        recent = self.fetchrow('''
+            SELECT
+                SUM(CASE WHEN day > $3 THEN messages ELSE 0 END),
+                SUM(CASE WHEN day > $4 THEN messages ELSE 0 END),
+                SUM(messages),
+                SUM(CASE WHEN day > $4 THEN 1 ELSE 0 END),
+                SUM(tokens)
+            FROM activity_daily
+            WHERE guild_id = $1 AND user_id = $2 AND day > $5
+        ''', guild_id, user_id, utc_cutoff(7)[:10], utc_cutoff(30)[:10], utc_cutoff(90)[:10])
+        
+        return {
+            'display_name': profile[0],
+            'first_seen': profile[1],
+            'last_seen': profile[2],
+            'total_messages': profile[3],
+            'messages_last_7_days': recent[0] or 0,
+            'messages_last_30_days': recent[1] or 0,
+            'messages_last_90_days': recent[2] or 0,
+            'active_days_last_30_days': recent[3] or 0,
+            'tokens_last_90_days': recent[4] or 0
+        }
+    
+    def get_top_users(self, guild_id: str, days: int = 7, limit: int = 10) -> List[Dict]:
+        """Most active members of a guild over the last `days` days."""
+        rows = self.fetch('''
+            SELECT a.user_id, MAX(p.display_name), SUM(a.messages), SUM(a.tokens), COUNT(*)
+            FROM activity_daily a
+            LEFT JOIN user_profiles p ON p.guild_id = a.guild_id AND p.user_id = a.user_id
+            WHERE a.guild_id = $1 AND a.day > $2
+            GROUP BY a.user_id
+            ORDER BY SUM(a.messages) DESC
+            LIMIT $3
+        ''', guild_id, utc_cutoff(days)[:10], limit)
+        
+        return [{
+            'user_id': row[0],
+            'display_name': row[1] or row[0],
+            'messages': row[2],
+            'tokens': row[3],
+            'active_days': row[4]
+        } for row in rows]
+    
+    def get_channel_activity(self, guild_id: str, days: int = 7, limit: int = 10) -> List[Dict]:
+        """Busiest channels of a guild over the last `days` days."""
+        rows = self.fetch('''
+            SELECT channel_id, SUM(messages), SUM(tokens), COUNT(*)
+            FROM channel_activity_daily
+            WHERE guild_id = $1 AND day > $2
+            GROUP BY channel_id
+            ORDER BY SUM(messages) DESC
+            LIMIT $3
+        ''', guild_id, utc_cutoff(days)[:10], limit)
+        
+        return [{
+            'channel_id': row[0],
+            'messages': row[1],
+            'tokens': row[2],
+            'active_days': row[3]
+        } for row in rows]
+    
+    def log_admin_action(self, guild_id: str, admin_id: str, admin_name: str,
+                         action_type: str, target_id: str = None,
+                         target_name: str = None, details: str = None):
+        """Log an admin action."""
+        self.execute('''
+            INSERT INTO admin_actions_log
+            (guild_id, admin_id, admin_name, action_type, target_id, target_name, details, timestamp)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+        ''', guild_id, admin_id, admin_name, action_type, target_id, target_name, details, utc_now())
+    
+    def get_admin_logs(self, guild_id: str, limit: int = 10, before_id: int = None,
+                       after_id: int = None) -> List[Dict]:
+        """Retrieve one page of admin action logs, newest first (keyset pagination by id)."""
+        if after_id is not None:
+            rows = self.fetch('''
+                SELECT id, admin_name, action_type, target_name, details, timestamp
+                FROM admin_actions_log
+                WHERE guild_id = $1 AND id > $2
+                ORDER BY id ASC
+                LIMIT $3
+            ''', guild_id, after_id, limit)[::-1]
+        else:
+            rows = self.fetch('''
+                SELECT id, admin_name, action_type, target_name, details, timestamp
+                FROM admin_actions_log
+                WHERE guild_id = $1 AND id < $2
+                ORDER BY id DESC
+                LIMIT $3
+            ''', guild_id, before_id if before_id is not None else 2 ** 63 - 1, limit)
+        
+        return [{
+            'id': row[0],
+            'admin_name': row[1],
+            'action_type': row[2],
+            'target_name': row[3],
+            'details': row[4],
+            'timestamp': row[5]
+        } for row in rows]
+    
+    def count_admin_logs(self, guild_id: str) -> int:
+        """Count a guild's admin action log entries."""
+        return self.fetchval('SELECT COUNT(*) FROM admin_actions_log WHERE guild_id = $1', guild_id)
+    
+    def iter_admin_logs(self, guild_id: str, since: str = None,
+                        batch_size: int = 1000) -> Iterator[Dict]:
+        """Yield every admin action log entry of a guild, oldest first, in id-keyed batches."""
+        where, params = self.filters(3, since=since)
+        last_id = 0
+        while True:
+            rows = self.fetch(f'''
+                SELECT id, admin_id, admin_name, action_type, target_id, target_name, details, timestamp
+                FROM admin_actions_log
+                WHERE guild_id = $1 AND id > $2{where}
+                ORDER BY id
+                LIMIT {int(batch_size)}
+            ''', guild_id, last_id, *params)
+            
+            for row in rows:
+                yield {
+                    'id': row[0],
+                    'admin_id': row[1],
+                    'admin_name': row[2],
+                    'action_type': row[3],
+                    'target_id': row[4],
+                    'target_name': row[5],
+                    'details': row[6],
+                    'timestamp': row[7]
+                }
+            
+            if len(rows) < batch_size:
+                break
+            last_id = rows[-1][0]
+    
+    def get_server_settings(self, guild_id: str) -> Dict:
+        """Get the settings JSON of a guild (empty dict if none are stored)."""
+        settings = self.fetchval('SELECT settings FROM server_settings WHERE guild_id = $1', guild_id)
+        return json.loads(settings) if settings else {}
+    
+    def update_server_settings(self, guild_id: str, settings: Dict):
+        """Create or replace the settings JSON of a guild."""
+        self.execute('''
+            INSERT INTO server_settings (guild_id, settings)
+            VALUES ($1, $2)
+            ON CONFLICT (guild_id) DO UPDATE SET
+                settings = excluded.settings,
+                updated_at = now()
+        ''', guild_id, json.dumps(settings))
+    
+    def save_quota_buckets(self, buckets: List[tuple]):
+        """Replace the persisted quota buckets with (key, capacity, level, updated) rows."""
+        async def save():
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute('DELETE FROM quota_buckets')
+                    await conn.executemany('''
+                        INSERT INTO quota_buckets (bucket_key, capacity, level, updated)
+                        VALUES ($1, $2, $3, $4)
+                    ''', buckets)
+        self.run(save())
+    
+    def load_quota_buckets(self) -> List[tuple]:
+        """Load persisted quota buckets as (key, capacity, level, updated) rows."""
+        return [tuple(row) for row in self.fetch('SELECT bucket_key, capacity, level, updated FROM quota_buckets')]
+    
+    def log_model_route(self, guild_id: str, channel_id: str, route: str, model: Optional[str],
+                        reasons: str, input_chars: int, history_tokens: int, latency_ms: float,
+                        prompt_tokens: int, completion_tokens: int, success: bool):
+        """Record the routing decision and outcome of one model request."""
+        self.execute('''
+            INSERT INTO model_routing_log
+            (guild_id, channel_id, route, model, reasons, input_chars, history_tokens,
+             latency_ms, prompt_tokens, completion_tokens, success, timestamp)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
+        ''', guild_id, channel_id, route, model, reasons, input_chars, history_tokens,
+             latency_ms, prompt_tokens, completion_tokens, bool(success), utc_now())
+    
+    def get_routing_summary(self, guild_id: str, days: int = 7) -> List[Dict]:
+        """Per route and model: request count, failures, average latency and tokens."""
+        rows = self.fetch('''
+            SELECT route, model, COUNT(*), COUNT(*) FILTER (WHERE NOT success),
+                   AVG(latency_ms), AVG(prompt_tokens)::float8, AVG(completion_tokens)::float8
+            FROM model_routing_log
+            WHERE guild_id = $1 AND timestamp >= $2
+            GROUP BY route, model
+            ORDER BY COUNT(*) DESC
+        ''', guild_id, utc_cutoff(days))
+        
+        return [{
+            'route': row[0],
+            'model': row[1],
+            'requests': row[2],
+            'failures': row[3],
+            'avg_latency_ms': round(row[4] or 0, 1),
+            'avg_prompt_tokens': round(row[5] or 0),
+            'avg_completion_tokens': round(row[6] or 0)
+        } for row in rows]
+    
+    def record_usage(self, guild_id: str, channel_id: str, user_id: str, model: Optional[str],
+                     prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0,
+                     estimated: bool = False):
+        """Record the token usage of one model response and update the rollups."""
+        timestamp = utc_now()
+        day = timestamp[:10]
+        model = model or 'unknown'
+        
+        self.transaction([
+            ('''
+                INSERT INTO usage_log
+                (guild_id, channel_id, user_id, model, prompt_tokens, completion_tokens,
+                 cached_tokens, estimated, timestamp)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+            ''', (guild_id, channel_id, user_id, model, prompt_tokens, completion_tokens,
+                  cached_tokens, bool(estimated), timestamp)),
+            ('''
+                INSERT INTO usage_daily
+                (guild_id, day, model, requests, prompt_tokens, completion_tokens,
+                 cached_tokens, estimated_requests)
+                VALUES ($1, $2, $3, 1, $4, $5, $6, $7)
+                ON CONFLICT (guild_id, day, model) DO UPDATE SET
+                    requests = usage_daily.requests + 1,
+                    prompt_tokens = usage_daily.prompt_tokens + excluded.prompt_tokens,
+                    completion_tokens = usage_daily.completion_tokens + excluded.completion_tokens,
+                    cached_tokens = usage_daily.cached_tokens + excluded.cached_tokens,
+                    estimated_requests = usage_daily.estimated_requests + excluded.estimated_requests
+            ''', (guild_id, day, model, prompt_tokens, completion_tokens, cached_tokens, int(estimated))),
+            ('''
+                INSERT INTO usage_totals
+                (guild_id, model, requests, prompt_tokens, completion_tokens, cached_tokens, first_day)
+                VALUES ($1, $2, 1, $3, $4, $5, $6)
+                ON CONFLICT (guild_id, model) DO UPDATE SET
+                    requests = usage_totals.requests + 1,
+                    prompt_tokens = usage_totals.prompt_tokens + excluded.prompt_tokens,
+                    completion_tokens = usage_totals.completion_tokens + excluded.completion_tokens,
+                    cached_tokens = usage_totals.cached_tokens + excluded.cached_tokens
+            ''', (guild_id, model, prompt_tokens, completion_tokens, cached_tokens, day))
+        ])
+    
+    def get_daily_usage(self, guild_id: str, days: int = 7) -> List[Dict]:
+        """Per-day usage of a guild (all models combined), newest day first."""
+        rows = self.fetch('''
+            SELECT day, SUM(requests)::bigint, SUM(prompt_tokens)::bigint, SUM(completion_tokens)::bigint,
+                   SUM(cached_tokens)::bigint, SUM(estimated_requests)::bigint
+            FROM usage_daily
+            WHERE guild_id = $1 AND day > $2
+            GROUP BY day
+            ORDER BY day DESC
+        ''', guild_id, utc_cutoff(days)[:10])
+        
+        return [{
+            'day': row[0],
+            'requests': row[1],
+            'prompt_tokens': row[2],
+            'completion_tokens': row[3],
+            'cached_tokens': row[4],
+            'estimated_requests': row[5]
+        } for row in rows]
+    
+    def get_usage_totals(self, guild_id: str) -> List[Dict]:
+        """All-time usage of a guild per model, largest first."""
+        rows = self.fetch('''
+            SELECT model, requests, prompt_tokens, completion_tokens, cached_tokens, first_day
+            FROM usage_totals
+            WHERE guild_id = $1
+            ORDER BY prompt_tokens + completion_tokens DESC
+        ''', guild_id)
+        
+        return [{
+            'model': row[0],
+            'requests': row[1],
+            'prompt_tokens': row[2],
+            'completion_tokens': row[3],
+            'cached_tokens': row[4],
+            'first_day': row[5]
+        } for row in rows]
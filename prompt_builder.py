@@ -0,0 +1,99 @@
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+from storage import HistoryMessage
+
+class PromptAssembler:
+    """Builds chat requests whose prefix stays byte-identical between calls.
+    
+    Providers cache the longest previously seen prompt prefix, so the prompt
+    is laid out from most to least stable: system prompt, then history, then
+    the new turn (tools are sent as a fixed list ahead of the messages).
+    
+    A plain "last N messages" window shifts by one row per call and changes
+    the prefix every time. Instead, each channel's window starts at an anchor
+    message and only grows by appending; when it would exceed
+    `max_messages`, the anchor jumps forward by whole blocks of `block_size`
+    messages. Between roll-overs every request extends the previous one.
+    Anchors are dropped with the channel's cached context window (see
+    forget()), so they are bounded by the same LRU.
+    """
+    
+    def __init__(self, max_messages: int = 50, block_size: int = 25):
+        self.max_messages = max_messages
+        self.block_size = block_size
+        self.anchors: Dict[Tuple[str, str], int] = {}
+        
+        self.requests = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+    
+    def select_window(self, key: Tuple[str, str], history: List[HistoryMessage],
+                      max_messages: Optional[int] = None) -> List[HistoryMessage]:
+        """Pick the history slice to send, keeping the channel's anchor when possible.
+        
+        `history` is the channel's most recent `max_messages` records in
+        chronological order; `max_messages` defaults to the assembler's own
+        limit and may be overridden per guild.
+        """
+        max_messages = max_messages or self.max_messages
+        block_size = min(self.block_size, max_messages)
+        
+        if not history:
+            self.anchors.pop(key, None)
+            return history
+        
+        ids = [msg.id for msg in history]
+        anchor = self.anchors.get(key)
+        
+        if anchor is not None:
+            index = bisect_left(ids, anchor)
+            if index < len(ids) and ids[index] == anchor:
+                return history[index:]
+        
+        # No anchor yet, or it scrolled out of the window (or was reset):
+        # start at the oldest message of a short history, or drop the
+        # oldest block of a full one
+        start = block_size if len(history) >= max_messages else 0
+        start = min(start, len(history) - 1)
+        self.anchors[key] = ids[start]
+        return history[start:]
+    
+    def forget(self, key: Optional[Tuple[str, str]] = None):
+        """Drop one channel's anchor, or all of them if `key` is None."""
+        if key is None:
+            self.anchors.clear()
+        else:
+            self.anchors.pop(key, None)
+    
+    def build(self, system_prompt: str, window: List[HistoryMessage], user_turn: str) -> List[Dict]:
+        """Assemble the messages for one request from a window picked by select_window()."""
+        messages = [{"role": "system", "content": system_prompt}]
+        messages.extend(msg.to_api_message() for msg in window)
+        messages.append({"role": "user", "content": user_turn})
+        return messages
+    
+    def record_usage(self, usage):
+        """Record prompt cache usage reported by the provider."""
+        if usage is None:
+            return
+        
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached = (getattr(details, 'cached_tokens', None) or 0) if details else 0
+        
+        self.requests += 1
+        self.prompt_tokens += usage.prompt_tokens or 0
+        self.cached_tokens += cached
+        if cached:
+            self.cache_hits += 1
+    
+    def get_stats(self) -> Dict:
+        """Get prompt cache hit statistics."""
+        return {
+            'requests': self.requests,
+            'cache_hits': self.cache_hits,
+            'hit_rate': round(self.cache_hits / self.requests * 100, 2) if self.requests else 0.0,
+            'prompt_tokens': self.prompt_tokens,
+            'cached_tokens': self.cached_tokens,
+            'cached_ratio': round(self.cached_tokens / self.prompt_tokens * 100, 2) if self.prompt_tokens else 0.0
+        }
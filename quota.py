@@ -0,0 +1,48 @@
+import time
+
+class TokenBucket:
+    """Token bucket refilled continuously at `capacity` per minute.
+    
+    Model tokens are only known after the response, so `charge()` may push
+    the level below zero; the debt is paid back by the refill before the
+    next request is allowed.
+    """
+    
+    __slots__ = ('capacity', 'rate', 'level', 'updated')
+    
+    def __init__(self, capacity: float, level: float = None, updated: float = None):
+        self.capacity = capacity
+        self.rate = capacity / 60.0
+        self.level = capacity if level is None else level
+        self.updated = time.time() if updated is None else updated
+    
+    def refill(self, now: float = None):
+        now = time.time() if now is None else now
+        if now > self.updated:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+    
+    def wait_time(self, amount: float = 1.0, now: float = None) -> float:
+        """Seconds until `amount` can be taken (0 if available now)."""
+        self.refill(now)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+    
+    def take(self, amount: float = 1.0):
+        self.level -= amount
+    
+    def charge(self, amount: float, now: float = None):
+        """Take `amount` after the fact, allowing the level to go negative."""
+        self.refill(now)
+        self.level -= amount
+    
+    def is_full(self) -> bool:
+        return self.level >= self.capacity
+    
+    def set_capacity(self, capacity: float):
+        """Change the limit, keeping the current level within the new capacity."""
+        self.refill()
+        self.capacity = capacity
+        self.rate = capacity / 60.0
+        self.level = min(self.level, capacity)
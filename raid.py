@@ -0,0 +1,198 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+class WindowCounter:
+    """Counts events in the last `period` seconds using a ring of fixed buckets.
+    
+    Recording and counting are O(1) (advancing clears at most `buckets`
+    slots) and memory is fixed; events expire one bucket (period / buckets
+    seconds) at a time, so counts are exact to within one bucket.
+    """
+    
+    __slots__ = ('width', 'counts', 'tick', 'total')
+    
+    def __init__(self, period: float, buckets: int = 10, now: float = None):
+        self.width = period / buckets
+        self.counts = [0] * buckets
+        self.tick = int((time.monotonic() if now is None else now) / self.width)
+        self.total = 0
+    
+    def advance(self, now: float):
+        tick = int(now / self.width)
+        steps = tick - self.tick
+        if steps <= 0:
+            return
+        if steps >= len(self.counts):
+            self.counts = [0] * len(self.counts)
+            self.total = 0
+        else:
+            for step in range(1, steps + 1):
+                slot = (self.tick + step) % len(self.counts)
+                self.total -= self.counts[slot]
+                self.counts[slot] = 0
+        self.tick = tick
+    
+    def add(self, now: float = None) -> int:
+        """Record an event and return the number of events in the window."""
+        self.advance(time.monotonic() if now is None else now)
+        self.counts[self.tick % len(self.counts)] += 1
+        self.total += 1
+        return self.total
+    
+    def expired(self, now: float) -> bool:
+        """True if no event was recorded within the last period."""
+        # count() may have advanced the ring past every event already
+        return self.total == 0 or int(now / self.width) - self.tick >= len(self.counts)
+    
+    def count(self, now: float = None) -> int:
+        self.advance(time.monotonic() if now is None else now)
+        return self.total
+
+# Short messages ("lol", "gm") are legitimately repeated by many members
+MIN_DUPLICATE_LENGTH = 8
+
+def content_key(content: str) -> Optional[int]:
+    """Hash of a message's normalized text, or None if it is too short to compare."""
+    normalized = ' '.join(content.casefold().split())
+    if len(normalized) < MIN_DUPLICATE_LENGTH:
+        return None
+    return hash(normalized)
+
+class GuildCounters:
+    """Sliding-window counters of one guild, bounded by the LRU limits of RaidDetector."""
+    
+    __slots__ = ('joins', 'users', 'contents', 'raid_until', 'last_alerts')
+    
+    def __init__(self, join_window: float, now: float):
+        self.joins = WindowCounter(join_window, now=now)
+        self.users: "OrderedDict[str, WindowCounter]" = OrderedDict()
+        self.contents: "OrderedDict[int, WindowCounter]" = OrderedDict()
+        self.raid_until = 0.0
+        self.last_alerts: Dict[str, float] = {}
+
+class RaidDetector:
+    """Detects join raids and message spam from per-guild sliding windows.
+    
+    Every event costs O(1): one counter update for joins, and one per-user
+    and one per-content counter update for messages. Per-user and
+    per-content counters live in LRU dicts capped at `max_users` and
+    `max_contents`, so a guild's memory stays bounded however many accounts
+    take part in a flood; the least recently active are forgotten first,
+    and expired ones are dropped as new events arrive.
+    
+    Limits come from the guild's settings on each call: `raid_join_limit`
+    joins per `join_window` seconds starts a raid, `spam_message_limit`
+    messages per user per `message_window` seconds and
+    `spam_duplicate_limit` copies of the same text per `duplicate_window`
+    seconds (from any authors) count as spam. A limit of 0 disables the check.
+    """
+    
+    def __init__(self, join_window: float = 60, message_window: float = 10, duplicate_window: float = 60,
+                 max_users: int = 2048, max_contents: int = 1024, alert_cooldown: float = 60):
+        self.join_window = join_window
+        self.message_window = message_window
+        self.duplicate_window = duplicate_window
+        self.max_users = max_users
+        self.max_contents = max_contents
+        self.alert_cooldown = alert_cooldown
+        self.guilds: Dict[str, GuildCounters] = {}
+        
+        self.stats = {'joins': 0, 'messages': 0, 'raids': 0, 'rate_spam': 0, 'duplicate_spam': 0}
+    
+    def get_guild(self, guild_id: str, now: float) -> GuildCounters:
+        guild = self.guilds.get(guild_id)
+        if guild is None:
+            guild = self.guilds[guild_id] = GuildCounters(self.join_window, now)
+        return guild
+    
+    def record_join(self, guild_id: str, settings: Dict, now: float = None) -> bool:
+        """Record a member join; True while the guild is in a join raid.
+        
+        A raid lasts until no more than the limit of joins has happened for
+        one full window.
+        """
+        now = time.monotonic() if now is None else now
+        self.stats['joins'] += 1
+        guild = self.get_guild(guild_id, now)
+        joins = guild.joins.add(now)
+        
+        limit = settings['raid_join_limit']
+        if limit and joins >= limit:
+            if guild.raid_until <= now:
+                self.stats['raids'] += 1
+            guild.raid_until = now + self.join_window
+        return guild.raid_until > now
+    
+    def in_raid(self, guild_id: str, now: float = None) -> bool:
+        guild = self.guilds.get(guild_id)
+        return guild is not None and guild.raid_until > (time.monotonic() if now is None else now)
+    
+    def record_message(self, guild_id: str, user_id: str, key: Optional[int], settings: Dict,
+                       now: float = None) -> Optional[str]:
+        """Record a message; returns 'rate' or 'duplicate' if it is spam, else None.
+        
+        `key` is the message's `content_key()` (None skips the duplicate check).
+        """
+        now = time.monotonic() if now is None else now
+        self.stats['messages'] += 1
+        guild = self.get_guild(guild_id, now)
+        
+        spam = None
+        limit = settings['spam_duplicate_limit']
+        if limit and key is not None:
+            counter = self.touch(guild.contents, key, self.max_contents, self.duplicate_window, now)
+            if counter.add(now) > limit:
+                spam = 'duplicate'
+        
+        # Checked second so a flooding user is reported for the rate even
+        # when the text is also a duplicate
+        limit = settings['spam_message_limit']
+        if limit:
+            counter = self.touch(guild.users, user_id, self.max_users, self.message_window, now)
+            if counter.add(now) > limit:
+                spam = 'rate'
+        
+        if spam:
+            self.stats[f'{spam}_spam'] += 1
+        return spam
+    
+    def touch(self, counters: OrderedDict, key, max_size: int, period: float, now: float) -> WindowCounter:
+        """Get a counter from an LRU dict, creating it if needed.
+        
+        Least recently used counters are dropped while the dict is over
+        `max_size` or they have expired, so idle entries drain away.
+        """
+        counter = counters.get(key)
+        if counter is None:
+            counter = counters[key] = WindowCounter(period, now=now)
+        else:
+            counters.move_to_end(key)
+        
+        # Every counter is created and deleted once, so this is amortized O(1)
+        while len(counters) > 1:
+            oldest_key = next(iter(counters))
+            if len(counters) <= max_size and not counters[oldest_key].expired(now):
+                break
+            del counters[oldest_key]
+        return counter
+    
+    def should_alert(self, guild_id: str, kind: str, now: float = None) -> bool:
+        """True at most once per `alert_cooldown` seconds for each guild and kind of alert."""
+        now = time.monotonic() if now is None else now
+        guild = self.get_guild(guild_id, now)
+        if now - guild.last_alerts.get(kind, float('-inf')) < self.alert_cooldown:
+            return False
+        guild.last_alerts[kind] = now
+        return True
+    
+    def get_guild_stats(self, guild_id: str, now: float = None) -> Dict:
+        """Current window counts of a guild."""
+        now = time.monotonic() if now is None else now
+        guild = self.get_guild(guild_id, now)
+        return {
+            'joins': guild.joins.count(now),
+            'raid': guild.raid_until > now,
+            'users': len(guild.users),
+            'contents': len(guild.contents)
+        }
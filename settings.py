@@ -0,0 +1,167 @@
+import asyncio
+from typing import Any, Dict, List, NamedTuple, Optional
+
+class SettingDefinition(NamedTuple):
+    """A per-guild setting with its type, default and allowed range."""
+    type: type
+    default: Any
+    description: str
+    min_value: Optional[float] = None
+    max_value: Optional[float] = None
+
+# Every per-guild setting. A default of None means "use the global
+# configuration" (e.g. AI_MODEL, all tools enabled).
+SETTING_DEFINITIONS: Dict[str, SettingDefinition] = {
+    'ai_model': SettingDefinition(str, None, "Model used for replies (default: AI_MODEL)"),
+    'temperature': SettingDefinition(float, 0.7, "Sampling temperature", 0.0, 2.0),
+    'max_response_tokens': SettingDefinition(int, 2000, "Maximum tokens per reply", 1, 16000),
+    'context_messages': SettingDefinition(int, 50, "History messages sent with each request", 1, 200),
+    'max_memory_tokens': SettingDefinition(int, 400000, "Channel history tokens before it is archived", 1000, 2000000),
+    'model_routing': SettingDefinition(bool, True, "Send simple messages to the fast model (AI_FAST_MODEL)"),
+    'enabled_tools': SettingDefinition(list, None, "Comma-separated tools the AI may use (default: all)"),
+    'max_images': SettingDefinition(int, 4, "Image attachments per message sent to the model (0 = ignore images)", 0, 10),
+    'answer_cache': SettingDefinition(bool, False, "Reuse answers to repeated questions (non-admin turns only)"),
+    'answer_cache_similarity': SettingDefinition(float, 0.0, "Minimum similarity for near-duplicate questions (0 = exact matches only)", 0.0, 1.0),
+    'raid_join_limit': SettingDefinition(int, 10, "Joins per RAID_JOIN_WINDOW seconds that count as a raid (0 = off)", 0),
+    'spam_message_limit': SettingDefinition(int, 8, "Messages per user per SPAM_MESSAGE_WINDOW seconds (0 = off)", 0),
+    'spam_duplicate_limit': SettingDefinition(int, 4, "Copies of the same text per SPAM_DUPLICATE_WINDOW seconds (0 = off)", 0),
+    'raid_auto_timeout': SettingDefinition(bool, False, "Time out spammers and members who join during a raid"),
+    'raid_alert_channel': SettingDefinition(str, None, "Channel ID for raid and spam alerts (default: system channel)"),
+    'quota_user_requests': SettingDefinition(int, 0, "Requests per user per minute (0 = unlimited)", 0),
+    'quota_user_tokens': SettingDefinition(int, 0, "Model tokens per user per minute (0 = unlimited)", 0),
+    'quota_channel_requests': SettingDefinition(int, 0, "Requests per channel per minute (0 = unlimited)", 0),
+    'quota_channel_tokens': SettingDefinition(int, 0, "Model tokens per channel per minute (0 = unlimited)", 0),
+    'quota_guild_requests': SettingDefinition(int, 0, "Requests per server per minute (0 = unlimited)", 0),
+    'quota_guild_tokens': SettingDefinition(int, 0, "Model tokens per server per minute (0 = unlimited)", 0),
+}
+
+DEFAULT_SETTINGS: Dict[str, Any] = {name: definition.default for name, definition in SETTING_DEFINITIONS.items()}
+
+def parse_setting(name: str, raw: str) -> Any:
+    """Convert user input into a typed setting value.
+    
+    Raises ValueError with a readable message for unknown settings,
+    malformed values or values outside the allowed range.
+    """
+    definition = SETTING_DEFINITIONS.get(name)
+    if definition is None:
+        raise ValueError(f"Unknown setting: {name}")
+    
+    if definition.type is list:
+        value = [item.strip() for item in raw.split(',') if item.strip()]
+    elif definition.type is bool:
+        if raw.lower() not in ('true', 'false', 'on', 'off', 'yes', 'no', '1', '0'):
+            raise ValueError(f"{name} must be true or false")
+        value = raw.lower() in ('true', 'on', 'yes', '1')
+    else:
+        try:
+            value = definition.type(raw)
+        except ValueError:
+            raise ValueError(f"{name} must be a {definition.type.__name__}")
+    
+    if definition.min_value is not None and value < definition.min_value:
+        raise ValueError(f"{name} must be at least {definition.min_value}")
+    if definition.max_value is not None and value > definition.max_value:
+        raise ValueError(f"{name} must be at most {definition.max_value}")
+    
+    return value
+
+def format_setting(value: Any) -> str:
+    """Format a setting value for display."""
+    if value is None:
+        return "default"
+    if isinstance(value, list):
+        return ", ".join(value) if value else "none"
+    return str(value)
+
+class SettingsStore:
+    """Cached per-guild settings backed by the server_settings table.
+    
+    Reads are served from memory after the first load of a guild; writes go
+    to the database first and then replace the cached entry. Each guild has
+    a version number that changes on every write, so other caches can tell
+    when their entries are stale.
+    """
+    
+    def __init__(self, db):
+        self.db = db
+        self.cache: Dict[str, Dict[str, Any]] = {}
+        self.versions: Dict[str, int] = {}
+    
+    def get_overrides(self, guild_id: str) -> Dict[str, Any]:
+        """Get only the settings a guild has changed, ignoring unknown keys."""
+        stored = self.db.get_server_settings(guild_id)
+        return {name: value for name, value in stored.items() if name in SETTING_DEFINITIONS}
+    
+    async def get_all(self, guild_id: str) -> Dict[str, Any]:
+        """Get every setting of a guild, defaults included. Do not mutate the result.
+        
+        Cache misses read the database in a worker thread; the result is
+        only cached if no write to the guild's settings landed meanwhile.
+        """
+        settings = self.cache.get(guild_id)
+        if settings is None:
+            version = self.get_version(guild_id)
+            settings = {**DEFAULT_SETTINGS, **await asyncio.to_thread(self.get_overrides, guild_id)}
+            if self.get_version(guild_id) == version:
+                self.cache[guild_id] = settings
+        return settings
+    
+    async def get(self, guild_id: str, name: str) -> Any:
+        return (await self.get_all(guild_id))[name]
+    
+    def get_version(self, guild_id: str) -> int:
+        return self.versions.get(guild_id, 0)
+    
+    async def set(self, guild_id: str, name: str, value: Any):
+        """Change a setting (write-through)."""
+        if name not in SETTING_DEFINITIONS:
+            raise ValueError(f"Unknown setting: {name}")
+        
+        await asyncio.to_thread(self.write_override, guild_id, name, value)
+        self.invalidate(guild_id)
+    
+    async def reset(self, guild_id: str, name: str):
+        """Return a setting to its default."""
+        await asyncio.to_thread(self.remove_override, guild_id, name)
+        self.invalidate(guild_id)
+    
+    def write_override(self, guild_id: str, name: str, value: Any):
+        stored = self.db.get_server_settings(guild_id)
+        stored[name] = value
+        self.db.update_server_settings(guild_id, stored)
+    
+    def remove_override(self, guild_id: str, name: str):
+        stored = self.db.get_server_settings(guild_id)
+        if stored.pop(name, None) is not None:
+            self.db.update_server_settings(guild_id, stored)
+    
+    def invalidate(self, guild_id: str):
+        """Drop a guild's cached settings so the next read reloads them."""
+        self.cache.pop(guild_id, None)
+        self.versions[guild_id] = self.get_version(guild_id) + 1
+    
+    def clear(self):
+        """Invalidate every cached guild, e.g. after the database was restored."""
+        for guild_id in list(self.cache):
+            self.invalidate(guild_id)
+
+async def get_guild_settings(bot, guild_id: str) -> Dict[str, Any]:
+    """Get a guild's settings, or the defaults if the SettingsManager cog is not loaded."""
+    settings_manager = bot.get_cog('SettingsManager')
+    if settings_manager is None:
+        return DEFAULT_SETTINGS
+    return await settings_manager.store.get_all(guild_id)
+
+def get_guild_settings_version(bot, guild_id: str) -> int:
+    """Get a guild's settings version, which changes whenever one of its settings does."""
+    settings_manager = bot.get_cog('SettingsManager')
+    if settings_manager is None:
+        return 0
+    return settings_manager.store.get_version(guild_id)
+
+def filter_tools(tools: List[Dict], enabled: Optional[List[str]]) -> List[Dict]:
+    """Keep only the tools whose names are enabled (all tools if `enabled` is None)."""
+    if enabled is None:
+        return tools
+    return [tool for tool in tools if tool['function']['name'] in enabled]
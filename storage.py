@@ -0,0 +1,224 @@
+import os
+import re
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Iterator, NamedTuple, Tuple
+
+class HistoryMessage(NamedTuple):
+    """One conversation history row, as stored in `conversation_history`."""
+    id: int
+    display_name: str
+    role: str
+    content: str
+    timestamp: str
+    token_count: int
+    
+    def to_api_message(self) -> Dict:
+        """Format the message for the OpenAI API."""
+        if self.role == 'user':
+            return {"role": "user", "content": f"[{self.display_name}]: {self.content}"}
+        return {"role": self.role, "content": self.content}
+
+def utc_now() -> str:
+    """The current UTC time in the stored timestamp format ('YYYY-MM-DD HH:MM:SS')."""
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+def utc_cutoff(days: int) -> str:
+    """The UTC time `days` days ago, in the stored timestamp format."""
+    return (datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+# Letters and digits; everything else separates words, as in SQLite's
+# unicode61 tokenizer
+WORD_PATTERN = re.compile(r'[^\W_]+')
+
+def search_terms(query: str) -> List[Tuple[List[str], bool]]:
+    """Split a search query into terms that must all match whole words.
+    
+    Each whitespace-separated term becomes its lowercase words (a phrase if
+    there are several, e.g. "don't") and whether it ends in '*', which
+    makes its last word a prefix. Terms without any word are dropped.
+    """
+    terms = []
+    for term in query.split():
+        words = WORD_PATTERN.findall(term.lower())
+        if words:
+            terms.append((words, term.endswith('*')))
+    return terms
+
+class Storage(ABC):
+    """Interface of the bot's persistent storage.
+    
+    Cogs only talk to storage through these methods, so the backend can be
+    swapped with STORAGE_BACKEND: SQLite (DatabaseManager, the default),
+    in-memory (MemoryStorage) or PostgreSQL (PostgresStorage). Methods are
+    blocking; cogs call them through asyncio.to_thread. Timestamps are UTC
+    strings in the 'YYYY-MM-DD HH:MM:SS' format and days 'YYYY-MM-DD' in
+    every backend, so they compare the same way everywhere. Backends must
+    implement every abstract method; vacuum() is optional.
+    """
+    
+    # Conversation history
+    
+    @abstractmethod
+    def add_message(self, guild_id: str, channel_id: str, user_id: str,
+                    display_name: str, role: str, content: str, token_count: int = 0) -> HistoryMessage:
+        """Add a message to conversation history."""
+    
+    @abstractmethod
+    def get_conversation_history(self, guild_id: str, channel_id: str,
+                                 limit: int = 50) -> List[HistoryMessage]:
+        """Retrieve recent conversation history in chronological order."""
+    
+    @abstractmethod
+    def get_total_tokens(self, guild_id: str, channel_id: str) -> int:
+        """Get total token count for a conversation."""
+    
+    @abstractmethod
+    def reset_conversation(self, guild_id: str, channel_id: str):
+        """Reset conversation history for a channel."""
+    
+    @abstractmethod
+    def archive_messages(self, guild_id: str = None, channel_id: str = None,
+                         before: str = None) -> int:
+        """Move history rows older than `before`, or of one channel, out of the hot history. Returns the row count."""
+    
+    @abstractmethod
+    def get_archive_stats(self, guild_id: str = None) -> Dict:
+        """Get hot history and archive size statistics."""
+    
+    def vacuum(self, max_pages: int = 0) -> int:
+        """Reclaim space after archival. Returns the number of pages freed (0 if the backend has none)."""
+        return 0
+    
+    @abstractmethod
+    def iter_history_export(self, guild_id: str, channel_id: str = None, since: str = None,
+                            include_archive: bool = True, batch_size: int = 1000) -> Iterator[Dict]:
+        """Yield a guild's conversation history for export, oldest first (archived rows first)."""
+    
+    @abstractmethod
+    def search_history(self, guild_id: str, query: str, user_id: str = None,
+                       channel_id: str = None, since: str = None, until: str = None,
+                       limit: int = 20, include_archive: bool = True) -> List[Dict]:
+        """Search conversation history for all terms of `query`, newest matches first."""
+    
+    # Member profiles and activity
+    
+    @abstractmethod
+    def record_user_activity(self, guild_id: str, channel_id: str, user_id: str,
+                             display_name: str, token_count: int = 0, timestamp: str = None):
+        """Update a member's profile and the activity rollups for one user message."""
+    
+    @abstractmethod
+    def get_user_activity(self, user_id: str, guild_id: str) -> Optional[Dict]:
+        """Get a member's profile and 7/30/90-day activity, or None for unknown members."""
+    
+    @abstractmethod
+    def get_top_users(self, guild_id: str, days: int = 7, limit: int = 10) -> List[Dict]:
+        """Most active members of a guild over the last `days` days."""
+    
+    @abstractmethod
+    def get_channel_activity(self, guild_id: str, days: int = 7, limit: int = 10) -> List[Dict]:
+        """Busiest channels of a guild over the last `days` days."""
+    
+    # Admin action log
+    
+    @abstractmethod
+    def log_admin_action(self, guild_id: str, admin_id: str, admin_name: str,
+                         action_type: str, target_id: str = None,
+                         target_name: str = None, details: str = None):
+        """Log an admin action."""
+    
+    @abstractmethod
+    def get_admin_logs(self, guild_id: str, limit: int = 10, before_id: int = None,
+                       after_id: int = None) -> List[Dict]:
+        """Retrieve one page of admin action logs, newest first (keyset pagination by id)."""
+    
+    @abstractmethod
+    def count_admin_logs(self, guild_id: str) -> int:
+        """Count a guild's admin action log entries."""
+    
+    @abstractmethod
+    def iter_admin_logs(self, guild_id: str, since: str = None,
+                        batch_size: int = 1000) -> Iterator[Dict]:
+        """Yield every admin action log entry of a guild, oldest first."""
+    
+    # Guild settings
+    
+    @abstractmethod
+    def get_server_settings(self, guild_id: str) -> Dict:
+        """Get the settings JSON of a guild (empty dict if none are stored)."""
+    
+    @abstractmethod
+    def update_server_settings(self, guild_id: str, settings: Dict):
+        """Create or replace the settings JSON of a guild."""
+    
+    # Quotas, routing and usage
+    
+    @abstractmethod
+    def save_quota_buckets(self, buckets: List[tuple]):
+        """Replace the persisted quota buckets with (key, capacity, level, updated) rows."""
+    
+    @abstractmethod
+    def load_quota_buckets(self) -> List[tuple]:
+        """Load persisted quota buckets as (key, capacity, level, updated) rows."""
+    
+    @abstractmethod
+    def log_model_route(self, guild_id: str, channel_id: str, route: str, model: Optional[str],
+                        reasons: str, input_chars: int, history_tokens: int, latency_ms: float,
+                        prompt_tokens: int, completion_tokens: int, success: bool):
+        """Record the routing decision and outcome of one model request."""
+    
+    @abstractmethod
+    def get_routing_summary(self, guild_id: str, days: int = 7) -> List[Dict]:
+        """Per route and model: request count, failures, average latency and tokens."""
+    
+    @abstractmethod
+    def record_usage(self, guild_id: str, channel_id: str, user_id: str, model: Optional[str],
+                     prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0,
+                     estimated: bool = False):
+        """Record the token usage of one model response and update the rollups."""
+    
+    @abstractmethod
+    def get_daily_usage(self, guild_id: str, days: int = 7) -> List[Dict]:
+        """Per-day usage of a guild (all models combined), newest day first."""
+    
+    @abstractmethod
+    def get_usage_totals(self, guild_id: str) -> List[Dict]:
+        """All-time usage of a guild per model, largest first."""
+
+def create_storage(backend: str) -> Storage:
+    """Create a storage backend by name: 'sqlite', 'memory' or 'postgres'."""
+    backend = backend.lower()
+    if backend == 'sqlite':
+        from database import DatabaseManager
+        return DatabaseManager()
+    if backend == 'memory':
+        from memory_storage import MemoryStorage
+        return MemoryStorage()
+    if backend in ('postgres', 'postgresql'):
+        from postgres_storage import PostgresStorage
+        dsn = os.getenv('DATABASE_URL')
+        if not dsn:
+            raise ValueError("STORAGE_BACKEND=postgres requires DATABASE_URL")
+        return PostgresStorage(
+            dsn,
+            min_size=int(os.getenv('POSTGRES_POOL_MIN', '1')),
+            max_size=int(os.getenv('POSTGRES_POOL_MAX', '10'))
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+_storage: Optional[Storage] = None
+_storage_lock = threading.Lock()
+
+def get_storage() -> Storage:
+    """The storage backend selected by STORAGE_BACKEND, shared by every cog of the process.
+    
+    One instance per process: the SQLite schema is checked once and the
+    PostgreSQL pool is shared instead of opened by each cog.
+    """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = create_storage(os.getenv('STORAGE_BACKEND', 'sqlite'))
+        return _storage
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Tests import the bot's modules from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Cogs built by tests share an in-memory backend instead of creating
+# nebula.db in the working directory
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
@@ -0,0 +1,291 @@
+import asyncio
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from ai_client import CircuitBreaker, ProviderUnavailableError, ResilientChatClient, parse_fallback_models
+
+# The errors only read these attributes of the HTTP request and response
+REQUEST = SimpleNamespace(method='POST', url='https://api.test/v1/chat/completions')
+
+def status_error(error_class, status_code: int):
+    response = SimpleNamespace(request=REQUEST, status_code=status_code, headers={})
+    return error_class('error', response=response, body=None)
+
+def expire(breaker: CircuitBreaker):
+    """Let an open breaker's cooldown pass."""
+    breaker.opened_at -= breaker.reset_timeout
+
+class FakeCompletions:
+    """Stands in for `chat.completions`; `behaviour(model)` returns a response or raises."""
+    
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+        self.calls = []
+    
+    async def create(self, model, messages, timeout, **kwargs):
+        self.calls.append(model)
+        return await self.behaviour(model)
+
+def make_client(behaviour, fallback_models=None, **kwargs) -> ResilientChatClient:
+    options = dict(max_retries=0, base_delay=0, breaker_threshold=2, breaker_cooldown=30)
+    options.update(kwargs)
+    client = ResilientChatClient('key', model='primary', fallback_models=fallback_models, **options)
+    client.completions = FakeCompletions(behaviour)
+    client.clients[None] = SimpleNamespace(chat=SimpleNamespace(completions=client.completions))
+    return client
+
+async def answer(model):
+    return f"answer from {model}"
+
+# CircuitBreaker
+
+def test_breaker_opens_after_threshold_and_half_opens_after_cooldown():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    assert breaker.state == "closed"
+    
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow_request()
+    
+    expire(breaker)
+    assert breaker.state == "half-open"
+    assert breaker.allow_request()
+    # Only one trial at a time
+    assert not breaker.allow_request()
+    
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow_request()
+    assert breaker.trips == 1
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.record_failure()
+    expire(breaker)
+    
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.trips == 2
+
+def test_released_trial_can_be_taken_again():
+    breaker = CircuitBreaker(failure_threshold=1)
+    breaker.record_failure()
+    expire(breaker)
+    
+    assert breaker.allow_request()
+    breaker.release_trial()
+    assert breaker.state == "half-open"
+    assert breaker.allow_request()
+
+def test_parse_fallback_models():
+    assert parse_fallback_models(" a , b@http://x ,", "http://default") == [
+        ('a', 'http://default'), ('b', 'http://x')
+    ]
+
+# ResilientChatClient
+
+def test_falls_back_when_primary_times_out():
+    async def behaviour(model):
+        if model == 'primary':
+            raise openai.APITimeoutError(request=REQUEST)
+        return await answer(model)
+    
+    client = make_client(behaviour, fallback_models=[('backup', None)])
+    assert asyncio.run(client.create([])) == "answer from backup"
+    assert client.completions.calls == ['primary', 'backup']
+    assert client.stats['fallbacks'] == 1
+
+def test_non_retryable_error_is_raised():
+    async def behaviour(model):
+        raise status_error(openai.BadRequestError, 400)
+    
+    client = make_client(behaviour, fallback_models=[('backup', None)])
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(client.create([]))
+    assert client.completions.calls == ['primary']
+
+def test_concurrent_callers_share_one_half_open_trial():
+    """Open -> half-open (one trial, the rest fall back) -> closed."""
+    release = asyncio.Event()
+    
+    async def behaviour(model):
+        if model == 'primary':
+            await release.wait()
+        return await answer(model)
+    
+    async def scenario():
+        client = make_client(behaviour, fallback_models=[('backup', None)])
+        breaker = client.model_breaker(None, 'primary')
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.state == "open"
+        
+        # Open: every caller goes straight to the fallback
+        assert await client.create([]) == "answer from backup"
+        assert client.completions.calls == ['backup']
+        
+        expire(breaker)
+        client.completions.calls.clear()
+        tasks = [asyncio.create_task(client.create([])) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        
+        # Half-open: one trial in flight, the other four fell back
+        assert client.completions.calls.count('primary') == 1
+        assert client.completions.calls.count('backup') == 4
+        assert breaker.trial_in_flight
+        
+        release.set()
+        results = await asyncio.gather(*tasks)
+        assert results.count("answer from primary") == 1
+        assert breaker.state == "closed"
+        assert not breaker.trial_in_flight
+        
+        assert await client.create([]) == "answer from primary"
+    
+    asyncio.run(scenario())
+
+def test_refused_request_keeps_other_callers_trial():
+    release = asyncio.Event()
+    
+    async def behaviour(model):
+        await release.wait()
+        return await answer(model)
+    
+    async def scenario():
+        client = make_client(behaviour)
+        breaker = client.model_breaker(None, 'primary')
+        breaker.record_failure()
+        breaker.record_failure()
+        expire(breaker)
+        
+        trial = asyncio.create_task(client.create([]))
+        await asyncio.sleep(0.01)
+        assert breaker.trial_in_flight
+        
+        # Refused by the model breaker: must not hand out a second trial
+        for _ in range(3):
+            with pytest.raises(ProviderUnavailableError):
+                await client.create([])
+        assert breaker.trial_in_flight
+        assert client.completions.calls == ['primary']
+        
+        release.set()
+        assert await trial == "answer from primary"
+    
+    asyncio.run(scenario())
+
+def test_endpoint_refusal_releases_only_own_trial():
+    async def scenario():
+        client = make_client(answer)
+        endpoint = client.endpoint_breaker(None)
+        model = client.model_breaker(None, 'primary')
+        
+        # The endpoint trial is owned by another request; the model is open
+        endpoint.record_failure()
+        endpoint.record_failure()
+        expire(endpoint)
+        assert endpoint.allow_request()
+        model.record_failure()
+        model.record_failure()
+        
+        with pytest.raises(ProviderUnavailableError):
+            await client.create([])
+        assert endpoint.trial_in_flight
+    
+    asyncio.run(scenario())
+
+@pytest.mark.parametrize('error', [
+    status_error(openai.BadRequestError, 400),
+    status_error(openai.AuthenticationError, 401),
+    status_error(openai.PermissionDeniedError, 403),
+])
+def test_non_retryable_error_releases_model_trial(error):
+    async def behaviour(model):
+        raise error
+    
+    client = make_client(behaviour)
+    breaker = client.model_breaker(None, 'primary')
+    breaker.record_failure()
+    breaker.record_failure()
+    expire(breaker)
+    
+    with pytest.raises(type(error)):
+        asyncio.run(client.create([]))
+    assert not breaker.trial_in_flight
+    assert breaker.allow_request()
+
+def test_cancellation_releases_trials():
+    async def behaviour(model):
+        await asyncio.sleep(10)
+    
+    async def scenario():
+        client = make_client(behaviour)
+        endpoint = client.endpoint_breaker(None)
+        model = client.model_breaker(None, 'primary')
+        for breaker in (endpoint, model):
+            breaker.record_failure()
+            breaker.record_failure()
+            expire(breaker)
+        
+        task = asyncio.create_task(client.create([]))
+        await asyncio.sleep(0.01)
+        assert endpoint.trial_in_flight and model.trial_in_flight
+        
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert not endpoint.trial_in_flight
+        assert not model.trial_in_flight
+    
+    asyncio.run(scenario())
+
+def test_timeout_releases_endpoint_trial():
+    async def behaviour(model):
+        raise openai.APITimeoutError(request=REQUEST)
+    
+    client = make_client(behaviour)
+    endpoint = client.endpoint_breaker(None)
+    endpoint.record_failure()
+    endpoint.record_failure()
+    expire(endpoint)
+    
+    with pytest.raises(ProviderUnavailableError):
+        asyncio.run(client.create([]))
+    # The timeout is blamed on the model; the endpoint trial is handed back
+    assert not endpoint.trial_in_flight
+    assert endpoint.state == "half-open"
+
+def test_connection_error_releases_model_trial():
+    async def behaviour(model):
+        raise openai.APIConnectionError(request=REQUEST)
+    
+    client = make_client(behaviour)
+    model = client.model_breaker(None, 'primary')
+    model.record_failure()
+    model.record_failure()
+    expire(model)
+    
+    with pytest.raises(ProviderUnavailableError):
+        asyncio.run(client.create([]))
+    assert not model.trial_in_flight
+    assert model.state == "half-open"
+
+def test_retries_transient_errors_then_succeeds():
+    attempts = []
+    
+    async def behaviour(model):
+        attempts.append(model)
+        if len(attempts) < 3:
+            raise status_error(openai.InternalServerError, 503)
+        return await answer(model)
+    
+    client = make_client(behaviour, max_retries=3, breaker_threshold=5)
+    assert asyncio.run(client.create([])) == "answer from primary"
+    assert client.stats['retries'] == 2
+    assert client.model_breaker(None, 'primary').failures == 0
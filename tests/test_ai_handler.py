@@ -0,0 +1,94 @@
+import asyncio
+from types import SimpleNamespace
+
+from cogs.ai_handler import AIHandler
+from model_router import ModelRouter
+from settings import DEFAULT_SETTINGS
+from storage import HistoryMessage
+
+class FakeMemory:
+    """Records stored turns; fails for the roles listed in `failing`."""
+    
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.stored = []
+    
+    async def store_record(self, guild_id, channel_id, user_id, display_name, role, content,
+                           max_tokens, token_count=None):
+        await asyncio.sleep(0)
+        if role in self.failing:
+            raise RuntimeError('database is locked')
+        self.stored.append((role, content))
+
+def make_handler(memory):
+    handler = AIHandler(None)
+    handler.system_prompt = 'You are Nebula.'
+    handler.refresh_system_prompt = lambda: None
+    handler.memory_manager = memory
+    
+    async def call_openai(messages, is_admin, tools, settings, decision):
+        handler.sent = messages
+        message = SimpleNamespace(content='Hello Alice!', tool_calls=None)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=message)], model='test-model',
+            usage=SimpleNamespace(prompt_tokens=12, completion_tokens=3)
+        )
+    
+    async def log_route(*args):
+        pass
+    
+    async def measure_usage(job, response, messages):
+        return {'prompt_tokens': 12, 'completion_tokens': 3}
+    
+    handler.call_openai = call_openai
+    handler.log_route = log_route
+    handler.measure_usage = measure_usage
+    return handler
+
+def make_job():
+    return {
+        'guild_id': '1',
+        'channel_id': '2',
+        'user_id': '3',
+        'display_name': 'Alice',
+        'is_admin': False,
+        'content': 'hello there',
+        'images': [],
+        'image_tokens': 0,
+        'settings': dict(DEFAULT_SETTINGS)
+    }
+
+def test_reply_is_delivered_when_storing_the_user_turn_fails():
+    memory = FakeMemory(failing={'user'})
+    result = asyncio.run(make_handler(memory).generate(make_job(), []))
+    
+    assert result['error'] is None
+    assert result['reply'] == 'Hello Alice!'
+    assert memory.stored == [('assistant', 'Hello Alice!')]
+
+def test_reply_is_delivered_when_storing_the_reply_fails():
+    memory = FakeMemory(failing={'assistant'})
+    result = asyncio.run(make_handler(memory).generate(make_job(), []))
+    
+    assert result['error'] is None
+    assert result['reply'] == 'Hello Alice!'
+    assert memory.stored == [('user', 'hello there')]
+
+def test_both_turns_are_stored_in_order():
+    memory = FakeMemory()
+    result = asyncio.run(make_handler(memory).generate(make_job(), []))
+    
+    assert result['reply'] == 'Hello Alice!'
+    assert memory.stored == [('user', 'hello there'), ('assistant', 'Hello Alice!')]
+    assert result['usage'] == {'prompt_tokens': 12, 'completion_tokens': 3}
+
+def test_routing_counts_only_the_history_window_that_is_sent():
+    handler = make_handler(FakeMemory())
+    handler.router = ModelRouter(fast_model='fast', strong_model='strong', max_fast_history_tokens=4000)
+    
+    # 50 loaded messages of 100 tokens; block selection sends the newest 25
+    history = [HistoryMessage(i, 'Bob', 'user', f'message {i}', '2026-01-01 00:00:00', 100) for i in range(1, 51)]
+    result = asyncio.run(handler.generate(make_job(), history))
+    
+    assert len(handler.sent) == 27
+    assert result['decision'].route == 'fast'
@@ -0,0 +1,112 @@
+from types import SimpleNamespace
+
+import discord
+
+from answer_cache import AnswerCache, NAME_PLACEHOLDER, normalize_question
+from cogs.ai_handler import AIHandler, visible_to_everyone
+
+def put(cache, guild_id, question, answer='answer', version=1, now=None):
+    cache.put(guild_id, normalize_question(question), version, answer, 100, 20, 200.0, now=now)
+
+def test_normalize_question():
+    assert normalize_question('  How do I   VERIFY?? <@123> ') == 'how do i verify'
+    assert normalize_question('<#456> where are the rules!') == 'where are the rules'
+
+def test_exact_hit_records_savings():
+    cache = AnswerCache()
+    put(cache, 'g', 'How do I verify?', 'Use the button.', now=0.0)
+    hit = cache.get('g', normalize_question('how do i verify'), 1, now=1.0)
+    assert hit.answer == 'Use the button.'
+
+    assert cache.get('g', normalize_question('something else entirely'), 1, now=1.0) is None
+    stats = cache.get_stats('g')
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+    assert stats['saved_tokens'] == 120
+    assert stats['hit_rate'] == 50.0
+    assert cache.get_stats('other') is None
+
+def test_guilds_are_separate():
+    cache = AnswerCache()
+    put(cache, 'g', 'how do I verify')
+    assert cache.get('h', 'how do i verify', 1) is None
+
+def test_near_duplicates_need_similarity():
+    cache = AnswerCache()
+    put(cache, 'g', 'how do i verify my account')
+    typo = normalize_question('how do i verfy my account')
+    assert cache.get('g', typo, 1) is None
+    assert cache.get('g', typo, 1, similarity=0.6).answer == 'answer'
+    assert cache.get('g', normalize_question('what is the meaning of life'), 1, similarity=0.6) is None
+    assert cache.get_stats('g')['near_hits'] == 1
+
+def test_entries_expire():
+    cache = AnswerCache(ttl=60)
+    put(cache, 'g', 'how do I verify', now=0.0)
+    assert cache.get('g', 'how do i verify', 1, now=59.0) is not None
+    assert cache.get('g', 'how do i verify', 1, now=60.0) is None
+    assert cache.get('g', 'how do i verify', 1, similarity=0.5, now=61.0) is None
+    assert cache.get_stats('g')['entries'] == 0
+
+def test_version_change_drops_answers():
+    cache = AnswerCache()
+    put(cache, 'g', 'how do I verify', version=1)
+    assert cache.get('g', 'how do i verify', 2) is None
+    assert cache.get('g', 'how do i verify', 1) is None
+    assert cache.get_stats('g')['invalidations'] == 1
+
+def test_least_recently_used_is_evicted():
+    cache = AnswerCache(max_entries=2)
+    put(cache, 'g', 'first question here')
+    put(cache, 'g', 'second question here')
+    assert cache.get('g', 'first question here', 1)
+    put(cache, 'g', 'third question here')
+
+    assert cache.get('g', 'second question here', 1) is None
+    assert cache.get('g', 'first question here', 1)
+    stats = cache.get_stats('g')
+    assert (stats['evictions'], stats['entries']) == (1, 2)
+    # The evicted question is gone from the similarity index too
+    assert all('second question here' not in questions for questions in cache.guilds['g'].index.values())
+
+def test_clear_keeps_statistics():
+    cache = AnswerCache()
+    put(cache, 'g', 'how do I verify')
+    cache.get('g', 'how do i verify', 1)
+    cache.clear()
+    assert cache.get('g', 'how do i verify', 1) is None
+    stats = cache.get_stats('g')
+    assert (stats['hits'], stats['invalidations'], stats['entries']) == (1, 1, 0)
+
+class FakeChannel:
+    def __init__(self, everyone_can_view: bool, channel_type=discord.ChannelType.text):
+        self.type = channel_type
+        self.guild = SimpleNamespace(id=1, default_role='@everyone')
+        self.everyone_can_view = everyone_can_view
+
+    def permissions_for(self, role):
+        assert role == '@everyone'
+        return SimpleNamespace(view_channel=self.everyone_can_view)
+
+def store(channel):
+    handler = SimpleNamespace(answer_cache=AnswerCache())
+    message = SimpleNamespace(channel=channel, guild=channel.guild, author=SimpleNamespace(display_name='Alice'))
+    result = {
+        'reply': 'Hi Alice, use the button.', 'tool_calls': [],
+        'usage': {'prompt_tokens': 100, 'completion_tokens': 20}, 'timings': {'model': 150.0}
+    }
+    AIHandler.store_answer(handler, message, 'how do i verify', 1, result)
+    return handler.answer_cache.get('1', 'how do i verify', 1)
+
+def test_visible_to_everyone():
+    assert visible_to_everyone(FakeChannel(True))
+    assert not visible_to_everyone(FakeChannel(False))
+    assert not visible_to_everyone(FakeChannel(True, discord.ChannelType.private_thread))
+
+def test_public_answers_are_stored_with_a_name_placeholder():
+    cached = store(FakeChannel(True))
+    assert cached.answer == f'Hi {NAME_PLACEHOLDER}, use the button.'
+    assert cached.completion_tokens == 20
+
+def test_private_channel_answers_are_not_stored():
+    assert store(FakeChannel(False)) is None
+    assert store(FakeChannel(True, discord.ChannelType.private_thread)) is None
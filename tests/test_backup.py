@@ -0,0 +1,167 @@
+import asyncio
+import contextlib
+import os
+import sqlite3
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from backup import (
+    WriteProbe, create_snapshot, latency_summary, list_snapshots, prune_snapshots,
+    restore_snapshot, snapshot_label
+)
+from cogs import backup_manager
+from database import DatabaseManager
+
+def make_db(tmp_path):
+    return DatabaseManager(str(tmp_path / 'nebula.db'), str(tmp_path / 'nebula_archive.db'))
+
+def tables(db):
+    conn = sqlite3.connect(db.db_path)
+    try:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    finally:
+        conn.close()
+
+def fake_snapshot(directory, name):
+    os.makedirs(directory / name)
+    (directory / name / 'nebula.db').write_bytes(b'')
+
+def test_snapshot_label():
+    assert snapshot_label('nebula-20260301-040000') == ''
+    assert snapshot_label('nebula-20260301-040000-pre-restore') == 'pre-restore'
+
+def test_latency_summary():
+    assert latency_summary([])['samples'] == 0
+
+    summary = latency_summary([float(i) for i in range(1, 101)])
+    assert summary['samples'] == 100
+    assert summary['p50_ms'] == 51.0
+    assert summary['p99_ms'] == 100.0
+    assert summary['max_ms'] == 100.0
+
+def test_prune_counts_labels_separately(tmp_path):
+    for day in range(1, 6):
+        fake_snapshot(tmp_path, f'nebula-2026030{day}-040000')
+    for hour in range(10, 14):
+        fake_snapshot(tmp_path, f'nebula-20260305-{hour}0000-pre-restore')
+
+    removed = prune_snapshots(str(tmp_path), 2)
+
+    remaining = [snapshot['name'] for snapshot in list_snapshots(str(tmp_path))]
+    assert remaining == [
+        'nebula-20260305-130000-pre-restore',
+        'nebula-20260305-120000-pre-restore',
+        'nebula-20260305-040000',
+        'nebula-20260304-040000'
+    ]
+    assert len(removed) == 5
+
+def test_snapshot_samples_write_latency_and_restores(tmp_path):
+    db = make_db(tmp_path)
+    db.add_message('1', '2', '3', 'alice', 'user', 'before the backup')
+
+    result = create_snapshot(
+        [db.db_path, db.archive_path], str(tmp_path / 'backups'), probe_path=db.db_path
+    )
+    assert result['idle_write_latency']['samples'] == 20
+    assert result['write_latency']['samples'] >= 1
+    assert result['pages'] > 0
+    assert 'backup_write_probe' not in tables(db)
+
+    db.add_message('1', '2', '3', 'alice', 'user', 'after the backup')
+    assert len(db.get_conversation_history('1', '2')) == 2
+
+    restored = restore_snapshot(str(tmp_path / 'backups'), result['name'], [db.db_path, db.archive_path])
+    assert db.db_path in restored
+    history = db.get_conversation_history('1', '2')
+    assert [message.content for message in history] == ['before the backup']
+
+def test_write_probe_leaves_other_tables_alone(tmp_path):
+    db = make_db(tmp_path)
+    probe = WriteProbe(db.db_path, interval=0.001)
+    probe.start()
+    summary = probe.stop()
+    assert summary['samples'] >= 1
+
+    conn = sqlite3.connect(db.db_path)
+    assert conn.execute('SELECT COUNT(*) FROM backup_write_probe').fetchone()[0] == 1
+    assert conn.execute('SELECT COUNT(*) FROM conversation_history').fetchone()[0] == 0
+    conn.close()
+
+def test_failed_snapshot_is_removed_and_probe_stopped(tmp_path, monkeypatch):
+    db = make_db(tmp_path)
+
+    def fail(*args, **kwargs):
+        raise sqlite3.DatabaseError('disk full')
+
+    monkeypatch.setattr('backup.backup_database', fail)
+    with pytest.raises(sqlite3.DatabaseError):
+        create_snapshot([db.db_path], str(tmp_path / 'backups'), probe_path=db.db_path)
+
+    assert list_snapshots(str(tmp_path / 'backups')) == []
+    assert not any(thread.name == 'backup-write-probe' for thread in threading.enumerate())
+
+class FakeContext:
+    def __init__(self):
+        self.sent = []
+        self.author = 'owner'
+
+    @contextlib.asynccontextmanager
+    async def typing(self):
+        yield
+
+    async def send(self, content=None, embed=None):
+        self.sent.append(content or embed)
+
+def make_manager(tmp_path, monkeypatch, cogs=None):
+    db = make_db(tmp_path)
+    monkeypatch.setattr(backup_manager, 'get_storage', lambda: db)
+    monkeypatch.setenv('BACKUP_DIR', str(tmp_path / 'backups'))
+    monkeypatch.setenv('BACKUP_INTERVAL_HOURS', '0')
+    cogs = cogs or {}
+    return backup_manager.BackupManager(SimpleNamespace(get_cog=cogs.get)), db
+
+def test_backups_do_not_write_to_the_database_unless_probed(tmp_path, monkeypatch):
+    manager, db = make_manager(tmp_path, monkeypatch)
+    before = tables(db)
+
+    # Labelled so that it cannot share a name with the snapshot below
+    result = asyncio.run(manager.run_backup(label='manual'))
+    assert 'write_latency' not in result
+    assert tables(db) == before
+
+    ctx = FakeContext()
+    asyncio.run(manager.backup_now.callback(manager, ctx, '--probe'))
+    embed = ctx.sent[-1]
+    assert any(field.name == 'Write Latency During Backup' for field in embed.fields)
+    assert manager.last_run['write_latency']['samples'] >= 1
+    assert tables(db) == before
+
+    asyncio.run(manager.backup_now.callback(manager, ctx, '--fast'))
+    assert ctx.sent[-1].startswith('❌ Usage')
+
+def test_restore_refreshes_state_loaded_from_the_old_database(tmp_path, monkeypatch):
+    calls = []
+
+    async def reload_buckets():
+        calls.append('quota')
+
+    cogs = {
+        'MemoryManager': SimpleNamespace(invalidate_context=lambda key=None: calls.append(('context', key))),
+        'QuotaManager': SimpleNamespace(reload_buckets=reload_buckets),
+        'AIHandler': SimpleNamespace(answer_cache=SimpleNamespace(clear=lambda: calls.append('answers'))),
+        'SettingsManager': SimpleNamespace(store=SimpleNamespace(clear=lambda: calls.append('settings'))),
+    }
+    manager, db = make_manager(tmp_path, monkeypatch, cogs)
+    db.add_message('1', '2', '3', 'alice', 'user', 'before the backup')
+    snapshot = asyncio.run(manager.run_backup())
+    db.add_message('1', '2', '3', 'alice', 'user', 'after the backup')
+
+    ctx = FakeContext()
+    asyncio.run(manager.restore_backup.callback(manager, ctx, snapshot['name']))
+
+    assert [message.content for message in db.get_conversation_history('1', '2')] == ['before the backup']
+    assert calls == [('context', None), 'quota', 'answers', 'settings']
+    assert ctx.sent[-1].title == '💾 Restore Complete'
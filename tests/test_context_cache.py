@@ -0,0 +1,83 @@
+from context_cache import ContextCache
+from storage import HistoryMessage
+
+KEY = ('guild', 'channel')
+
+def message(message_id: int, content: str = 'hello') -> HistoryMessage:
+    return HistoryMessage(message_id, 'Alice', 'user', content, '2026-01-01 00:00:00', 1)
+
+def test_get_returns_last_messages():
+    cache = ContextCache(window_size=5)
+    cache.put(KEY, [message(i) for i in range(1, 9)])
+    
+    assert [msg.id for msg in cache.get(KEY, 5)] == [4, 5, 6, 7, 8]
+    assert [msg.id for msg in cache.get(KEY, 2)] == [7, 8]
+    # Larger than the window: must be read from the database
+    assert cache.get(KEY, 6) is None
+
+def test_append_rolls_window_and_tracks_bytes():
+    cache = ContextCache(window_size=3)
+    cache.put(KEY, [message(1), message(2), message(3)])
+    before = cache.total_bytes
+    
+    cache.append(KEY, message(4, 'a much longer message than the others'))
+    
+    assert [msg.id for msg in cache.get(KEY, 3)] == [2, 3, 4]
+    assert cache.total_bytes > before
+    assert cache.total_bytes == sum(cache.window_bytes.values())
+
+def test_out_of_order_append_invalidates():
+    cache = ContextCache()
+    cache.put(KEY, [message(5)])
+    cache.append(KEY, message(3))
+    assert cache.get(KEY, 1) is None
+
+def test_stale_put_after_write_is_skipped():
+    cache = ContextCache()
+    generation = cache.get_generation(KEY)
+    cache.append(KEY, message(1))
+    
+    cache.put(KEY, [], generation)
+    assert cache.get(KEY, 1) is None
+
+def test_stale_put_after_clear_is_skipped():
+    cache = ContextCache()
+    generation = cache.get_generation(KEY)
+    cache.clear()
+    
+    cache.put(KEY, [message(1)], generation)
+    assert cache.get(KEY, 1) is None
+    
+    cache.put(KEY, [message(1)], cache.get_generation(KEY))
+    assert cache.get(KEY, 1) == [message(1)]
+
+def test_evicts_least_recently_used():
+    cache = ContextCache(window_size=10)
+    cache.put(('g', 'a'), [message(1)])
+    cache.max_bytes = cache.total_bytes * 2
+    cache.put(('g', 'b'), [message(2)])
+    cache.get(('g', 'a'), 1)
+    cache.put(('g', 'c'), [message(3)])
+    
+    assert cache.get(('g', 'b'), 1) is None
+    assert cache.get(('g', 'a'), 1) is not None
+    assert cache.evictions == 1
+    assert cache.total_bytes <= cache.max_bytes
+
+def test_on_drop_reports_invalidated_and_evicted_channels():
+    cache = ContextCache(window_size=10)
+    dropped = []
+    cache.on_drop = dropped.append
+    
+    cache.put(('g', 'a'), [message(1)])
+    cache.max_bytes = cache.total_bytes
+    # Refreshing a window or reloading it after a write keeps the channel's state
+    cache.put(('g', 'a'), [message(1), message(2)][-1:])
+    cache.append(('g', 'a'), message(0))
+    assert dropped == []
+    
+    cache.put(('g', 'a'), [message(1)])
+    cache.put(('g', 'b'), [message(2)])
+    cache.invalidate(('g', 'b'))
+    cache.clear()
+    assert dropped == [('g', 'a'), ('g', 'b'), None]
@@ -0,0 +1,214 @@
+import sqlite3
+
+import pytest
+
+from database import DatabaseManager, to_fts_query
+
+@pytest.fixture
+def db(tmp_path):
+    return DatabaseManager(str(tmp_path / 'nebula.db'))
+
+def set_timestamp(db: DatabaseManager, message_id: int, timestamp: str):
+    conn = db.get_connection()
+    conn.execute('UPDATE conversation_history SET timestamp = ? WHERE id = ?', (timestamp, message_id))
+    conn.commit()
+    conn.close()
+
+# Full-text search
+
+def test_to_fts_query_quotes_terms():
+    assert to_fts_query('verify rules') == '"verify" "rules"'
+    assert to_fts_query('ticket*') == '"ticket"*'
+    assert to_fts_query('say "hi" OR NEAR(') == '"say" """hi""" "OR" "NEAR("'
+    assert to_fts_query('* **') == ''
+
+def test_search_matches_all_terms_newest_first(db):
+    db.add_message('g', 'c', 'u1', 'Alice', 'user', 'How do I verify my account?')
+    db.add_message('g', 'c', 'u2', 'Bob', 'user', 'Read the rules first')
+    db.add_message('g', 'c', 'u1', 'Alice', 'user', 'The rules say to verify in #verify')
+    db.add_message('other', 'c', 'u1', 'Alice', 'user', 'verify rules elsewhere')
+    
+    results = db.search_history('g', 'verify')
+    assert [r['id'] for r in results] == [3, 1]
+    assert results[0]['display_name'] == 'Alice'
+    assert '**verify**' in results[0]['snippet']
+    assert not results[0]['archived']
+    
+    assert [r['id'] for r in db.search_history('g', 'rules verify')] == [3]
+    assert [r['id'] for r in db.search_history('g', 'verif*')] == [3, 1]
+    assert db.search_history('g', 'missing') == []
+
+def test_search_ignores_fts_syntax_in_input(db):
+    db.add_message('g', 'c', 'u', 'Alice', 'user', 'hello NEAR world')
+    assert [r['id'] for r in db.search_history('g', 'NEAR(hello')] == []
+    assert [r['id'] for r in db.search_history('g', 'near "hello"')] == [1]
+    assert db.search_history('g', '***') == []
+
+def test_search_filters(db):
+    db.add_message('g', 'a', 'u1', 'Alice', 'user', 'ticket one')
+    db.add_message('g', 'b', 'u2', 'Bob', 'user', 'ticket two')
+    db.add_message('g', 'a', 'u2', 'Bob', 'user', 'ticket three')
+    set_timestamp(db, 1, '2026-01-01 10:00:00')
+    set_timestamp(db, 2, '2026-02-01 10:00:00')
+    set_timestamp(db, 3, '2026-03-01 10:00:00')
+    
+    assert [r['id'] for r in db.search_history('g', 'ticket', user_id='u2')] == [3, 2]
+    assert [r['id'] for r in db.search_history('g', 'ticket', channel_id='a')] == [3, 1]
+    assert [r['id'] for r in db.search_history('g', 'ticket', since='2026-02-01')] == [3, 2]
+    assert [r['id'] for r in db.search_history('g', 'ticket', until='2026-02-01')] == [1]
+    assert [r['id'] for r in db.search_history('g', 'ticket', limit=1)] == [3]
+
+def test_index_follows_resets_and_edits(db):
+    db.add_message('g', 'c', 'u', 'Alice', 'user', 'secret plan')
+    db.reset_conversation('g', 'c')
+    assert db.search_history('g', 'secret') == []
+    
+    db.add_message('g', 'c', 'u', 'Alice', 'user', 'old words')
+    conn = db.get_connection()
+    conn.execute("UPDATE conversation_history SET content = 'new words' WHERE id = 2")
+    conn.commit()
+    conn.close()
+    assert db.search_history('g', 'old') == []
+    assert [r['id'] for r in db.search_history('g', 'new')] == [2]
+
+def test_existing_rows_are_indexed_on_first_start(tmp_path):
+    path = str(tmp_path / 'old.db')
+    db = DatabaseManager(path)
+    db.add_message('g', 'c', 'u', 'Alice', 'user', 'written before the index')
+    
+    conn = sqlite3.connect(path)
+    conn.execute('DROP TABLE conversation_fts')
+    conn.commit()
+    conn.close()
+    
+    db = DatabaseManager(path)
+    assert [r['id'] for r in db.search_history('g', 'before index')] == [1]
+
+# Archive
+
+def add_old_messages(db: DatabaseManager, count: int, channel_id: str = 'c', timestamp: str = '2020-01-01 00:00:00'):
+    for i in range(count):
+        message = db.add_message('g', channel_id, f'u{i % 2}', f'Member {i % 2}', 'user', f'archived note {i}', 3)
+        set_timestamp(db, message.id, timestamp)
+
+def test_archive_moves_old_rows_into_segments(db, monkeypatch):
+    monkeypatch.setattr('database.ARCHIVE_SEGMENT_SIZE', 3)
+    add_old_messages(db, 7)
+    db.add_message('g', 'c', 'u0', 'Member 0', 'user', 'recent note')
+    
+    assert db.archive_messages(before='2021-01-01') == 7
+    
+    stats = db.get_archive_stats('g')
+    assert stats['hot_messages'] == 1
+    assert stats['segments'] == 3
+    assert stats['archived_messages'] == 7
+    assert stats['compressed_bytes'] > 0
+    assert [msg.content for msg in db.get_conversation_history('g', 'c')] == ['recent note']
+    # Nothing left to archive
+    assert db.archive_messages(before='2021-01-01') == 0
+
+def test_search_reads_the_archive_index(db, monkeypatch):
+    monkeypatch.setattr('database.ARCHIVE_SEGMENT_SIZE', 3)
+    add_old_messages(db, 7)
+    add_old_messages(db, 2, channel_id='d', timestamp='2020-06-01 00:00:00')
+    db.add_message('g', 'c', 'u0', 'Member 0', 'user', 'recent note')
+    db.archive_messages(before='2021-01-01')
+    
+    results = db.search_history('g', 'note', limit=4)
+    assert [(r['id'], r['archived']) for r in results] == [(10, False), (9, True), (8, True), (7, True)]
+    assert results[1]['channel_id'] == 'd'
+    assert results[1]['snippet'] == 'archived note 1'
+    
+    assert [r['id'] for r in db.search_history('g', 'archived', user_id='u1', channel_id='c')] == [6, 4, 2]
+    assert [r['id'] for r in db.search_history('g', 'note', since='2020-03-01', include_archive=True)] == [10, 9, 8]
+    assert [r['id'] for r in db.search_history('g', 'archived note', until='2020-03-01', limit=2)] == [7, 6]
+    assert [r['id'] for r in db.search_history('g', '5')] == [6]
+    assert db.search_history('g', 'note', include_archive=False)[0]['id'] == 10
+    assert db.search_history('other', 'note') == []
+
+def test_archive_run_after_crash_does_not_duplicate(db):
+    add_old_messages(db, 4)
+    rows = db.get_conversation_history('g', 'c')
+    db.archive_messages(before='2021-01-01')
+    
+    # A crash between committing the segment and deleting the hot rows
+    # leaves the rows behind
+    conn = db.get_connection()
+    conn.executemany(
+        '''INSERT INTO conversation_history (id, guild_id, channel_id, user_id, display_name, role, content, timestamp)
+           VALUES (?, 'g', 'c', 'u0', 'Member 0', 'user', ?, ?)''',
+        [(msg.id, msg.content, msg.timestamp) for msg in rows]
+    )
+    conn.commit()
+    conn.close()
+    
+    assert db.archive_messages(before='2021-01-01') == 0
+    stats = db.get_archive_stats('g')
+    assert stats['hot_messages'] == 0
+    assert stats['archived_messages'] == 4
+    assert [r['id'] for r in db.search_history('g', 'archived')] == [4, 3, 2, 1]
+
+def test_existing_archive_is_indexed_on_first_start(tmp_path):
+    path = str(tmp_path / 'nebula.db')
+    db = DatabaseManager(path)
+    add_old_messages(db, 3)
+    db.archive_messages(before='2021-01-01')
+    
+    conn = sqlite3.connect(db.archive_path)
+    conn.execute('DROP TABLE archive_fts')
+    conn.execute('DROP TABLE archive_messages')
+    conn.commit()
+    conn.close()
+    
+    db = DatabaseManager(path)
+    assert [r['id'] for r in db.search_history('g', 'archived note')] == [3, 2, 1]
+
+# Keyset pagination and exports
+
+def test_admin_log_pages(db):
+    for i in range(7):
+        db.log_admin_action('g', 'a', 'Admin', f'action{i}')
+    db.log_admin_action('other', 'a', 'Admin', 'elsewhere')
+    
+    first = db.get_admin_logs('g', 3)
+    assert [log['id'] for log in first] == [7, 6, 5]
+    older = db.get_admin_logs('g', 3, before_id=first[-1]['id'])
+    assert [log['id'] for log in older] == [4, 3, 2]
+    oldest = db.get_admin_logs('g', 3, before_id=older[-1]['id'])
+    assert [log['id'] for log in oldest] == [1]
+    
+    # Paging back towards the newest entries
+    assert [log['id'] for log in db.get_admin_logs('g', 3, after_id=older[0]['id'])] == [7, 6, 5]
+    assert [log['id'] for log in db.get_admin_logs('g', 3, after_id=2)] == [5, 4, 3]
+    assert db.count_admin_logs('g') == 7
+
+def test_iter_admin_logs_batches(db):
+    for i in range(5):
+        db.log_admin_action('g', 'a', 'Admin', f'action{i}', details=f'#{i}')
+    conn = db.get_connection()
+    conn.execute("UPDATE admin_actions_log SET timestamp = '2020-01-01 00:00:00' WHERE id <= 2")
+    conn.commit()
+    conn.close()
+    
+    logs = list(db.iter_admin_logs('g', batch_size=2))
+    assert [log['id'] for log in logs] == [1, 2, 3, 4, 5]
+    assert logs[0]['details'] == '#0'
+    assert [log['id'] for log in db.iter_admin_logs('g', since='2021-01-01', batch_size=2)] == [3, 4, 5]
+
+def test_history_export_reads_archive_then_hot_rows(db, monkeypatch):
+    monkeypatch.setattr('database.ARCHIVE_SEGMENT_SIZE', 2)
+    add_old_messages(db, 5)
+    add_old_messages(db, 1, channel_id='d')
+    db.archive_messages(before='2021-01-01')
+    for i in range(3):
+        db.add_message('g', 'c', 'u0', 'Member 0', 'user', f'hot {i}')
+    
+    rows = list(db.iter_history_export('g', batch_size=2))
+    assert [row['id'] for row in rows] == [1, 2, 3, 4, 5, 6, 7, 8, 9]
+    assert [row['archived'] for row in rows] == [True] * 6 + [False] * 3
+    assert rows[5]['channel_id'] == 'd'
+    assert rows[0]['content'] == 'archived note 0'
+    
+    assert [row['id'] for row in db.iter_history_export('g', channel_id='c', batch_size=2)] == [1, 2, 3, 4, 5, 7, 8, 9]
+    assert [row['id'] for row in db.iter_history_export('g', since='2021-01-01')] == [7, 8, 9]
+    assert [row['id'] for row in db.iter_history_export('g', include_archive=False)] == [7, 8, 9]
@@ -0,0 +1,147 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from cogs.delivery_manager import DeliveryManager
+from delivery import CONTINUED_MARKER, RateWindow, count_fences, pack_messages, split_markdown
+
+def balanced(chunk: str) -> bool:
+    return count_fences(chunk) % 2 == 0
+
+# Chunking
+
+def test_short_text_is_one_message():
+    assert split_markdown("  hello  ") == ["hello"]
+    assert split_markdown("   ") == []
+
+def test_lines_are_packed_greedily():
+    text = '\n'.join(f"line {i}" for i in range(10))
+    chunks = split_markdown(text, limit=20)
+    assert all(len(chunk) <= 20 for chunk in chunks)
+    assert '\n'.join(chunks) == text
+    assert len(chunks) == 4
+
+def test_long_line_is_split_on_whitespace():
+    chunks = split_markdown("word " * 100, limit=50)
+    assert all(len(chunk) <= 50 for chunk in chunks)
+    assert ' '.join(chunks).split() == ["word"] * 100
+
+def test_code_block_is_kept_whole():
+    block = "```py\nprint(1)\nprint(2)\n```"
+    chunks = split_markdown("a" * 30 + "\n" + block, limit=40)
+    assert chunks == ["a" * 30, block]
+
+def test_oversized_code_block_reopens_fence():
+    lines = [f"print({i})" for i in range(100)]
+    chunks = split_markdown("```py\n" + '\n'.join(lines) + "\n```", limit=200)
+    
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert len(chunk) <= 200
+        assert chunk.startswith("```py\n") and chunk.endswith("\n```")
+    body = [line for chunk in chunks for line in chunk.split('\n')[1:-1]]
+    assert body == lines
+
+def test_inline_fences_do_not_toggle_code_blocks():
+    text = '\n'.join(["```x``` is inline"] * 30 + ["plain text"] * 30)
+    chunks = split_markdown(text, limit=100)
+    assert all(balanced(chunk) and len(chunk) <= 100 for chunk in chunks)
+    assert '\n'.join(chunks) == text
+
+def test_escaped_fences_are_text():
+    text = '\n'.join([r"use \``` to write a fence"] * 20)
+    chunks = split_markdown(text, limit=80)
+    assert all(not chunk.startswith("```") and not chunk.endswith("```") for chunk in chunks)
+    assert '\n'.join(chunks) == text
+
+def test_text_around_fences_stays_outside_code():
+    code = '\n'.join(f"x = {i}" for i in range(60))
+    text = f"Here it is: ```py\n{code}\ny = 1``` and that's all"
+    chunks = split_markdown(text, limit=150)
+    
+    assert all(balanced(chunk) and len(chunk) <= 150 for chunk in chunks)
+    assert chunks[0].startswith("Here it is:\n```py\n")
+    assert chunks[-1].endswith("y = 1\n``` and that's all")
+
+def test_unterminated_fence_is_closed():
+    chunks = split_markdown("```\n" + "code line\n" * 50, limit=100)
+    assert all(balanced(chunk) for chunk in chunks)
+
+def test_random_documents_never_exceed_limit_or_break_fences():
+    generator = random.Random(7)
+    pieces = ["plain words here", "```py", "```", "```x``` inline", r"escaped \```", "a" * 120,
+              "text ```sh", "done``` after", "", "- list item", "`single` ticks"]
+    for _ in range(300):
+        text = '\n'.join(generator.choice(pieces) for _ in range(generator.randint(1, 120)))
+        limit = generator.choice([60, 200, 2000])
+        chunks = split_markdown(text, limit)
+        
+        assert all(len(chunk) <= limit for chunk in chunks)
+        assert all(balanced(chunk) for chunk in chunks if count_fences(text) % 2 == 0)
+
+def test_pack_messages_merges_parts():
+    assert pack_messages(["first", "", "  ", "second"]) == ["first\n\nsecond"]
+    assert pack_messages(["", "  "]) == []
+
+def test_follow_up_messages_are_marked_as_continued():
+    text = "\n".join(f"line {i} " + "x" * 30 for i in range(10))
+    assert pack_messages([text], limit=len(text)) == [text]
+    
+    chunks = pack_messages([text, "```py\n" + "print(1)\n" * 20 + "```"], limit=100)
+    assert len(chunks) > 2
+    assert not chunks[0].startswith(CONTINUED_MARKER)
+    assert all(chunk.startswith(f"{CONTINUED_MARKER}\n") for chunk in chunks[1:])
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert all(balanced(chunk) for chunk in chunks)
+
+# Pacing
+
+def test_rate_window():
+    window = RateWindow(2, 5.0)
+    assert window.delay(now=0.0) == 0.0
+    window.record(now=0.0)
+    window.record(now=1.0)
+    assert window.delay(now=2.0) == pytest.approx(3.0)
+    assert window.delay(now=5.0) == 0.0
+
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.sent = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+    
+    async def send(self, content):
+        await self.gate.wait()
+        self.sent.append(content)
+        return SimpleNamespace(content=content)
+
+def test_sends_in_order_per_channel():
+    async def scenario():
+        manager = DeliveryManager(bot=None)
+        channel = FakeChannel(1)
+        results = await asyncio.gather(*(manager.send(channel, f"message {i}") for i in range(4)))
+        
+        assert channel.sent == [f"message {i}" for i in range(4)]
+        assert [[m.content for m in sent] for sent in results] == [[f"message {i}"] for i in range(4)]
+        manager.cog_unload()
+    
+    asyncio.run(scenario())
+
+def test_unload_cancels_waiting_senders():
+    async def scenario():
+        manager = DeliveryManager(bot=None)
+        channel = FakeChannel(1)
+        channel.gate.clear()
+        
+        senders = [asyncio.create_task(manager.send(channel, f"message {i}")) for i in range(3)]
+        await asyncio.sleep(0.01)
+        manager.cog_unload()
+        
+        results = await asyncio.wait_for(asyncio.gather(*senders, return_exceptions=True), 1)
+        assert all(isinstance(result, asyncio.CancelledError) for result in results)
+        assert manager.get_stats()['queued'] == 0
+    
+    asyncio.run(scenario())
@@ -0,0 +1,113 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from cogs import admin_tools, quota_manager, settings_manager
+from memory_storage import MemoryStorage
+from settings import SettingsStore
+
+DELAY = 0.2
+
+class SlowStorage:
+    """Wraps a backend so that every call blocks its thread for DELAY seconds."""
+    
+    def __init__(self, db):
+        self.db = db
+        self.calls = []
+    
+    def __getattr__(self, name):
+        method = getattr(self.db, name)
+        
+        def slow(*args, **kwargs):
+            self.calls.append(name)
+            time.sleep(DELAY)
+            return method(*args, **kwargs)
+        return slow
+
+async def max_loop_lag(operation) -> float:
+    """Run `operation` while timing how late a 10 ms ticker wakes up."""
+    lags = []
+    done = False
+    
+    async def ticker():
+        while not done:
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - started - 0.01)
+    
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.02)
+    await operation
+    done = True
+    await task
+    return max(lags)
+
+class FakeContext:
+    def __init__(self):
+        self.guild = SimpleNamespace(id=1, filesize_limit=8 * 1024 * 1024)
+        self.author = SimpleNamespace(id=3, display_name='Admin')
+        self.sent = []
+    
+    async def send(self, content=None, embed=None, **kwargs):
+        self.sent.append(content or embed)
+
+@pytest.fixture
+def db(monkeypatch):
+    db = SlowStorage(MemoryStorage())
+    db.db.record_user_activity('1', '2', '42', 'Alice', 10, '2026-10-01 12:00:00')
+    for module in (admin_tools, quota_manager, settings_manager):
+        monkeypatch.setattr(module, 'get_storage', lambda: db)
+    return db
+
+def admin_message():
+    return SimpleNamespace(
+        guild=SimpleNamespace(id=1),
+        author=SimpleNamespace(id=3, display_name='Admin', guild_permissions=SimpleNamespace(administrator=True))
+    )
+
+def test_admin_tools_do_not_block_the_loop(db):
+    async def scenario():
+        cog = admin_tools.AdminTools(SimpleNamespace())
+        ctx = FakeContext()
+        
+        report = await asyncio.wait_for(asyncio.gather(
+            max_loop_lag(cog.user_activity_tool(admin_message(), '<@42>')),
+            max_loop_lag(cog.top_users.callback(cog, ctx)),
+            max_loop_lag(cog.channel_activity.callback(cog, ctx))
+        ), 10)
+        return report, ctx
+    
+    lags, ctx = asyncio.run(scenario())
+    assert max(lags) < DELAY / 2
+    assert {'get_user_activity', 'log_admin_action', 'get_top_users', 'get_channel_activity'} <= set(db.calls)
+    assert len(ctx.sent) == 2
+
+def test_settings_do_not_block_the_loop(db):
+    async def scenario():
+        cog = settings_manager.SettingsManager(SimpleNamespace())
+        ctx = FakeContext()
+        lags = [
+            await max_loop_lag(cog.store.get_all('1')),
+            await max_loop_lag(cog.set_setting.callback(cog, ctx, 'temperature', value='1.1')),
+            await max_loop_lag(cog.reset_setting.callback(cog, ctx, 'temperature')),
+            await max_loop_lag(cog.settings.callback(cog, ctx))
+        ]
+        return lags, await cog.store.get('1', 'temperature')
+    
+    lags, temperature = asyncio.run(scenario())
+    assert max(lags) < DELAY / 2
+    assert temperature == 0.7
+
+def test_quota_persistence_does_not_block_the_loop(db):
+    async def scenario():
+        cog = quota_manager.QuotaManager(SimpleNamespace(get_cog=lambda name: None))
+        lags = [await max_loop_lag(cog.cog_load())]
+        cog.buckets['user:1:3:requests'] = quota_manager.TokenBucket(6, level=0)
+        lags.append(await max_loop_lag(cog.cog_unload()))
+        return lags
+    
+    assert max(asyncio.run(scenario())) < DELAY / 2
+    # The persistence loop also saves once when it starts
+    assert (db.calls[0], db.calls[-1]) == ('load_quota_buckets', 'save_quota_buckets')
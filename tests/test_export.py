@@ -0,0 +1,63 @@
+import csv
+import gzip
+import json
+import os
+import random
+
+import pytest
+
+from export import HISTORY_FIELDS, export_rows
+
+def rows(count: int):
+    for i in range(count):
+        yield {'id': i, 'timestamp': '2026-01-01 00:00:00', 'channel_id': 'c', 'user_id': 'u',
+               'display_name': 'Alice', 'role': 'user', 'content': f'message {i}', 'token_count': 3,
+               'archived': False, 'extra': 'ignored'}
+
+def test_jsonl_export(tmp_path):
+    result = export_rows(rows(3), str(tmp_path), 'history', HISTORY_FIELDS)
+    
+    assert result['rows'] == 3
+    assert [path.split('/')[-1] for path in result['paths']] == ['history.jsonl.gz']
+    with gzip.open(result['paths'][0], 'rt', encoding='utf-8') as f:
+        lines = [json.loads(line) for line in f]
+    assert [line['content'] for line in lines] == ['message 0', 'message 1', 'message 2']
+    assert list(lines[0]) == HISTORY_FIELDS
+
+def test_csv_export(tmp_path):
+    result = export_rows(rows(2), str(tmp_path), 'history', HISTORY_FIELDS, fmt='csv')
+    with gzip.open(result['paths'][0], 'rt', encoding='utf-8', newline='') as f:
+        exported = list(csv.DictReader(f))
+    assert [row['content'] for row in exported] == ['message 0', 'message 1']
+
+def test_empty_export_still_writes_a_file(tmp_path):
+    result = export_rows(iter(()), str(tmp_path), 'logs', HISTORY_FIELDS)
+    assert result['rows'] == 0
+    assert len(result['paths']) == 1
+
+def test_large_export_is_split_into_parts(tmp_path):
+    generator = random.Random(1)
+    
+    def noisy_rows(count):
+        for row in rows(count):
+            # Hardly compressible content so the parts fill up
+            row['content'] = generator.randbytes(256).hex()
+            yield row
+    
+    result = export_rows(noisy_rows(8000), str(tmp_path), 'history', HISTORY_FIELDS, max_bytes=2 * 1024 * 1024)
+    
+    names = [path.split('/')[-1] for path in result['paths']]
+    assert len(names) > 1
+    assert names[0] == 'history-part1.jsonl.gz'
+    assert names[1] == 'history-part2.jsonl.gz'
+    
+    exported = 0
+    for path in result['paths']:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            exported += sum(1 for _ in f)
+    assert exported == 8000
+    assert all(os.path.getsize(path) <= 2 * 1024 * 1024 for path in result['paths'])
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        export_rows(rows(1), str(tmp_path), 'history', HISTORY_FIELDS, fmt='xml')
@@ -0,0 +1,127 @@
+import asyncio
+import base64
+import io
+
+from PIL import Image
+
+from images import ImageProcessor, estimate_image_tokens
+
+def make_image(width, height, mode='RGB', color=(200, 30, 30), format='PNG'):
+    output = io.BytesIO()
+    Image.new(mode, (width, height), color).save(output, format)
+    return output.getvalue()
+
+class FakeAttachment:
+    def __init__(self, attachment_id, data, size=None):
+        self.id = attachment_id
+        self.filename = f'image{attachment_id}.png'
+        self.data = data
+        self.size = len(data) if size is None else size
+        self.reads = 0
+
+    async def read(self):
+        self.reads += 1
+        return self.data
+
+def counting_encodes(processor):
+    calls = []
+    encode = processor.encode
+
+    def counted(data):
+        calls.append(len(data))
+        return encode(data)
+
+    processor.encode = counted
+    return calls
+
+def decode(image):
+    header, data = image.data_url.split(',', 1)
+    assert header == 'data:image/jpeg;base64'
+    return Image.open(io.BytesIO(base64.b64decode(data)))
+
+def test_token_estimates():
+    assert estimate_image_tokens(768, 512, 'high') == 85 + 170 * 2
+    # Fitted into 2048x2048, then the short side scaled to 768: 1024x768
+    assert estimate_image_tokens(4000, 3000, 'high') == 85 + 170 * 4
+    assert estimate_image_tokens(100, 100, 'high') == 85 + 170
+    assert estimate_image_tokens(4000, 3000, 'low') == 85
+
+def test_oversized_attachment_is_not_downloaded():
+    processor = ImageProcessor(max_bytes=1000)
+    attachment = FakeAttachment(1, make_image(10, 10), size=5000)
+    assert asyncio.run(processor.process([attachment])) == []
+    assert attachment.reads == 0
+    assert processor.stats['too_large'] == 1
+
+def test_downscales_and_reencodes_as_jpeg():
+    processor = ImageProcessor(max_side=768)
+    data = make_image(1600, 1200)
+    [image] = asyncio.run(processor.process([FakeAttachment(1, data)]))
+
+    assert (image.width, image.height) == (768, 576)
+    assert image.detail == 'high'
+    assert image.tokens == estimate_image_tokens(768, 576, 'high')
+    assert (image.source_bytes, image.encoded_bytes) == (len(data), len(base64.b64decode(image.data_url.split(',', 1)[1])))
+
+    decoded = decode(image)
+    assert decoded.format == 'JPEG' and decoded.mode == 'RGB'
+    assert decoded.size == (768, 576)
+    assert image.to_content_part() == {'type': 'image_url', 'image_url': {'url': image.data_url, 'detail': 'high'}}
+
+def test_small_images_keep_their_size():
+    processor = ImageProcessor(max_side=768)
+    [image] = asyncio.run(processor.process([FakeAttachment(1, make_image(300, 200))]))
+    assert (image.width, image.height) == (300, 200)
+
+def test_transparent_images_are_flattened_onto_white():
+    processor = ImageProcessor()
+    data = make_image(64, 64, mode='RGBA', color=(0, 0, 0, 0))
+    [image] = asyncio.run(processor.process([FakeAttachment(1, data)]))
+    assert all(channel > 240 for channel in decode(image).getpixel((32, 32)))
+
+def test_low_detail_caps_the_side_and_costs_a_flat_rate():
+    processor = ImageProcessor(max_side=768, detail='low')
+    [image] = asyncio.run(processor.process([FakeAttachment(1, make_image(1600, 1200))]))
+    assert (image.width, image.height) == (512, 384)
+    assert (image.detail, image.tokens) == ('low', 85)
+
+def test_cache_hit_by_attachment_id():
+    processor = ImageProcessor()
+    encodes = counting_encodes(processor)
+    attachment = FakeAttachment(1, make_image(100, 100))
+
+    first = asyncio.run(processor.process([attachment]))
+    second = asyncio.run(processor.process([attachment]))
+    assert first == second
+    # The second lookup skips the download as well as the encode
+    assert attachment.reads == 1
+    assert len(encodes) == 1
+    assert processor.stats['cache_hits'] == 1
+
+def test_cache_hit_by_content_hash():
+    processor = ImageProcessor()
+    encodes = counting_encodes(processor)
+    data = make_image(100, 100)
+
+    [first] = asyncio.run(processor.process([FakeAttachment(1, data)]))
+    repost = FakeAttachment(2, data)
+    [second] = asyncio.run(processor.process([repost]))
+    assert first == second
+    assert repost.reads == 1
+    assert len(encodes) == 1
+    assert processor.get_stats()['cache_hits'] == 1
+    assert processor.get_stats()['cached'] == 1
+
+def test_cache_is_bounded_by_bytes():
+    processor = ImageProcessor()
+    [first] = asyncio.run(processor.process([FakeAttachment(1, make_image(100, 100))]))
+    processor.cache_bytes = len(first.data_url) + 1
+    asyncio.run(processor.process([FakeAttachment(2, make_image(100, 100, color=(0, 0, 255)))]))
+    assert len(processor.cache) == 1
+    assert processor.total_bytes <= processor.cache_bytes
+
+def test_failed_images_are_skipped():
+    processor = ImageProcessor()
+    images = asyncio.run(processor.process([FakeAttachment(1, b'not an image'), FakeAttachment(2, make_image(10, 10))]))
+    assert len(images) == 1
+    assert processor.stats['failed'] == 1
@@ -0,0 +1,61 @@
+import pytest
+
+from model_router import ModelRouter, RouteDecision
+from settings import DEFAULT_SETTINGS
+
+SETTINGS = {**DEFAULT_SETTINGS, 'max_response_tokens': 2000}
+
+def make_router(**kwargs):
+    return ModelRouter(fast_model='fast', strong_model='strong', fast_max_tokens=600,
+                       max_fast_chars=280, max_fast_history_tokens=4000, **kwargs)
+
+@pytest.mark.parametrize('text, is_admin, history_tokens, images, reasons', [
+    ('hi nebula, how are you?', False, 0, 0, ()),
+    ('x' * 280, False, 0, 0, ()),
+    ('x' * 281, False, 0, 0, ('long',)),
+    ('what does ```print(1)``` do', False, 0, 0, ('code',)),
+    ('please ban that spammer', True, 0, 0, ('admin',)),
+    ('please ban that spammer', False, 0, 0, ()),
+    ('who said that in chat history?', True, 0, 0, ('admin',)),
+    ('what is the weather in Paris', False, 0, 0, ('search',)),
+    ('any news about the release?', False, 0, 0, ('search',)),
+    ('concatenate these', False, 0, 0, ()),
+    ('thanks!', False, 4000, 0, ()),
+    ('thanks!', False, 4001, 0, ('history',)),
+    ('what is this', False, 0, 1, ('image',)),
+    ('search ```code``` ' + 'x' * 300, True, 5000, 2, ('image', 'long', 'code', 'search', 'history')),
+])
+def test_route(text, is_admin, history_tokens, images, reasons):
+    decision = make_router().route(text, is_admin, history_tokens, SETTINGS, images)
+    if reasons:
+        assert decision == RouteDecision('strong', 'strong', 2000, reasons)
+    else:
+        assert decision == RouteDecision('fast', 'fast', 600, ())
+
+def test_no_fast_model_always_uses_the_strong_model():
+    router = ModelRouter(fast_model=None, strong_model='strong')
+    assert not router.enabled
+    assert router.route('hi', False, 0, SETTINGS) == RouteDecision('strong', 'strong', 2000, ('disabled',))
+
+@pytest.mark.parametrize('overrides, expected', [
+    ({'model_routing': False}, RouteDecision('strong', 'strong', 2000, ('disabled',))),
+    ({'ai_model': 'guild-model'}, RouteDecision('fast', 'fast', 600, ())),
+    ({'max_response_tokens': 300}, RouteDecision('fast', 'fast', 300, ())),
+])
+def test_guild_settings(overrides, expected):
+    assert make_router().route('hi', False, 0, {**SETTINGS, **overrides}) == expected
+
+def test_guild_model_replaces_the_strong_model():
+    decision = make_router().route('x' * 500, False, 0, {**SETTINGS, 'ai_model': 'guild-model'})
+    assert decision.model == 'guild-model'
+
+def test_stats_average_per_route():
+    router = make_router()
+    fast = router.route('hi', False, 0, SETTINGS)
+    router.record(fast, 100.0, 50, 10)
+    router.record(fast, 300.0, 150, 30, failed=True)
+    
+    assert router.get_stats() == {'fast': {
+        'requests': 2, 'failures': 1, 'avg_latency_ms': 200.0,
+        'avg_prompt_tokens': 100, 'avg_completion_tokens': 20
+    }}
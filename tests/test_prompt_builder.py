@@ -0,0 +1,81 @@
+import json
+from types import SimpleNamespace
+
+from prompt_builder import PromptAssembler
+from storage import HistoryMessage
+
+KEY = ('guild', 'channel')
+
+def message(message_id: int) -> HistoryMessage:
+    return HistoryMessage(message_id, 'Alice', 'user', f'message {message_id}', '2026-01-01 00:00:00', 3)
+
+def history(first: int, last: int):
+    return [message(i) for i in range(first, last + 1)]
+
+def ids(window):
+    return [msg.id for msg in window]
+
+def test_short_history_is_sent_whole_and_anchored():
+    assembler = PromptAssembler(max_messages=10, block_size=4)
+    assert ids(assembler.select_window(KEY, history(1, 3))) == [1, 2, 3]
+    assert assembler.anchors[KEY] == 1
+    assert assembler.select_window(KEY, []) == []
+    assert KEY not in assembler.anchors
+
+def test_anchor_is_kept_while_the_window_grows():
+    assembler = PromptAssembler(max_messages=10, block_size=4)
+    assembler.select_window(KEY, history(1, 5))
+    
+    # The loaded history is the last 10 records; message 1 is still among them
+    for last in range(6, 11):
+        assert ids(assembler.select_window(KEY, history(max(1, last - 9), last)))[0] == 1
+    assert assembler.anchors[KEY] == 1
+
+def test_window_rolls_over_by_a_block_once_the_anchor_leaves_the_history():
+    assembler = PromptAssembler(max_messages=10, block_size=4)
+    assembler.select_window(KEY, history(1, 9))
+    
+    # Message 1 scrolled out: the oldest block of the full history is dropped
+    window = assembler.select_window(KEY, history(2, 11))
+    assert ids(window) == list(range(6, 12))
+    assert assembler.anchors[KEY] == 6
+    
+    # ...and the new anchor holds until it scrolls out too
+    assert ids(assembler.select_window(KEY, history(5, 14)))[0] == 6
+    assert ids(assembler.select_window(KEY, history(7, 16)))[0] == 11
+
+def test_per_guild_limit_caps_the_block_size():
+    assembler = PromptAssembler(max_messages=50, block_size=25)
+    window = assembler.select_window(KEY, history(1, 10), max_messages=10)
+    assert ids(window) == [10]
+
+def test_consecutive_turns_share_a_byte_identical_prefix():
+    assembler = PromptAssembler(max_messages=10, block_size=4)
+    first = assembler.build('You are Nebula.', assembler.select_window(KEY, history(1, 8)), 'Alice: first question')
+    # The first question and its answer are now part of the history
+    second = assembler.build('You are Nebula.', assembler.select_window(KEY, history(1, 10)), 'Alice: second question')
+    
+    prefix = json.dumps(first[:-1])
+    assert json.dumps(second).startswith(prefix[:-1])
+    assert second[0] == {'role': 'system', 'content': 'You are Nebula.'}
+    assert second[-1] == {'role': 'user', 'content': 'Alice: second question'}
+
+def test_forget_drops_anchors():
+    assembler = PromptAssembler(max_messages=10, block_size=4)
+    assembler.select_window(('g', 'a'), history(1, 3))
+    assembler.select_window(('g', 'b'), history(1, 3))
+    
+    assembler.forget(('g', 'a'))
+    assert list(assembler.anchors) == [('g', 'b')]
+    assembler.forget()
+    assert assembler.anchors == {}
+
+def test_record_usage_counts_cached_prompt_tokens():
+    assembler = PromptAssembler()
+    assembler.record_usage(SimpleNamespace(prompt_tokens=1000, prompt_tokens_details=SimpleNamespace(cached_tokens=768)))
+    assembler.record_usage(SimpleNamespace(prompt_tokens=1000, prompt_tokens_details=None))
+    assembler.record_usage(None)
+    
+    stats = assembler.get_stats()
+    assert (stats['requests'], stats['cache_hits'], stats['hit_rate']) == (2, 1, 50.0)
+    assert stats['cached_ratio'] == 38.4
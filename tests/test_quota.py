@@ -0,0 +1,156 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from cogs import quota_manager
+from memory_storage import MemoryStorage
+from quota import TokenBucket
+from settings import DEFAULT_SETTINGS
+
+def test_starts_full_and_refills_per_minute():
+    bucket = TokenBucket(60, updated=1000.0)
+    assert bucket.is_full()
+    assert bucket.wait_time(60, now=1000.0) == 0.0
+    
+    bucket.take(60)
+    assert bucket.wait_time(1, now=1000.0) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now=1000.5) == pytest.approx(0.5)
+    assert bucket.wait_time(1, now=1001.0) == 0.0
+    
+    # Refill stops at the capacity
+    bucket.refill(now=2000.0)
+    assert bucket.level == 60
+    assert bucket.is_full()
+
+def test_charge_can_go_into_debt():
+    bucket = TokenBucket(600, updated=0.0)
+    bucket.charge(1000, now=0.0)
+    assert bucket.level == -400
+    
+    # The debt is paid back before the next request: 401 tokens at 10/s
+    assert bucket.wait_time(1, now=0.0) == pytest.approx(40.1)
+    assert bucket.wait_time(1, now=40.1) == pytest.approx(0.0)
+
+def test_clock_going_backwards_is_ignored():
+    bucket = TokenBucket(60, level=0, updated=100.0)
+    bucket.refill(now=50.0)
+    assert bucket.level == 0
+    assert bucket.updated == 100.0
+
+def test_set_capacity_clamps_level():
+    bucket = TokenBucket(100)
+    bucket.set_capacity(10)
+    assert bucket.level == 10
+    assert bucket.rate == pytest.approx(10 / 60)
+    
+    bucket.take(10)
+    bucket.set_capacity(1000)
+    assert bucket.level < 1
+
+def make_message(user_id=3):
+    return SimpleNamespace(guild=SimpleNamespace(id=1), channel=SimpleNamespace(id=2), author=SimpleNamespace(id=user_id))
+
+def make_bot(**limits):
+    settings = {**DEFAULT_SETTINGS, **limits}
+    async def get_all(guild_id):
+        return settings
+    
+    settings_manager = SimpleNamespace(store=SimpleNamespace(get_all=get_all))
+    return SimpleNamespace(get_cog=lambda name: settings_manager if name == 'SettingsManager' else None)
+
+@pytest.fixture
+def db(monkeypatch):
+    db = MemoryStorage()
+    monkeypatch.setattr(quota_manager, 'get_storage', lambda: db)
+    return db
+
+def with_manager(bot, test, max_wait=1.0):
+    """Run `test(manager)` against a QuotaManager on a running event loop."""
+    async def run():
+        manager = quota_manager.QuotaManager(bot)
+        manager.max_wait = max_wait
+        await manager.cog_load()
+        try:
+            return await test(manager)
+        finally:
+            manager.persist_task.cancel()
+    return asyncio.run(run())
+
+def test_quotas_are_off_by_default(db):
+    async def test(manager):
+        for _ in range(100):
+            assert await manager.acquire(make_message()) == (True, 0.0)
+        await manager.record_tokens(make_message(), 10 ** 9)
+        assert manager.buckets == {}
+    with_manager(make_bot(), test)
+
+def test_empty_bucket_queues_within_max_wait(db):
+    async def test(manager):
+        message = make_message()
+        assert await manager.acquire(message) == (True, 0.0)
+        
+        # 600 per minute refills one request every 0.1 s
+        manager.buckets['user:1:3:requests'].level = 0
+        started = time.monotonic()
+        assert await manager.acquire(message) == (True, 0.0)
+        assert time.monotonic() - started >= 0.09
+        
+        # Other members have their own bucket
+        assert await manager.acquire(make_message(user_id=4)) == (True, 0.0)
+        return manager.get_metrics('1')
+    metrics = with_manager(make_bot(quota_user_requests=600), test)
+    assert metrics == {'allowed': 3, 'queued': 1, 'rejected': 0}
+
+def test_request_is_rejected_beyond_max_wait(db):
+    async def test(manager):
+        await manager.acquire(make_message())
+        manager.buckets['user:1:3:requests'].level = -100
+        started = time.monotonic()
+        allowed, retry_after = await manager.acquire(make_message())
+        assert time.monotonic() - started < 0.5
+        return allowed, retry_after, manager.get_metrics('1')
+    allowed, retry_after, metrics = with_manager(make_bot(quota_user_requests=600), test)
+    assert not allowed
+    assert retry_after == pytest.approx(10.1, abs=0.05)
+    assert metrics['rejected'] == 1
+
+def test_model_tokens_are_charged_after_the_reply(db):
+    async def test(manager):
+        message = make_message()
+        assert (await manager.acquire(message))[0]
+        await manager.record_tokens(message, 0)
+        assert manager.buckets['channel:1:2:tokens'].level == pytest.approx(600, abs=1)
+        
+        # A reply bigger than the bucket leaves it in debt; the next request waits ~40 s
+        await manager.record_tokens(message, 1000)
+        assert manager.buckets['user:1:3:tokens'].level == pytest.approx(-400, abs=1)
+        return await manager.acquire(message)
+    allowed, retry_after = with_manager(make_bot(quota_user_tokens=600, quota_channel_tokens=600), test)
+    assert not allowed
+    assert retry_after == pytest.approx(40, abs=0.5)
+
+def test_buckets_survive_a_restart(db):
+    bot = make_bot(quota_user_requests=60, quota_guild_requests=600)
+    
+    async def drain(manager):
+        for _ in range(10):
+            await manager.acquire(make_message())
+        manager.save_buckets()
+    with_manager(bot, drain)
+    assert sorted(row[0] for row in db.load_quota_buckets()) == ['guild:1:requests', 'user:1:3:requests']
+    
+    async def restored(manager):
+        return manager.buckets
+    buckets = with_manager(bot, restored)
+    assert buckets['user:1:3:requests'].level == pytest.approx(50, abs=0.5)
+    assert buckets['guild:1:requests'].capacity == 600
+    
+    # Buckets that have refilled completely are not persisted
+    async def refilled(manager):
+        for bucket in manager.buckets.values():
+            bucket.updated -= 3600
+        manager.save_buckets()
+    with_manager(bot, refilled)
+    assert db.load_quota_buckets() == []
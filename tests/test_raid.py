@@ -0,0 +1,109 @@
+from raid import RaidDetector, WindowCounter, content_key
+
+SETTINGS = {
+    'raid_join_limit': 3,
+    'spam_message_limit': 4,
+    'spam_duplicate_limit': 2
+}
+
+def test_window_counter_expires_one_bucket_at_a_time():
+    counter = WindowCounter(10, buckets=10, now=0.0)
+    assert counter.add(now=0.0) == 1
+    assert counter.add(now=0.5) == 2
+    assert counter.add(now=5.0) == 3
+
+    # The first bucket (0-1s) expires once the window has moved past it
+    assert counter.count(now=9.9) == 3
+    assert counter.count(now=10.0) == 1
+    assert counter.count(now=15.0) == 0
+    assert counter.expired(now=15.0)
+
+def test_window_counter_after_a_long_gap():
+    counter = WindowCounter(10, now=0.0)
+    for i in range(5):
+        counter.add(now=float(i))
+    assert counter.add(now=1000.0) == 1
+    assert sum(counter.counts) == counter.total == 1
+    assert not counter.expired(now=1000.0)
+
+def test_window_counter_ignores_clock_going_backwards():
+    counter = WindowCounter(10, now=100.0)
+    counter.add(now=100.0)
+    assert counter.add(now=50.0) == 2
+
+def test_content_key_normalizes_and_skips_short_text():
+    assert content_key('Buy   CHEAP stuff now') == content_key('buy cheap\nstuff now')
+    assert content_key('lol') is None
+    assert content_key('  gm gm   ') is None
+
+def test_join_raid_starts_and_ends():
+    detector = RaidDetector(join_window=60)
+    assert not detector.record_join('g', SETTINGS, now=0.0)
+    assert not detector.record_join('g', SETTINGS, now=1.0)
+    assert detector.record_join('g', SETTINGS, now=2.0)
+    assert detector.record_join('g', SETTINGS, now=3.0)
+    assert detector.stats['raids'] == 1
+    assert detector.in_raid('g', now=62.0)
+
+    # A full window below the limit ends it
+    assert not detector.in_raid('g', now=63.5)
+    assert not detector.record_join('g', SETTINGS, now=200.0)
+    assert not detector.in_raid('other', now=0.0)
+
+def test_zero_limits_disable_checks():
+    detector = RaidDetector()
+    off = {'raid_join_limit': 0, 'spam_message_limit': 0, 'spam_duplicate_limit': 0}
+    for i in range(50):
+        assert not detector.record_join('g', off, now=float(i) / 10)
+        assert detector.record_message('g', 'u', content_key('the same message'), off, now=float(i) / 10) is None
+
+def test_message_rate_spam():
+    detector = RaidDetector(message_window=10)
+    for i in range(4):
+        assert detector.record_message('g', 'u1', None, SETTINGS, now=float(i)) is None
+    assert detector.record_message('g', 'u1', None, SETTINGS, now=4.0) == 'rate'
+
+    # Another member and a later window are unaffected
+    assert detector.record_message('g', 'u2', None, SETTINGS, now=4.0) is None
+    assert detector.record_message('g', 'u1', None, SETTINGS, now=30.0) is None
+    assert detector.stats['rate_spam'] == 1
+
+def test_duplicate_spam_across_members():
+    detector = RaidDetector(duplicate_window=60)
+    key = content_key('FREE NITRO claim now')
+    assert detector.record_message('g', 'u1', key, SETTINGS, now=0.0) is None
+    assert detector.record_message('g', 'u2', key, SETTINGS, now=1.0) is None
+    assert detector.record_message('g', 'u3', key, SETTINGS, now=2.0) == 'duplicate'
+    assert detector.record_message('h', 'u3', key, SETTINGS, now=2.0) is None
+
+def test_rate_is_reported_over_duplicate():
+    detector = RaidDetector()
+    key = content_key('flooding the same text')
+    results = [detector.record_message('g', 'u', key, SETTINGS, now=i / 10) for i in range(5)]
+    assert results == [None, None, 'duplicate', 'duplicate', 'rate']
+
+def test_tracked_counters_stay_bounded():
+    detector = RaidDetector(message_window=10, duplicate_window=10, max_users=100, max_contents=50)
+    for i in range(10000):
+        detector.record_message('g', f'u{i}', content_key(f'message number {i}'), SETTINGS, now=i / 1000)
+    guild = detector.guilds['g']
+    assert len(guild.users) == 100
+    assert len(guild.contents) == 50
+
+    # Idle counters drain away as new events arrive
+    detector.record_message('g', 'late', content_key('a much later message'), SETTINGS, now=1000.0)
+    assert len(guild.users) == 1
+    assert len(guild.contents) == 1
+
+def test_alert_cooldown_per_kind():
+    detector = RaidDetector(alert_cooldown=60)
+    assert detector.should_alert('g', 'raid', now=0.0)
+    assert not detector.should_alert('g', 'raid', now=30.0)
+    assert detector.should_alert('g', 'rate', now=30.0)
+    assert detector.should_alert('g', 'raid', now=60.0)
+
+def test_guild_stats():
+    detector = RaidDetector()
+    detector.record_join('g', SETTINGS, now=0.0)
+    detector.record_message('g', 'u', content_key('hello everyone here'), SETTINGS, now=0.0)
+    assert detector.get_guild_stats('g', now=1.0) == {'joins': 1, 'raid': False, 'users': 1, 'contents': 1}
@@ -0,0 +1,168 @@
+import asyncio
+import threading
+
+import pytest
+
+from memory_storage import MemoryStorage
+from settings import DEFAULT_SETTINGS, SettingsStore, filter_tools, format_setting, parse_setting
+
+@pytest.mark.parametrize('name, raw, expected', [
+    ('answer_cache', 'true', True),
+    ('answer_cache', 'ON', True),
+    ('answer_cache', 'yes', True),
+    ('answer_cache', '1', True),
+    ('answer_cache', 'off', False),
+    ('answer_cache', 'No', False),
+    ('answer_cache', '0', False),
+    ('temperature', '0', 0.0),
+    ('temperature', '2', 2.0),
+    ('temperature', '0.35', 0.35),
+    ('context_messages', '1', 1),
+    ('context_messages', '200', 200),
+    ('quota_user_requests', '0', 0),
+    ('ai_model', 'gpt-4o-mini', 'gpt-4o-mini'),
+    ('enabled_tools', 'search_history, user_activity_check,,', ['search_history', 'user_activity_check']),
+    ('enabled_tools', ' , ', []),
+])
+def test_parse_setting(name, raw, expected):
+    assert parse_setting(name, raw) == expected
+
+@pytest.mark.parametrize('name, raw, error', [
+    ('no_such_setting', '1', 'Unknown setting: no_such_setting'),
+    ('answer_cache', 'maybe', 'answer_cache must be true or false'),
+    ('temperature', 'warm', 'temperature must be a float'),
+    ('context_messages', '1.5', 'context_messages must be an? int'),
+    ('temperature', '2.1', 'temperature must be at most 2.0'),
+    ('temperature', '-0.1', 'temperature must be at least 0.0'),
+    ('context_messages', '0', 'context_messages must be at least 1'),
+    ('context_messages', '201', 'context_messages must be at most 200'),
+    ('quota_user_requests', '-1', 'quota_user_requests must be at least 0'),
+])
+def test_parse_setting_rejects_bad_input(name, raw, error):
+    with pytest.raises(ValueError, match=error):
+        parse_setting(name, raw)
+
+def test_format_setting_and_filter_tools():
+    assert format_setting(None) == 'default'
+    assert format_setting([]) == 'none'
+    assert format_setting(['a', 'b']) == 'a, b'
+    assert format_setting(0.7) == '0.7'
+    
+    tools = [{'function': {'name': 'a'}}, {'function': {'name': 'b'}}]
+    assert filter_tools(tools, None) is tools
+    assert filter_tools(tools, ['b']) == [tools[1]]
+
+class CountingStorage(MemoryStorage):
+    """Counts server settings reads, to tell cache hits from database reads."""
+    
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+    
+    def get_server_settings(self, guild_id):
+        self.reads += 1
+        return super().get_server_settings(guild_id)
+
+def test_reads_are_cached_per_guild():
+    async def scenario():
+        db = CountingStorage()
+        store = SettingsStore(db)
+        
+        assert await store.get_all('g') == DEFAULT_SETTINGS
+        assert await store.get('g', 'temperature') == 0.7
+        await store.get_all('h')
+        assert db.reads == 2
+    
+    asyncio.run(scenario())
+
+def test_set_writes_through_and_invalidates():
+    async def scenario():
+        db = CountingStorage()
+        store = SettingsStore(db)
+        await store.get_all('g')
+        await store.get_all('h')
+        
+        await store.set('g', 'temperature', 1.2)
+        assert db.get_server_settings('g') == {'temperature': 1.2}
+        assert await store.get('g', 'temperature') == 1.2
+        assert store.get_version('g') == 1
+        
+        # Other guilds keep their cached entry and version
+        reads = db.reads
+        assert await store.get('h', 'temperature') == 0.7
+        assert db.reads == reads
+        assert store.get_version('h') == 0
+        
+        with pytest.raises(ValueError):
+            await store.set('g', 'no_such_setting', 1)
+        assert store.get_version('g') == 1
+    
+    asyncio.run(scenario())
+
+def test_reset_returns_to_default_and_bumps_version():
+    async def scenario():
+        store = SettingsStore(MemoryStorage())
+        await store.set('g', 'temperature', 1.2)
+        await store.set('g', 'answer_cache', True)
+        
+        await store.reset('g', 'temperature')
+        assert await store.get('g', 'temperature') == 0.7
+        assert await store.get('g', 'answer_cache') is True
+        assert store.get_version('g') == 3
+        
+        # Resetting an unchanged setting still bumps the version
+        await store.reset('g', 'temperature')
+        assert store.get_version('g') == 4
+    
+    asyncio.run(scenario())
+
+def test_unknown_stored_keys_are_ignored():
+    db = MemoryStorage()
+    db.update_server_settings('g', {'temperature': 0.1, 'removed_setting': 5})
+    settings = asyncio.run(SettingsStore(db).get_all('g'))
+    assert settings['temperature'] == 0.1
+    assert 'removed_setting' not in settings
+
+def test_clear_reloads_every_cached_guild():
+    async def scenario():
+        db = MemoryStorage()
+        store = SettingsStore(db)
+        await store.get_all('g')
+        
+        # Changed behind the cache's back, e.g. by a restore
+        db.update_server_settings('g', {'temperature': 0.2})
+        assert await store.get('g', 'temperature') == 0.7
+        store.clear()
+        assert await store.get('g', 'temperature') == 0.2
+        assert store.get_version('g') == 1
+    
+    asyncio.run(scenario())
+
+class SlowStorage(MemoryStorage):
+    """Settings reads that finish only when the test lets them."""
+    
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+    
+    def get_server_settings(self, guild_id):
+        self.release.wait(5)
+        return super().get_server_settings(guild_id)
+
+def test_read_racing_a_write_is_not_cached():
+    async def scenario():
+        db = SlowStorage()
+        store = SettingsStore(db)
+        read = asyncio.create_task(store.get_all('g'))
+        await asyncio.sleep(0.05)
+        
+        # A write lands while the read is in flight
+        db.update_server_settings('g', {'temperature': 1.5})
+        store.invalidate('g')
+        db.release.set()
+        await read
+        
+        assert 'g' not in store.cache
+        assert await store.get('g', 'temperature') == 1.5
+    
+    asyncio.run(scenario())
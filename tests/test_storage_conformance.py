@@ -0,0 +1,263 @@
+"""Behaviour every Storage backend must share.
+
+Each test runs against MemoryStorage, DatabaseManager (SQLite) and
+PostgresStorage. The PostgreSQL run needs asyncpg and a scratch database
+in POSTGRES_TEST_DSN; every table in its public schema is dropped first.
+"""
+import os
+import threading
+
+import pytest
+
+from database import DatabaseManager
+from memory_storage import MemoryStorage
+from postgres_storage import SCHEMA, PostgresStorage
+from storage import HistoryMessage, Storage, utc_cutoff, utc_now
+
+BACKENDS = ['memory', 'sqlite', 'postgres']
+
+@pytest.fixture(params=BACKENDS)
+def storage(request, tmp_path):
+    if request.param == 'memory':
+        yield MemoryStorage()
+    elif request.param == 'sqlite':
+        yield DatabaseManager(str(tmp_path / 'nebula.db'), str(tmp_path / 'nebula_archive.db'))
+    else:
+        dsn = os.getenv('POSTGRES_TEST_DSN')
+        if not dsn:
+            pytest.skip('POSTGRES_TEST_DSN is not set')
+        pytest.importorskip('asyncpg')
+
+        backend = PostgresStorage(dsn, max_size=4)
+        backend.execute('DROP SCHEMA public CASCADE; CREATE SCHEMA public')
+        backend.execute(SCHEMA)
+        yield backend
+        backend.close()
+
+def test_every_backend_implements_the_interface():
+    with pytest.raises(TypeError):
+        Storage()
+    for backend in (MemoryStorage, DatabaseManager, PostgresStorage):
+        assert issubclass(backend, Storage)
+        assert not backend.__abstractmethods__
+
+def test_history_round_trip(storage):
+    first = storage.add_message('g', 'c', 'u1', 'Alice', 'user', 'hello there', 3)
+    second = storage.add_message('g', 'c', 'bot', 'Nebula', 'assistant', 'hi Alice', 2)
+    storage.add_message('g', 'other', 'u1', 'Alice', 'user', 'elsewhere', 5)
+
+    assert isinstance(first, HistoryMessage)
+    assert second.id > first.id
+
+    history = storage.get_conversation_history('g', 'c')
+    assert history == [first, second]
+    assert storage.get_conversation_history('g', 'c', limit=1) == [second]
+    assert history[0].to_api_message() == {'role': 'user', 'content': '[Alice]: hello there'}
+    assert storage.get_total_tokens('g', 'c') == 5
+
+    storage.reset_conversation('g', 'c')
+    assert storage.get_conversation_history('g', 'c') == []
+    assert storage.get_total_tokens('g', 'c') == 0
+    assert [m.content for m in storage.get_conversation_history('g', 'other')] == ['elsewhere']
+
+def test_unknown_channel_is_empty(storage):
+    assert storage.get_conversation_history('g', 'missing') == []
+    assert storage.get_total_tokens('g', 'missing') == 0
+
+def test_archive_and_export(storage):
+    old = storage.add_message('g', 'c1', 'u1', 'Alice', 'user', 'old message about rockets', 4)
+    storage.add_message('g', 'c2', 'u2', 'Bob', 'user', 'other channel', 2)
+    storage.add_message('h', 'c1', 'u1', 'Alice', 'user', 'other guild', 2)
+
+    assert storage.archive_messages(guild_id='g', channel_id='c1') == 1
+    assert storage.get_conversation_history('g', 'c1') == []
+    new = storage.add_message('g', 'c1', 'u1', 'Alice', 'user', 'new message about rockets', 4)
+
+    stats = storage.get_archive_stats('g')
+    assert stats['hot_messages'] == 2
+    assert stats['archived_messages'] == 1
+    assert stats['oldest_archived'] == old.timestamp
+
+    exported = list(storage.iter_history_export('g', batch_size=1))
+    assert [(row['id'], row['archived']) for row in exported] == [
+        (old.id, True), (old.id + 1, False), (new.id, False)
+    ]
+    assert exported[0]['channel_id'] == 'c1'
+    assert exported[0]['content'] == 'old message about rockets'
+    assert exported[0]['token_count'] == 4
+
+    hot_only = list(storage.iter_history_export('g', channel_id='c1', include_archive=False))
+    assert [row['id'] for row in hot_only] == [new.id]
+
+    results = storage.search_history('g', 'rockets')
+    assert [(row['id'], row['archived']) for row in results] == [(new.id, False), (old.id, True)]
+    assert [row['id'] for row in storage.search_history('g', 'rockets', include_archive=False)] == [new.id]
+
+def test_archive_before_cutoff_keeps_newer_rows(storage):
+    storage.add_message('g', 'c', 'u', 'Alice', 'user', 'recent', 1)
+    assert storage.archive_messages(before=utc_cutoff(1)) == 0
+    assert len(storage.get_conversation_history('g', 'c')) == 1
+
+def test_search_filters(storage):
+    storage.add_message('g', 'c1', 'u1', 'Alice', 'user', 'Deploying the Bot tonight', 1)
+    storage.add_message('g', 'c1', 'u2', 'Bob', 'user', 'the bot is deploying now', 1)
+    storage.add_message('g', 'c2', 'u1', 'Alice', 'user', 'bot deploying in channel two', 1)
+    storage.add_message('g', 'c2', 'u1', 'Alice', 'user', 'unrelated', 1)
+    storage.add_message('h', 'c1', 'u1', 'Alice', 'user', 'bot deploying elsewhere', 1)
+
+    results = storage.search_history('g', 'BOT deploying')
+    assert [row['display_name'] for row in results] == ['Alice', 'Bob', 'Alice']
+    assert [row['channel_id'] for row in results] == ['c2', 'c1', 'c1']
+    assert 'bot' in results[0]['snippet'].lower()
+    assert set(results[0]) >= {'id', 'channel_id', 'user_id', 'display_name', 'role', 'snippet', 'timestamp', 'archived'}
+
+    assert len(storage.search_history('g', 'bot', user_id='u1')) == 2
+    assert len(storage.search_history('g', 'bot', channel_id='c1')) == 2
+    assert len(storage.search_history('g', 'bot', limit=1)) == 1
+    assert storage.search_history('g', 'bot', since=utc_cutoff(-1)) == []
+    assert len(storage.search_history('g', 'bot', until=utc_cutoff(-1))) == 3
+    assert storage.search_history('g', 'rocket') == []
+
+def test_search_matches_whole_words(storage):
+    storage.add_message('g', 'c1', 'u1', 'Alice', 'user', 'let me concatenate the strings', 1)
+    storage.add_message('g', 'c1', 'u2', 'Bob', 'user', 'My cat sleeps all day', 1)
+    storage.add_message('g', 'c1', 'u3', 'Carol', 'user', "don't wake the cat", 1)
+
+    def names(query):
+        return [row['display_name'] for row in storage.search_history('g', query)]
+
+    assert names('cat') == ['Carol', 'Bob']
+    assert names('CAT sleeps') == ['Bob']
+    assert names('concat') == []
+    assert names('concat*') == ['Alice']
+    assert names('str*') == ['Alice']
+    assert names("don't") == ['Carol']
+    assert names('the cat') == ['Carol']
+    assert names('*') == []
+
+def test_user_activity(storage):
+    today = utc_now()
+    long_ago = utc_cutoff(60)
+    storage.record_user_activity('g', 'c1', 'u1', 'Alice', 10, timestamp=long_ago)
+    storage.record_user_activity('g', 'c1', 'u1', 'Alice A.', 5, timestamp=today)
+    storage.record_user_activity('g', 'c2', 'u2', 'Bob', 1, timestamp=today)
+    storage.record_user_activity('g', 'c2', 'u2', 'Bob', 1, timestamp=today)
+    storage.record_user_activity('h', 'c1', 'u1', 'Alice', 1, timestamp=today)
+
+    activity = storage.get_user_activity('u1', 'g')
+    assert activity['display_name'] == 'Alice A.'
+    assert activity['first_seen'] == long_ago
+    assert activity['last_seen'] == today
+    assert activity['total_messages'] == 2
+    assert activity['messages_last_7_days'] == 1
+    assert activity['messages_last_30_days'] == 1
+    assert activity['messages_last_90_days'] == 2
+    assert activity['active_days_last_30_days'] == 1
+    assert activity['tokens_last_90_days'] == 15
+    assert storage.get_user_activity('u3', 'g') is None
+
+    top = storage.get_top_users('g', days=7)
+    assert [(row['user_id'], row['display_name'], row['messages'], row['tokens']) for row in top] == [
+        ('u2', 'Bob', 2, 2), ('u1', 'Alice A.', 1, 5)
+    ]
+    assert [row['user_id'] for row in storage.get_top_users('g', days=7, limit=1)] == ['u2']
+
+    # Both channels have two messages, so their order is unspecified
+    channels = sorted(storage.get_channel_activity('g', days=90), key=lambda row: row['channel_id'])
+    assert [(row['channel_id'], row['messages'], row['tokens'], row['active_days']) for row in channels] == [
+        ('c1', 2, 15, 2), ('c2', 2, 2, 1)
+    ]
+
+def test_admin_log_pages(storage):
+    for i in range(5):
+        storage.log_admin_action('g', 'a', 'Admin', 'action', f't{i}', f'Target {i}', f'details {i}')
+    storage.log_admin_action('h', 'a', 'Admin', 'action')
+
+    assert storage.count_admin_logs('g') == 5
+    newest = storage.get_admin_logs('g', limit=2)
+    assert [row['target_name'] for row in newest] == ['Target 4', 'Target 3']
+    assert set(newest[0]) >= {'id', 'admin_name', 'action_type', 'target_name', 'details', 'timestamp'}
+
+    older = storage.get_admin_logs('g', limit=2, before_id=newest[-1]['id'])
+    assert [row['target_name'] for row in older] == ['Target 2', 'Target 1']
+    newer = storage.get_admin_logs('g', limit=2, after_id=older[0]['id'])
+    assert newer == newest
+
+    logs = list(storage.iter_admin_logs('g', batch_size=2))
+    assert [row['target_id'] for row in logs] == [f't{i}' for i in range(5)]
+    assert logs[0]['admin_id'] == 'a'
+    assert list(storage.iter_admin_logs('g', since=utc_cutoff(-1))) == []
+
+def test_server_settings(storage):
+    assert storage.get_server_settings('g') == {}
+    storage.update_server_settings('g', {'max_tokens': 1000, 'answer_cache': True})
+    settings = storage.get_server_settings('g')
+    assert settings == {'max_tokens': 1000, 'answer_cache': True}
+
+    settings['max_tokens'] = 1
+    assert storage.get_server_settings('g')['max_tokens'] == 1000
+
+    storage.update_server_settings('g', {'max_tokens': 5})
+    assert storage.get_server_settings('g') == {'max_tokens': 5}
+
+def test_quota_buckets(storage):
+    assert storage.load_quota_buckets() == []
+    storage.save_quota_buckets([('user:1', 60.0, 30.5, 100.0), ('guild:2', 600.0, 0.0, 101.0)])
+    assert sorted(storage.load_quota_buckets()) == [('guild:2', 600.0, 0.0, 101.0), ('user:1', 60.0, 30.5, 100.0)]
+
+    storage.save_quota_buckets([('user:1', 60.0, 60.0, 200.0)])
+    assert storage.load_quota_buckets() == [('user:1', 60.0, 60.0, 200.0)]
+
+def test_routing_summary(storage):
+    storage.log_model_route('g', 'c', 'fast', 'small', 'short', 10, 100, 100.0, 50, 10, True)
+    storage.log_model_route('g', 'c', 'fast', 'small', 'short', 10, 100, 300.0, 70, 30, False)
+    storage.log_model_route('g', 'c', 'strong', 'large', 'long', 900, 2000, 900.0, 1000, 200, True)
+    storage.log_model_route('h', 'c', 'strong', 'large', 'long', 900, 2000, 900.0, 1000, 200, True)
+
+    summary = storage.get_routing_summary('g')
+    assert summary[0] == {
+        'route': 'fast', 'model': 'small', 'requests': 2, 'failures': 1,
+        'avg_latency_ms': 200.0, 'avg_prompt_tokens': 60, 'avg_completion_tokens': 20
+    }
+    assert [(row['route'], row['requests']) for row in summary] == [('fast', 2), ('strong', 1)]
+
+def test_usage_rollups(storage):
+    storage.record_usage('g', 'c', 'u', 'small', 100, 20, cached_tokens=50)
+    storage.record_usage('g', 'c', 'u', 'small', 10, 2, estimated=True)
+    storage.record_usage('g', 'c', 'u', 'large', 1000, 200)
+    storage.record_usage('g', 'c', 'u', None, 1, 1)
+    storage.record_usage('h', 'c', 'u', 'large', 1000, 200)
+
+    daily = storage.get_daily_usage('g')
+    assert len(daily) == 1
+    assert {key: daily[0][key] for key in (
+        'day', 'requests', 'prompt_tokens', 'completion_tokens', 'cached_tokens', 'estimated_requests'
+    )} == {
+        'day': utc_now()[:10], 'requests': 4, 'prompt_tokens': 1111, 'completion_tokens': 223,
+        'cached_tokens': 50, 'estimated_requests': 1
+    }
+
+    totals = storage.get_usage_totals('g')
+    assert [(row['model'], row['requests'], row['prompt_tokens'], row['completion_tokens'], row['cached_tokens'])
+            for row in totals] == [('large', 1, 1000, 200, 0), ('small', 2, 110, 22, 50), ('unknown', 1, 1, 1, 0)]
+    assert totals[0]['first_day'] == utc_now()[:10]
+
+def test_concurrent_writers(storage):
+    # Cogs call storage from several threads at once through asyncio.to_thread
+    def write(thread: int):
+        for i in range(25):
+            storage.add_message('g', f'c{thread % 2}', f'u{thread}', 'User', 'user', f'message {i}', 1)
+            storage.record_user_activity('g', f'c{thread % 2}', f'u{thread}', 'User', 1)
+            storage.log_admin_action('g', 'a', 'Admin', 'action')
+
+    threads = [threading.Thread(target=write, args=(thread,)) for thread in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    history = storage.get_conversation_history('g', 'c0', limit=1000) + storage.get_conversation_history('g', 'c1', limit=1000)
+    assert len(history) == 200
+    assert len({message.id for message in history}) == 200
+    assert storage.count_admin_logs('g') == 200
+    assert sum(row['messages'] for row in storage.get_top_users('g', limit=100)) == 200
@@ -0,0 +1,137 @@
+import asyncio
+import time
+
+import pytest
+
+from worker_pool import WorkerLost, WorkerPool, WorkerPoolBusy
+
+class FakeQueue:
+    def __init__(self):
+        self.items = []
+    
+    def put(self, item):
+        self.items.append(item)
+
+class FakeProcess:
+    def __init__(self):
+        self.alive = True
+        self.exitcode = None
+        self.killed = False
+        self.pid = 1234
+    
+    def is_alive(self):
+        return self.alive
+    
+    def kill(self):
+        self.killed = True
+        self.alive = False
+        self.exitcode = -9
+    
+    def join(self, timeout=None):
+        pass
+
+def make_pool(workers=3, **kwargs):
+    """A pool whose workers are fake processes with inspectable job queues."""
+    pool = WorkerPool(workers, **kwargs)
+    pool.started = []
+    
+    def start_process(worker_id):
+        pool.started.append(worker_id)
+        return FakeQueue(), FakeProcess()
+    
+    pool.start_process = start_process
+    for worker_id in range(workers):
+        pool.spawn(worker_id)
+    return pool
+
+def job(channel_id):
+    return {'channel_id': str(channel_id), 'content': 'hi'}
+
+def test_channel_is_pinned_to_one_worker():
+    async def scenario():
+        pool = make_pool()
+        tasks = [asyncio.create_task(pool.submit(job(channel))) for channel in (7, 7, 8, 10)]
+        await asyncio.sleep(0)
+        
+        queued = [[item[2]['channel_id'] for item in queue.items] for queue in pool.queues]
+        assert queued == [[], ['7', '7', '10'], ['8']]
+        
+        # Results come back through the shared queue, matched by job id
+        reader = asyncio.create_task(pool.read_results())
+        for worker_id, queue in enumerate(pool.queues):
+            for _, job_id, submitted in queue.items:
+                pool.results.put(('result', worker_id, job_id, {'reply': submitted['channel_id']}))
+        replies = await asyncio.wait_for(asyncio.gather(*tasks), 5)
+        pool.results.put(('stopped',))
+        await reader
+        
+        assert [reply['reply'] for reply in replies] == ['7', '7', '8', '10']
+        assert (pool.stats['submitted'], pool.stats['completed']) == (4, 4)
+    
+    asyncio.run(scenario())
+
+def test_full_worker_turns_jobs_away():
+    async def scenario():
+        pool = make_pool(max_pending=2)
+        tasks = [asyncio.create_task(pool.submit(job(1))) for _ in range(2)]
+        await asyncio.sleep(0)
+        
+        with pytest.raises(WorkerPoolBusy):
+            await pool.submit(job(4))
+        # Other workers still accept jobs
+        other = asyncio.create_task(pool.submit(job(2)))
+        await asyncio.sleep(0)
+        assert pool.stats['rejected'] == 1
+        assert len(pool.pending[2]) == 1
+        
+        for task in tasks + [other]:
+            task.cancel()
+    
+    asyncio.run(scenario())
+
+def test_dead_worker_fails_its_jobs_and_is_restarted():
+    async def scenario():
+        pool = make_pool()
+        crashed = pool.processes[1]
+        lost = asyncio.create_task(pool.submit(job(1)))
+        kept = asyncio.create_task(pool.submit(job(2)))
+        await asyncio.sleep(0)
+        
+        crashed.alive = False
+        crashed.exitcode = 1
+        assert await pool.check_health() == [1]
+        
+        with pytest.raises(WorkerLost, match='exited with code 1'):
+            await lost
+        assert not kept.done()
+        assert pool.processes[1] is not crashed
+        assert pool.started == [0, 1, 2, 1]
+        assert (pool.stats['lost'], pool.stats['restarts']) == (1, 1)
+        
+        # The restarted worker takes new jobs on its new queue
+        again = asyncio.create_task(pool.submit(job(4)))
+        await asyncio.sleep(0)
+        assert len(pool.queues[1].items) == 1
+        
+        for task in (kept, again):
+            task.cancel()
+    
+    asyncio.run(scenario())
+
+def test_silent_worker_is_killed_and_restarted():
+    async def scenario():
+        pool = make_pool(stale_after=30.0)
+        silent = pool.processes[0]
+        lost = asyncio.create_task(pool.submit(job(3)))
+        await asyncio.sleep(0)
+        
+        assert await pool.check_health() == []
+        pool.last_seen[0] = time.monotonic() - 31
+        assert await pool.check_health() == [0]
+        
+        assert silent.killed
+        with pytest.raises(WorkerLost, match='no heartbeat'):
+            await lost
+        assert pool.get_stats()['workers'][0]['alive']
+    
+    asyncio.run(scenario())
@@ -0,0 +1,280 @@
+import asyncio
+import multiprocessing
+import time
+from typing import Dict, List, Optional, Tuple
+
+class WorkerPoolBusy(Exception):
+    """Raised when a worker already has its maximum number of pending jobs."""
+    pass
+
+class WorkerLost(Exception):
+    """Raised for the pending jobs of a worker process that died or stopped responding."""
+    pass
+
+def run_worker(worker_id: int, jobs, results, concurrency: int, heartbeat_interval: float):
+    """Entry point of a worker process."""
+    asyncio.run(serve(worker_id, jobs, results, concurrency, heartbeat_interval))
+
+async def serve(worker_id: int, jobs, results, concurrency: int, heartbeat_interval: float):
+    """Run jobs from the gateway through AIHandler.generate() until told to stop.
+    
+    The worker builds its own AIHandler and MemoryManager without a bot;
+    generate() only uses their Discord-free parts (history, prompt,
+    routing, model call, storage). Up to `concurrency` jobs run at once,
+    since most of a job's time is spent waiting for the model.
+    """
+    # Imported here: the cogs import this module for its exceptions
+    from cogs.ai_handler import AIHandler
+    from cogs.memory_manager import MemoryManager
+    
+    memory_manager = MemoryManager(None)
+    handler = AIHandler(None)
+    handler.memory_manager = memory_manager
+    memory_manager.context_cache.on_drop = handler.prompt_assembler.forget
+    
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(concurrency)
+    stats = {'jobs': 0, 'errors': 0, 'active': 0}
+    
+    async def run(job_id: int, job: Dict):
+        stats['active'] += 1
+        try:
+            result = await handler.generate(job)
+            results.put(('result', worker_id, job_id, result))
+        except Exception as e:
+            stats['errors'] += 1
+            results.put(('error', worker_id, job_id, str(e)))
+        finally:
+            stats['jobs'] += 1
+            stats['active'] -= 1
+            slots.release()
+    
+    async def heartbeat():
+        while True:
+            results.put(('heartbeat', worker_id, {
+                **stats,
+                'prompt': handler.prompt_assembler.get_stats(),
+                'cache': memory_manager.context_cache.get_stats()
+            }))
+            await asyncio.sleep(heartbeat_interval)
+    
+    heartbeat_task = asyncio.create_task(heartbeat())
+    print(f"Worker {worker_id} ready")
+    
+    while True:
+        # Stop reading jobs while all slots are busy; the backlog stays in
+        # the queue and the gateway counts it as pending
+        await slots.acquire()
+        item = await loop.run_in_executor(None, jobs.get)
+        
+        if item[0] == 'stop':
+            break
+        if item[0] == 'invalidate':
+            if item[1] is None:
+                memory_manager.context_cache.clear()
+            else:
+                memory_manager.context_cache.invalidate(item[1])
+            slots.release()
+            continue
+        
+        asyncio.create_task(run(item[1], item[2]))
+    
+    heartbeat_task.cancel()
+
+class WorkerPool:
+    """Runs the model half of message processing in worker processes.
+    
+    Each channel is pinned to one worker (channel id modulo the pool size),
+    so its messages are handled in order and the worker's context cache
+    sees every write to that channel. A worker accepts at most
+    `max_pending` jobs; beyond that submit() raises WorkerPoolBusy instead
+    of queueing without bound. Workers send a heartbeat every
+    `heartbeat_interval` seconds; check_health() restarts a worker that
+    exited or has been silent for `stale_after` seconds and fails its
+    pending jobs with WorkerLost.
+    """
+    
+    def __init__(self, workers: int, max_pending: int = 32, concurrency: int = 16,
+                 heartbeat_interval: float = 5.0, stale_after: float = 30.0):
+        # Spawn rather than fork: the gateway process has a running event
+        # loop and open sockets that must not be copied
+        self.context = multiprocessing.get_context('spawn')
+        self.size = workers
+        self.max_pending = max_pending
+        self.concurrency = concurrency
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        
+        self.results = self.context.Queue()
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self.queues = [None] * workers
+        self.pending: List[Dict[int, asyncio.Future]] = [{} for _ in range(workers)]
+        self.last_seen = [0.0] * workers
+        self.worker_stats: List[Dict] = [{} for _ in range(workers)]
+        
+        self.next_job_id = 0
+        self.reader = None
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'rejected': 0,
+            'lost': 0,
+            'restarts': 0
+        }
+    
+    def start(self):
+        """Start the worker processes and the result reader. Call from the event loop."""
+        for worker_id in range(self.size):
+            self.spawn(worker_id)
+        self.reader = asyncio.create_task(self.read_results())
+    
+    def start_process(self, worker_id: int) -> Tuple[multiprocessing.Queue, multiprocessing.Process]:
+        """Start a worker process with a new job queue. Blocks; safe to call from a thread."""
+        jobs = self.context.Queue()
+        process = self.context.Process(
+            target=run_worker,
+            args=(worker_id, jobs, self.results, self.concurrency, self.heartbeat_interval),
+            name=f"nebula-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        return jobs, process
+    
+    def spawn(self, worker_id: int):
+        self.attach(worker_id, *self.start_process(worker_id))
+    
+    def attach(self, worker_id: int, jobs: multiprocessing.Queue, process: multiprocessing.Process):
+        self.queues[worker_id] = jobs
+        self.processes[worker_id] = process
+        # Start-up time counts towards the first heartbeat
+        self.last_seen[worker_id] = time.monotonic()
+        self.worker_stats[worker_id] = {}
+    
+    def worker_for(self, channel_id: str) -> int:
+        return int(channel_id) % self.size
+    
+    async def submit(self, job: Dict) -> Dict:
+        """Run a job in its channel's worker and wait for the result."""
+        worker_id = self.worker_for(job['channel_id'])
+        pending = self.pending[worker_id]
+        if len(pending) >= self.max_pending:
+            self.stats['rejected'] += 1
+            raise WorkerPoolBusy(f"Worker {worker_id} has {len(pending)} pending jobs")
+        
+        self.next_job_id += 1
+        job_id = self.next_job_id
+        future = asyncio.get_running_loop().create_future()
+        pending[job_id] = future
+        
+        self.queues[worker_id].put(('job', job_id, job))
+        self.stats['submitted'] += 1
+        return await future
+    
+    def invalidate(self, key: Optional[Tuple[str, str]] = None):
+        """Drop a channel's cached window in its worker, or every window in all workers."""
+        if key is None:
+            for jobs in self.queues:
+                jobs.put(('invalidate', None))
+        else:
+            self.queues[self.worker_for(key[1])].put(('invalidate', key))
+    
+    async def read_results(self):
+        """Resolve pending jobs from the shared result queue."""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await loop.run_in_executor(None, self.results.get)
+            if item[0] == 'stopped':
+                return
+            
+            worker_id = item[1]
+            self.last_seen[worker_id] = time.monotonic()
+            if item[0] == 'heartbeat':
+                self.worker_stats[worker_id] = item[2]
+                continue
+            
+            future = self.pending[worker_id].pop(item[2], None)
+            if future is None or future.done():
+                continue
+            self.stats['completed'] += 1
+            if item[0] == 'result':
+                future.set_result(item[3])
+            else:
+                future.set_exception(RuntimeError(item[3]))
+    
+    def fail_pending(self, worker_id: int, reason: str):
+        pending = self.pending[worker_id]
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(WorkerLost(reason))
+        self.stats['lost'] += len(pending)
+        pending.clear()
+    
+    async def check_health(self) -> List[int]:
+        """Restart workers that exited or stopped sending heartbeats. Returns their ids.
+        
+        Killing, joining and starting processes blocks, so it runs in a
+        thread. Jobs submitted to the old queue meanwhile are failed with
+        the rest of the worker's pending jobs.
+        """
+        restarted = []
+        now = time.monotonic()
+        for worker_id, process in enumerate(self.processes):
+            silent = now - self.last_seen[worker_id]
+            if process.is_alive() and silent < self.stale_after:
+                continue
+            
+            if process.is_alive():
+                reason = f"worker {worker_id} sent no heartbeat for {silent:.0f}s"
+            else:
+                reason = f"worker {worker_id} exited with code {process.exitcode}"
+            print(f"Restarting {reason}")
+            
+            def restart():
+                if process.is_alive():
+                    process.kill()
+                process.join(1)
+                return self.start_process(worker_id)
+            
+            self.attach(worker_id, *await asyncio.to_thread(restart))
+            self.fail_pending(worker_id, reason)
+            self.stats['restarts'] += 1
+            restarted.append(worker_id)
+        return restarted
+    
+    async def stop(self):
+        """Stop the workers, failing any jobs that are still pending."""
+        for jobs in self.queues:
+            jobs.put(('stop',))
+        
+        def join():
+            for process in self.processes:
+                process.join(5)
+                if process.is_alive():
+                    process.kill()
+        
+        await asyncio.to_thread(join)
+        for worker_id in range(self.size):
+            self.fail_pending(worker_id, "worker pool stopped")
+        self.results.put(('stopped',))
+    
+    def get_stats(self) -> Dict:
+        """Get pool counters and the state of each worker."""
+        now = time.monotonic()
+        workers = []
+        for worker_id, process in enumerate(self.processes):
+            stats = self.worker_stats[worker_id]
+            workers.append({
+                'pid': process.pid,
+                'alive': process.is_alive(),
+                'pending': len(self.pending[worker_id]),
+                'heartbeat_age': now - self.last_seen[worker_id],
+                'jobs': stats.get('jobs', 0),
+                'errors': stats.get('errors', 0),
+                'prompt': stats.get('prompt'),
+                'cache': stats.get('cache')
+            })
+        return {
+            **self.stats,
+            'pending': sum(len(pending) for pending in self.pending),
+            'workers': workers
+        }